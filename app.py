@@ -1,5 +1,7 @@
 import streamlit as st
 
+from feedback_app.interactiveAgent import warm_llm_client
+
 # Hide the sidebar navigation
 st.set_page_config(page_title="Learn with Piccolo", layout="wide")
 hide_sidebar = """
@@ -11,6 +13,9 @@ hide_sidebar = """
 """
 st.markdown(hide_sidebar, unsafe_allow_html=True)
 
+# Open the shared LLM connection pool while participants read the landing and consent pages
+warm_llm_client()
+
 # Landing logic
 st.title("Welcome to the AI Tutoring Study")
 
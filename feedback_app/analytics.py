@@ -0,0 +1,238 @@
+# analytics.py
+#
+# Offline analytics over study results. Reads exported sheets (CSV of
+# flatten_session_log rows), the local session event store and
+# rubric_feedback_log.json in chunks, decodes the JSON-encoded task columns once
+# per chunk into long columnar frames, and folds vectorized group-by results into
+# running aggregates, so memory stays bounded by the chunk size.
+#
+#     python -m feedback_app.analytics --sheets export.csv --events session_events \
+#         --rubric-log rubric_feedback_log.json --out analytics_out
+
+import argparse
+import json
+import os
+import re
+
+import pandas as pd
+
+from feedback_app.dataset import problem_key
+
+TASK_COLUMN = re.compile(r"^task_(\d+)_(.+)$")
+RUBRIC_FIELDS = {"initial_rubrics": "initial", "rubrics": "final"}
+
+
+# ----------- INPUTS -----------
+
+def iter_sheet_chunks(paths, chunksize):
+    for path in paths:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=str, keep_default_na=False)
+
+
+def iter_event_store_chunks(events_dir, chunksize):
+    # Sessions are materialized one at a time from the indexed store
+    from feedback_app.log_store import LogStore
+    from feedback_app.session_log import flatten_session_log, materialize_session
+
+    store = LogStore(events_dir, "events")
+    rows = []
+    for student_id in store.keys():
+        rows.append(flatten_session_log(materialize_session(store.get(student_id), student_id)))
+        if len(rows) >= chunksize:
+            yield pd.DataFrame(rows, dtype=str)
+            rows = []
+    if rows:
+        yield pd.DataFrame(rows, dtype=str)
+    store.close()
+
+
+def to_task_frame(chunk):
+    """Wide sheet rows -> one row per (student_id, task) with the task_N_ prefix stripped."""
+    task_cols = [c for c in chunk.columns if TASK_COLUMN.match(c)]
+    long = chunk.melt(id_vars=["student_id"], value_vars=task_cols, var_name="column")
+    parts = long["column"].str.extract(TASK_COLUMN)
+    long["task"] = parts[0].astype(int)
+    long["field"] = parts[1]
+    tasks = long.pivot(index=["student_id", "task"], columns="field", values="value").reset_index()
+    tasks = tasks[tasks["problem"].fillna("").str.strip() != ""]
+    tasks["problem_id"] = tasks["problem"].map(problem_key)
+    return tasks
+
+
+def _decode_json(series):
+    return series.fillna("").map(lambda v: json.loads(v) if v else None)
+
+
+def rubric_frame(tasks):
+    """(problem_id, phase, rubric, score) rows for both rubric phases."""
+    frames = []
+    for field, phase in RUBRIC_FIELDS.items():
+        if field not in tasks:
+            continue
+        decoded = _decode_json(tasks[field])
+        decoded = decoded[decoded.map(bool)]
+        if decoded.empty:
+            continue
+        scores = pd.DataFrame.from_records(decoded.tolist(), index=decoded.index)
+        scores["problem_id"] = tasks.loc[decoded.index, "problem_id"]
+        long = scores.melt(id_vars="problem_id", var_name="rubric", value_name="score").dropna()
+        long["phase"] = phase
+        frames.append(long)
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["problem_id", "rubric", "score", "phase"])
+
+
+def message_frame(tasks):
+    """(student_id, task, problem_id, who, length) rows, one per chat message."""
+    decoded = _decode_json(tasks["messages"]) if "messages" in tasks else pd.Series(dtype=object)
+    exploded = decoded.explode().dropna()
+    if exploded.empty:
+        return pd.DataFrame(columns=["student_id", "task", "problem_id", "who", "length"])
+    frame = tasks.loc[exploded.index, ["student_id", "task", "problem_id"]].copy()
+    frame["who"] = exploded.str.get("who").values
+    frame["length"] = exploded.str.get("text").fillna("").str.len().values
+    return frame
+
+
+# ----------- RUNNING AGGREGATES -----------
+
+def _accumulate(total, counts):
+    return counts if total is None else total.add(counts, fill_value=0)
+
+
+class Aggregates:
+    def __init__(self):
+        self.sessions = 0
+        self.problem_labels = {}
+        self.rubric_counts = None
+        self.turn_counts = None
+        self.reply_lengths = None
+
+    def add_tasks(self, tasks):
+        self.sessions += tasks["student_id"].nunique()
+        labels = tasks.drop_duplicates("problem_id").set_index("problem_id")["problem"].str.strip().str[:60]
+        self.problem_labels.update(labels.to_dict())
+
+        rubrics = rubric_frame(tasks)
+        self.add_rubrics(rubrics)
+
+        messages = message_frame(tasks)
+        turns = (
+            messages[messages["who"] == "Student"]
+            .groupby(["student_id", "task", "problem_id"]).size()
+            .reindex(pd.MultiIndex.from_frame(tasks[["student_id", "task", "problem_id"]]), fill_value=0)
+        )
+        counts = turns.groupby([turns.index.get_level_values("problem_id"), turns.values]).size()
+        counts.index.names = ["problem_id", "student_turns"]
+        self.turn_counts = _accumulate(self.turn_counts, counts)
+
+        stats = messages.groupby(["problem_id", "who"])["length"].agg(["count", "sum", "min", "max"])
+        if self.reply_lengths is None:
+            self.reply_lengths = stats
+        else:
+            combined = self.reply_lengths.align(stats, join="outer")
+            old, new = combined[0], combined[1]
+            self.reply_lengths = pd.DataFrame({
+                "count": old["count"].add(new["count"], fill_value=0),
+                "sum": old["sum"].add(new["sum"], fill_value=0),
+                "min": old["min"].combine(new["min"], min, fill_value=float("inf")),
+                "max": old["max"].combine(new["max"], max, fill_value=0),
+            })
+
+    def add_rubrics(self, rubrics):
+        if rubrics.empty:
+            return
+        rubrics = rubrics.assign(score=pd.to_numeric(rubrics["score"], errors="coerce")).dropna(subset=["score"])
+        counts = rubrics.groupby(["phase", "problem_id", "rubric", "score"]).size()
+        self.rubric_counts = _accumulate(self.rubric_counts, counts)
+
+    # ----------- REPORTS -----------
+
+    def rubric_distribution(self):
+        """Share of each score per (phase, problem, rubric)."""
+        counts = self.rubric_counts
+        if counts is None:
+            return pd.DataFrame()
+        table = counts.unstack("score", fill_value=0)
+        return table.div(table.sum(axis=1), axis=0).round(3)
+
+    def rubric_summary(self):
+        """Mean score and number of ratings per (phase, problem, rubric)."""
+        counts = self.rubric_counts
+        if counts is None:
+            return pd.DataFrame()
+        scores = counts.index.get_level_values("score").astype(float)
+        weighted = (counts * scores).groupby(level=["phase", "problem_id", "rubric"]).sum()
+        n = counts.groupby(level=["phase", "problem_id", "rubric"]).sum()
+        return pd.DataFrame({"n": n.astype(int), "mean": (weighted / n).round(2)})
+
+    def turn_distribution(self):
+        if self.turn_counts is None:
+            return pd.DataFrame()
+        return self.turn_counts.astype(int).unstack("student_turns", fill_value=0)
+
+    def reply_length_summary(self):
+        if self.reply_lengths is None or self.reply_lengths.empty:
+            return pd.DataFrame()
+        summary = self.reply_lengths.copy()
+        summary["mean"] = (summary["sum"] / summary["count"]).round(1)
+        return summary.drop(columns="sum").astype({"count": int})
+
+
+def add_rubric_log(aggregates, path, chunksize):
+    # rubric_feedback_log.json holds one {"problem", "rubrics", "timestamp"} object per line
+    for chunk in pd.read_json(path, lines=True, chunksize=chunksize):
+        chunk = chunk[chunk["problem"].fillna("").str.strip() != ""]
+        if chunk.empty:
+            continue
+        scores = pd.DataFrame.from_records(chunk["rubrics"].tolist(), index=chunk.index)
+        scores["problem_id"] = chunk["problem"].map(problem_key)
+        long = scores.melt(id_vars="problem_id", var_name="rubric", value_name="score").dropna()
+        long["phase"] = "rubric_log"
+        aggregates.add_rubrics(long)
+        labels = chunk.assign(problem_id=scores["problem_id"]).drop_duplicates("problem_id")
+        aggregates.problem_labels.update(labels.set_index("problem_id")["problem"].str.strip().str[:60].to_dict())
+
+
+def run(sheets=(), events_dir=None, rubric_log=None, chunksize=5000):
+    aggregates = Aggregates()
+    chunks = iter_sheet_chunks(sheets, chunksize)
+    if events_dir:
+        chunks = (c for it in (chunks, iter_event_store_chunks(events_dir, chunksize)) for c in it)
+    for chunk in chunks:
+        if "student_id" in chunk and any(TASK_COLUMN.match(c) for c in chunk.columns):
+            aggregates.add_tasks(to_task_frame(chunk))
+    if rubric_log:
+        add_rubric_log(aggregates, rubric_log, chunksize)
+    return aggregates
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rubric, turn-count and reply-length analytics over study results.")
+    parser.add_argument("--sheets", nargs="*", default=[], help="CSV exports of the results sheet")
+    parser.add_argument("--events", help="session event store directory (e.g. session_events)")
+    parser.add_argument("--rubric-log", help="rubric_feedback_log.json (JSON lines)")
+    parser.add_argument("--chunksize", type=int, default=5000)
+    parser.add_argument("--out", help="directory for CSV reports; printed to stdout if omitted")
+    args = parser.parse_args()
+
+    aggregates = run(args.sheets, args.events, args.rubric_log, args.chunksize)
+    reports = {
+        "problems": pd.Series(aggregates.problem_labels, name="problem").rename_axis("problem_id").to_frame(),
+        "rubric_summary": aggregates.rubric_summary(),
+        "rubric_distribution": aggregates.rubric_distribution(),
+        "turn_distribution": aggregates.turn_distribution(),
+        "reply_lengths": aggregates.reply_length_summary(),
+    }
+
+    print(f"Sessions: {aggregates.sessions}")
+    for name, frame in reports.items():
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            frame.to_csv(os.path.join(args.out, f"{name}.csv"))
+        else:
+            print(f"\n=== {name} ===")
+            print(frame.to_string() if not frame.empty else "(no data)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+# background.py
+#
+# Bounded thread pool shared by every Streamlit session in the process, so logging,
+# Sheets saves, follow-up grading and dialogue summaries never block the script
+# thread. Submissions beyond the queue depth wait (backpressure) and finally raise
+# QueueFull; each task returns a TaskHandle the page can poll to show "saving…" /
+# "grading…". Queued work is drained when the interpreter shuts down.
+
+import atexit
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Named task types; the label is what the page shows while the task is running
+TASK_LABELS = {
+    "log": "saving log…",
+    "sheets_save": "saving…",
+    "grading": "grading…",
+    "summary": "summarizing…",
+}
+
+MAX_WORKERS = int(os.getenv("BACKGROUND_WORKERS", "8"))
+MAX_QUEUE_DEPTH = int(os.getenv("BACKGROUND_QUEUE_DEPTH", "200"))
+
+
+class QueueFull(Exception):
+    pass
+
+
+class TaskHandle:
+    def __init__(self, task_type, future):
+        self.task_type = task_type
+        self.label = TASK_LABELS.get(task_type, task_type)
+        self.submitted_at = time.time()
+        self._future = future
+
+    @property
+    def status(self):
+        if self._future.running():
+            return "running"
+        if not self._future.done():
+            return "queued"
+        return "failed" if self._future.exception() is not None else "done"
+
+    def done(self):
+        return self._future.done()
+
+    def result(self, timeout=None):
+        return self._future.result(timeout)
+
+    def error(self):
+        return self._future.exception() if self._future.done() else None
+
+
+class BackgroundExecutor:
+    def __init__(self, max_workers=MAX_WORKERS, max_queue_depth=MAX_QUEUE_DEPTH):
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="feedback-bg")
+        # Counts queued + running tasks; acquiring a slot is where backpressure happens
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue_depth)
+        self._counts_lock = threading.Lock()
+        self.counts = {}
+
+    def submit(self, task_type, fn, *args, block_timeout=5.0, **kwargs):
+        if not self._slots.acquire(timeout=block_timeout):
+            raise QueueFull(f"background queue full, could not schedule {task_type}")
+        with self._counts_lock:
+            self.counts[task_type] = self.counts.get(task_type, 0) + 1
+        try:
+            # Run in a copy of the caller's context so e.g. the metrics task label follows the work
+            future = self._pool.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except Exception:
+            self._release(task_type)
+            raise
+        future.add_done_callback(lambda _: self._release(task_type))
+        return TaskHandle(task_type, future)
+
+    def in_flight(self, task_type=None):
+        with self._counts_lock:
+            if task_type is None:
+                return sum(self.counts.values())
+            return self.counts.get(task_type, 0)
+
+    def shutdown(self, wait=True):
+        self._pool.shutdown(wait=wait)
+
+    def _release(self, task_type):
+        with self._counts_lock:
+            self.counts[task_type] -= 1
+        self._slots.release()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = BackgroundExecutor()
+            atexit.register(_executor.shutdown, wait=True)
+        return _executor
+
+
+def run_in_background(task_type, fn, *args, **kwargs):
+    return get_executor().submit(task_type, fn, *args, **kwargs)
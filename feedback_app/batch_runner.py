@@ -0,0 +1,276 @@
+# batch_runner.py
+#
+# Offline prompt vetting over the whole problem bank. `emit` writes one request per
+# (problem, synthetic attempt) as JSON lines; `run` executes a request file against
+# the chat API with bounded asyncio concurrency and a token-bucket rate limit,
+# appends results to an output JSONL and checkpoints completed ids next to it, so a
+# killed run picks up where it stopped.
+#
+#     python -m feedback_app.batch_runner emit --out batch/requests.jsonl
+#     python -m feedback_app.batch_runner run batch/requests.jsonl --out batch/results.jsonl \
+#         --concurrency 16 --rps 5
+#     python -m feedback_app.batch_runner run batch/requests.jsonl --out batch/results.jsonl --mock
+#
+# Requests go straight to the model (no response cache, no hint bank) so every run
+# reflects the current prompts.
+
+import argparse
+import asyncio
+import json
+import os
+import re
+import time
+
+from feedback_app.dataset import CSV_PATH, load_problems, problem_key
+from feedback_app.interactiveAgent import followup_request, initial_feedback_request
+from feedback_app.llm_client import LLMConfig, achat_completion, configure
+from feedback_app.metrics import start_call, write_textfile
+from feedback_app.prompts import EVALUATION_INSTRUCTIONS, INITIAL_FEEDBACK_INSTRUCTIONS
+
+INITIAL_FEEDBACK = "initial_feedback"
+FOLLOWUP = "followup"
+
+
+# ----------- SYNTHETIC ATTEMPTS -----------
+
+def _perturb_last_number(text):
+    # A plausible wrong answer: the official working with its final number changed
+    numbers = list(re.finditer(r"\d+", text))
+    if not numbers:
+        return None
+    last = numbers[-1]
+    return text[:last.start()] + str(int(last.group()) + 1) + text[last.end():]
+
+
+def _text(value):
+    # Missing CSV cells come back as NaN
+    return value.strip() if isinstance(value, str) else ""
+
+
+def synthetic_attempts(solution):
+    """(variant, attempt) pairs ranging from empty to fully correct."""
+    solution = _text(solution)
+    lines = [l for l in solution.splitlines() if l.strip()]
+    attempts = [
+        ("blank", "idk"),
+        ("first_step", lines[0] if lines else ""),
+        ("half_done", "\n".join(lines[: max(1, len(lines) // 2)])),
+        ("wrong_answer", _perturb_last_number(solution)),
+        ("correct", solution),
+    ]
+    seen = set()
+    for variant, attempt in attempts:
+        if not attempt or attempt in seen:
+            continue
+        seen.add(attempt)
+        yield variant, attempt
+
+
+def iter_requests(df):
+    for row, problem in enumerate(df.itertuples(index=False)):
+        if not _text(problem.problem_statement):
+            continue
+        # The CSV repeats some problem statements, so ids carry the row as well
+        pid = problem_key(problem.problem_statement)
+        for variant, attempt in synthetic_attempts(problem.problem_solution):
+            yield {
+                "id": f"{row}:{pid}:{INITIAL_FEEDBACK}:{variant}",
+                "call": INITIAL_FEEDBACK,
+                "row": row,
+                "variant": variant,
+                "problem": problem.problem_statement,
+                "student_text": attempt,
+                "correct_solution": _text(problem.problem_solution),
+            }
+        if _text(problem.new_problem):
+            for variant, attempt in synthetic_attempts(problem.new_solution):
+                yield {
+                    "id": f"{row}:{pid}:{FOLLOWUP}:{variant}",
+                    "call": FOLLOWUP,
+                    "row": row,
+                    "variant": variant,
+                    "problem": problem.new_problem,
+                    "student_text": attempt,
+                    "correct_solution": _text(problem.new_solution),
+                }
+
+
+def emit(out_path, csv_path=CSV_PATH, limit=None):
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    df = load_problems(csv_path)
+    if limit:
+        df = df.head(limit)
+    count = 0
+    with open(out_path, "w", encoding="utf-8") as f:
+        for request in iter_requests(df):
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+            count += 1
+    print(f"Wrote {count} requests for {len(df)} problems to {out_path}")
+    return count
+
+
+# ----------- EXECUTION -----------
+
+class RateLimiter:
+    """Token bucket: `rate` requests per second with bursts of up to `burst`."""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+def checkpoint_path(out_path):
+    return out_path + ".done"
+
+
+def load_checkpoint(out_path):
+    try:
+        with open(checkpoint_path(out_path), encoding="utf-8") as f:
+            return {line.strip() for line in f if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def build_request(item):
+    if item["call"] == INITIAL_FEEDBACK:
+        low_info, request = initial_feedback_request(
+            item["problem"], item["student_text"], item["correct_solution"], INITIAL_FEEDBACK_INSTRUCTIONS
+        )
+        return request, {"low_info": low_info}
+    if item["call"] == FOLLOWUP:
+        return followup_request(item["student_text"], item["correct_solution"], EVALUATION_INSTRUCTIONS), {}
+    raise ValueError(f"unknown call type {item['call']!r}")
+
+
+async def execute(item, limiter):
+    await limiter.acquire()
+    started = time.perf_counter()
+    result = {"id": item["id"], "call": item["call"], "row": item.get("row"), "variant": item.get("variant")}
+    call = None
+    try:
+        request, extra = build_request(item)
+        result.update(extra)
+        call = start_call(f"batch_{item['call']}", request["model"])
+        with call.counting_attempts():
+            resp = await achat_completion(**request)
+        call.finish(resp.usage)
+        result.update(
+            model=resp.model,
+            output=resp.choices[0].message.content,
+            usage=resp.usage.model_dump() if resp.usage is not None else None,
+            error=None,
+        )
+    except Exception as e:
+        if call is not None:
+            call.finish(error=e)
+        result.update(output=None, error=f"{type(e).__name__}: {e}")
+    result["latency_s"] = round(time.perf_counter() - started, 3)
+    return result
+
+
+def _pending(requests_path, done):
+    with open(requests_path, encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                item = json.loads(line)
+                if item["id"] not in done:
+                    yield item
+
+
+async def run(requests_path, out_path, concurrency=8, rps=5.0, limit=None):
+    """Execute every request not yet checkpointed; failed requests are retried on the next run."""
+    done = load_checkpoint(out_path)
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    limiter = RateLimiter(rps)
+    queue = asyncio.Queue(maxsize=concurrency * 2)
+    stats = {"ok": 0, "failed": 0, "skipped": len(done)}
+
+    # Results and checkpoint are appended by the event loop thread only, one line per write
+    with open(out_path, "a", encoding="utf-8") as out, open(checkpoint_path(out_path), "a", encoding="utf-8") as ckpt:
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                result = await execute(item, limiter)
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                if result["error"] is None:
+                    ckpt.write(item["id"] + "\n")
+                    ckpt.flush()
+                    stats["ok"] += 1
+                else:
+                    stats["failed"] += 1
+                    print(f"{item['id']}: {result['error']}")
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        started = time.perf_counter()
+        for n, item in enumerate(_pending(requests_path, done)):
+            if limit is not None and n >= limit:
+                break
+            await queue.put(item)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+
+    stats["elapsed_s"] = round(time.perf_counter() - started, 2)
+    # Latency/token histograms for this run, next to the results
+    write_textfile(out_path + ".prom")
+    print(f"Batch finished: {stats}")
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Emit and run batches of feedback requests over the problem bank.")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_emit = sub.add_parser("emit", help="write request JSONL from the dataset")
+    p_emit.add_argument("--csv", default=CSV_PATH)
+    p_emit.add_argument("--out", default=os.path.join("batch", "requests.jsonl"))
+    p_emit.add_argument("--limit", type=int, help="only the first N problems")
+
+    p_run = sub.add_parser("run", help="execute a request JSONL (resumes from the checkpoint)")
+    p_run.add_argument("requests")
+    p_run.add_argument("--out", default=os.path.join("batch", "results.jsonl"))
+    p_run.add_argument("--concurrency", type=int, default=8)
+    p_run.add_argument("--rps", type=float, default=5.0, help="max requests started per second")
+    p_run.add_argument("--limit", type=int, help="stop after N requests")
+    p_run.add_argument("--base-url", help="OpenAI-compatible endpoint, e.g. a local mock")
+    p_run.add_argument("--mock", action="store_true", help="start the fake chat server from fakes.py and use it")
+
+    args = parser.parse_args()
+    if args.command == "emit":
+        emit(args.out, args.csv, args.limit)
+        return
+
+    server = None
+    if args.mock:
+        from feedback_app.fakes import FakeChatServer
+        server = FakeChatServer().start()
+        args.base_url = server.base_url
+    if args.base_url:
+        config = LLMConfig.from_env()
+        configure(LLMConfig(**{**config.__dict__, "base_url": args.base_url, "api_key": config.api_key or "mock"}))
+    try:
+        asyncio.run(run(args.requests, args.out, args.concurrency, args.rps, args.limit))
+    finally:
+        if server is not None:
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
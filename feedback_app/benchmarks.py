@@ -0,0 +1,248 @@
+# benchmarks.py
+#
+# Micro-benchmarks for the local work around each model call (prompt formatting,
+# history compaction, message copying, serialization and log/event file I/O) and for
+# the sidebar calculator engine. The OpenAI client is replaced by FakeChatClient
+# (fakes.py), so with the default zero latency every number is pure app overhead.
+# Dialogues from 2 to 200 turns are synthesized, and results are written as JSON
+# that `--compare` diffs against a previous run.
+#
+#     python -m feedback_app.benchmarks --out bench/current.json
+#     python -m feedback_app.benchmarks --out bench/new.json --compare bench/current.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from feedback_app import calculator, interactiveAgent, log_store, response_cache
+from feedback_app.fakes import FakeChatClient
+from feedback_app.llm_client import configure
+from feedback_app.prompts import EVALUATION_INSTRUCTIONS, INITIAL_FEEDBACK_INSTRUCTIONS, TUTOR_SYSTEM_PROMPT
+from feedback_app.session_log import (
+    ATTEMPT_SUBMITTED,
+    CHAT_TURN,
+    FEEDBACK_GENERATED,
+    flatten_session_log,
+    load_session,
+    log_event,
+)
+
+REPORT_VERSION = 1
+TURN_COUNTS = (2, 10, 50, 100, 200)
+
+# Calculator inputs: everyday, memoized-heavy, and ones that must be refused quickly
+CALC_EXPRESSIONS = {
+    "calc_simple": "5nCr3 + 2*4",
+    "calc_nested": "((2+3)!*nPr(7,3) - 4**5) / (6nCr2 + 1)",
+    "calc_factorial_4000": "4000!",
+    "calc_choose_large": "19999nCr9999",
+    "calc_refuse_factorial": "99999!",
+    "calc_refuse_power": "9**9**9",
+}
+
+PROBLEM = "Let f(x) = x^2 - 4x + 3. Find all real x with f(x) < 0 and justify each step."
+SOLUTION = "f(x) = (x - 1)(x - 3). The product is negative exactly between the roots, so 1 < x < 3."
+ATTEMPT = "I factored it as (x-1)(x-3) and then I think it is negative when x > 3 because both are positive?"
+
+
+# ----------- FIXTURES -----------
+
+def synthetic_dialogue(turns, reply_chars=400):
+    """Seeded tutoring messages followed by `turns` student/tutor exchanges."""
+    messages = interactiveAgent.build_tutoring_messages(
+        PROBLEM, ATTEMPT, SOLUTION, TUTOR_SYSTEM_PROMPT, "Check the sign of each factor between the roots."
+    )
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"Turn {i}: is it because (x-1) > 0 and (x-3) < 0 there?"})
+        messages.append({"role": "assistant", "content": ("Good, keep going. " * (reply_chars // 18 + 1))[:reply_chars]})
+    return messages
+
+
+def seed_events(student_id, messages):
+    log_event(student_id, ATTEMPT_SUBMITTED, 0, problem=PROBLEM, student_attempt=ATTEMPT, correct_solution=SOLUTION,
+              similar_problem="", similar_solution="")
+    log_event(student_id, FEEDBACK_GENERATED, 0, initial_feedback=messages[3]["content"], latency={})
+    for m in messages[4:]:
+        log_event(student_id, CHAT_TURN, 0, role=m["role"], content=m["content"])
+
+
+# ----------- TIMING -----------
+
+def measure(fn, repeat, warmup=2):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter_ns()
+        fn()
+        samples.append(time.perf_counter_ns() - started)
+    return samples
+
+
+def summarize(name, turns, samples):
+    ordered = sorted(samples)
+    return {
+        "name": name,
+        "turns": turns,
+        "n": len(ordered),
+        "mean_us": round(statistics.fmean(ordered) / 1000, 1),
+        "p50_us": round(ordered[len(ordered) // 2] / 1000, 1),
+        "p95_us": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] / 1000, 1),
+        "min_us": round(ordered[0] / 1000, 1),
+    }
+
+
+def _drain(result):
+    # Streaming paths return generators; consume them so the work is actually done
+    return "".join(result) if not isinstance(result, str) else result
+
+
+def bench_agent(turn_counts, repeat, reply_chars):
+    results = []
+    results.append(summarize("start_session", 0, measure(
+        lambda: interactiveAgent.start_session(PROBLEM, ATTEMPT, SOLUTION, TUTOR_SYSTEM_PROMPT, INITIAL_FEEDBACK_INSTRUCTIONS),
+        repeat)))
+    results.append(summarize("evaluate_followup", 0, measure(
+        lambda: interactiveAgent.evaluate_followup(PROBLEM, ATTEMPT, SOLUTION, EVALUATION_INSTRUCTIONS),
+        repeat)))
+
+    for turns in turn_counts:
+        messages = synthetic_dialogue(turns, reply_chars)
+        student_id = f"bench_{turns}"
+        seed_events(student_id, messages)
+        runs = {
+            "continue_session": lambda: interactiveAgent.continue_session(messages),
+            "continue_session_stream": lambda: _drain(interactiveAgent.continue_session(messages, stream=True)),
+            # The work of one turn: the model call plus the compaction the page runs after it
+            "tutoring_turn": lambda: interactiveAgent.continue_session(interactiveAgent.compact_history(messages)),
+            "history_copy": lambda: [{"role": m["role"], "content": m["content"]} for m in messages],
+            "save_session_log": lambda: interactiveAgent.save_session_log(PROBLEM, ATTEMPT, SOLUTION, messages),
+            "log_event": lambda: log_event(f"bench_append_{turns}", CHAT_TURN, 0, role="user", content=messages[-2]["content"]),
+            "load_session": lambda: load_session(student_id),
+            "flatten_session_log": lambda log=load_session(student_id): flatten_session_log(log),
+        }
+        for name, fn in runs.items():
+            results.append(summarize(name, turns, measure(fn, repeat)))
+    return results
+
+
+def bench_calculator(repeat):
+    # Memo caches are cleared per sample for the big inputs, so the numbers are cold-cache costs
+    results = []
+    for name, expr in CALC_EXPRESSIONS.items():
+        def cold(expr=expr):
+            calculator.factorial.cache_clear()
+            calculator.comb.cache_clear()
+            calculator.perm.cache_clear()
+            return calculator.calculate(expr)
+        results.append(summarize(name, 0, measure(cold, repeat)))
+        results.append(summarize(name + "_warm", 0, measure(lambda expr=expr: calculator.calculate(expr), repeat)))
+    return results
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(turn_counts=TURN_COUNTS, repeat=30, latency=0.0, reply_chars=400, use_cache=False):
+    """Run every benchmark in a scratch directory and return the JSON-ready report."""
+    fake = FakeChatClient(latency=latency, reply_chars=reply_chars)
+    configure(client=fake)
+    # With the cache on, every repeat after the first is a cache hit rather than the call path
+    bypass, response_cache.CACHE_BYPASS = response_cache.CACHE_BYPASS, not use_cache
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix="feedback-bench-") as scratch, log_store.isolated_stores():
+        # Log stores, caches and event files use relative paths
+        os.chdir(scratch)
+        try:
+            # The log writers print one line per save
+            with contextlib.redirect_stdout(io.StringIO()):
+                results = bench_agent(turn_counts, repeat, reply_chars) + bench_calculator(repeat)
+        finally:
+            os.chdir(cwd)
+            response_cache.CACHE_BYPASS = bypass
+            configure()
+
+    return {
+        "version": REPORT_VERSION,
+        "created": datetime.now().isoformat(timespec="seconds"),
+        "git_revision": git_revision(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "config": {"repeat": repeat, "latency_s": latency, "reply_chars": reply_chars, "use_cache": use_cache,
+                   "fake_requests": fake.requests},
+        "results": results,
+    }
+
+
+# ----------- COMPARISON -----------
+
+def compare(report, baseline, threshold=1.25, metric="p50_us"):
+    """Rows whose `metric` grew by more than `threshold`x relative to the baseline report."""
+    before = {(r["name"], r["turns"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"{'benchmark':<28}{'turns':>6}{'before':>12}{'after':>12}{'ratio':>8}")
+    for row in report["results"]:
+        old = before.get((row["name"], row["turns"]))
+        if old is None or not old[metric]:
+            continue
+        ratio = row[metric] / old[metric]
+        flag = "  REGRESSION" if ratio > threshold else ""
+        print(f"{row['name']:<28}{row['turns']:>6}{old[metric]:>12}{row[metric]:>12}{ratio:>8.2f}{flag}")
+        if flag:
+            regressions.append(dict(row, baseline=old[metric], ratio=round(ratio, 2)))
+    return regressions
+
+
+def print_report(report):
+    print(f"{'benchmark':<28}{'turns':>6}{'p50 us':>12}{'p95 us':>12}{'mean us':>12}")
+    for row in report["results"]:
+        print(f"{row['name']:<28}{row['turns']:>6}{row['p50_us']:>12}{row['p95_us']:>12}{row['mean_us']:>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark local overhead of the tutoring call paths.")
+    parser.add_argument("--turns", type=int, nargs="*", default=list(TURN_COUNTS))
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0, help="fake model latency per call, seconds")
+    parser.add_argument("--reply-chars", type=int, default=400, help="size of each fake model reply")
+    parser.add_argument("--use-cache", action="store_true", help="leave the response cache on")
+    parser.add_argument("--out", help="write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to diff against")
+    parser.add_argument("--threshold", type=float, default=1.25, help="p50 slowdown ratio that counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args.turns, args.repeat, args.latency, args.reply_chars, args.use_cache)
+    if args.out:
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to {args.out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            regressions = compare(report, json.load(f), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) above {args.threshold}x")
+            sys.exit(1)
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,297 @@
+# calculator.py
+#
+# Expression engine behind the sidebar calculator. Input is tokenized and parsed
+# (recursive descent) into a small tree of tuples, then evaluated with hard budgets
+# on input length, nesting, operand size and wall time, so `99999!` or `9**9**9`
+# come back as "Too large" instead of pinning a CPU core for every participant.
+#
+# Grammar, loosest binding first:
+#     expr    := term (("+" | "-") term)*
+#     term    := choose (("*" | "/") choose)*
+#     choose  := unary (("nCr" | "nPr") unary)*          5nCr3, 2*5nPr2
+#     unary   := ("-" | "+") unary | power
+#     power   := postfix ("**" unary)?                   right-associative, -2**2 == -4
+#     postfix := primary "!"*
+#     primary := NUMBER | "(" expr ")" | ("nCr" | "nPr") "(" expr "," expr ")"
+
+import functools
+import math
+import re
+import time
+
+MAX_EXPRESSION_CHARS = 200
+MAX_DEPTH = 50
+MAX_FACTORIAL = 5000            # 5000! has 16 326 digits
+MAX_CHOOSE_N = 20000
+MAX_RESULT_BITS = 200_000       # ~60 000 decimal digits
+TIME_BUDGET_SECONDS = 0.05
+COMPACT_DIGITS = 30             # integers longer than this are shown as 1.2345e+67 (68 digits)
+
+TOKEN = re.compile(r"\s*(?:(\d+\.?\d*|\.\d+)|(nCr|nPr|\*\*|[-+*/()!,]))")
+
+
+class CalcError(ValueError):
+    pass
+
+
+class TooLarge(CalcError):
+    pass
+
+
+# ----------- PARSING -----------
+
+def tokenize(text):
+    tokens = []
+    pos = 0
+    text = text.rstrip()
+    while pos < len(text):
+        m = TOKEN.match(text, pos)
+        if m is None:
+            raise CalcError(f"unexpected {text[pos:].strip()[:1]!r}")
+        number, op = m.groups()
+        tokens.append(("num", float(number) if "." in number else int(number)) if number else ("op", op))
+        pos = m.end()
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.pos = 0
+        self.depth = 0
+
+    def peek(self):
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else (None, None)
+
+    def take(self, op=None):
+        kind, value = self.peek()
+        if kind is None or (op is not None and value != op):
+            raise CalcError(f"expected {op!r}" if op else "unexpected end of expression")
+        self.pos += 1
+        return kind, value
+
+    def accept(self, *ops):
+        kind, value = self.peek()
+        if kind == "op" and value in ops:
+            self.pos += 1
+            return value
+        return None
+
+    def parse(self):
+        node = self.expr()
+        if self.pos != len(self.tokens):
+            raise CalcError(f"unexpected {self.peek()[1]!r}")
+        return node
+
+    def _binary(self, operand, ops):
+        node = operand()
+        while (op := self.accept(*ops)) is not None:
+            node = ("bin", op, node, operand())
+        return node
+
+    def expr(self):
+        self.depth += 1
+        if self.depth > MAX_DEPTH:
+            raise TooLarge("expression nested too deeply")
+        try:
+            return self._binary(self.term, ("+", "-"))
+        finally:
+            self.depth -= 1
+
+    def term(self):
+        return self._binary(self.choose, ("*", "/"))
+
+    def choose(self):
+        return self._binary(self.unary, ("nCr", "nPr"))
+
+    def unary(self):
+        op = self.accept("-", "+")
+        if op is not None:
+            self.depth += 1
+            if self.depth > MAX_DEPTH:
+                raise TooLarge("expression nested too deeply")
+            try:
+                return ("neg", self.unary()) if op == "-" else self.unary()
+            finally:
+                self.depth -= 1
+        node = self.postfix()
+        if self.accept("**") is not None:
+            node = ("bin", "**", node, self.unary())
+        return node
+
+    def postfix(self):
+        node = self.primary()
+        while self.accept("!") is not None:
+            node = ("fact", node)
+        return node
+
+    def primary(self):
+        kind, value = self.take()
+        if kind == "num":
+            return ("num", value)
+        if value == "(":
+            node = self.expr()
+            self.take(")")
+            return node
+        if value in ("nCr", "nPr"):
+            self.take("(")
+            n = self.expr()
+            self.take(",")
+            k = self.expr()
+            self.take(")")
+            return ("bin", value, n, k)
+        raise CalcError(f"unexpected {value!r}")
+
+
+def parse(text):
+    if len(text) > MAX_EXPRESSION_CHARS:
+        raise TooLarge("expression too long")
+    tokens = tokenize(text)
+    if not tokens:
+        raise CalcError("empty expression")
+    return _Parser(tokens).parse()
+
+
+# ----------- EVALUATION -----------
+
+@functools.lru_cache(maxsize=256)
+def factorial(n):
+    return math.factorial(n)
+
+
+@functools.lru_cache(maxsize=1024)
+def comb(n, k):
+    return math.comb(n, k)
+
+
+@functools.lru_cache(maxsize=1024)
+def perm(n, k):
+    return math.perm(n, k)
+
+
+def _as_int(value, what):
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise CalcError(f"{what} needs whole numbers")
+        value = int(value)
+    if value < 0:
+        raise CalcError(f"{what} needs non-negative numbers")
+    return value
+
+
+def _bits(value):
+    if isinstance(value, int):
+        return abs(value).bit_length()
+    return 0 if value == 0 or not math.isfinite(value) else max(0, math.frexp(value)[1])
+
+
+def _power(base, exponent):
+    if isinstance(base, int) and isinstance(exponent, int) and exponent > 0:
+        # Result size is known up front: bits(base) * exponent
+        if _bits(base) * exponent > MAX_RESULT_BITS and abs(base) > 1:
+            raise TooLarge("result too large")
+    elif isinstance(exponent, int) and exponent < 0 and base == 0:
+        raise CalcError("division by zero")
+    try:
+        result = base ** exponent
+    except OverflowError:
+        raise TooLarge("result too large")
+    if isinstance(result, complex):
+        raise CalcError("no real result")
+    return result
+
+
+def _apply(op, a, b):
+    if op == "+":
+        return a + b
+    if op == "-":
+        return a - b
+    if op == "*":
+        return a * b
+    if op == "/":
+        if b == 0:
+            raise CalcError("division by zero")
+        return a / b
+    if op == "**":
+        return _power(a, b)
+    n, k = _as_int(a, op), _as_int(b, op)
+    if k > n:
+        return 0
+    # log2 of n!/(n-k)! (and of n!/(k!(n-k)!)), so nothing oversized is ever computed
+    log_size = math.lgamma(n + 1) - math.lgamma(n - k + 1) - (math.lgamma(k + 1) if op == "nCr" else 0)
+    if n > MAX_CHOOSE_N or log_size / math.log(2) > MAX_RESULT_BITS:
+        raise TooLarge("result too large")
+    return comb(n, k) if op == "nCr" else perm(n, k)
+
+
+def _evaluate(node, deadline):
+    if time.perf_counter() > deadline:
+        raise TooLarge("calculation took too long")
+    kind = node[0]
+    if kind == "num":
+        result = node[1]
+    elif kind == "neg":
+        result = -_evaluate(node[1], deadline)
+    elif kind == "fact":
+        n = _as_int(_evaluate(node[1], deadline), "factorial")
+        if n > MAX_FACTORIAL:
+            raise TooLarge("result too large")
+        result = factorial(n)
+    else:
+        _, op, left, right = node
+        try:
+            result = _apply(op, _evaluate(left, deadline), _evaluate(right, deadline))
+        except OverflowError:
+            # e.g. a float times an integer too large to convert
+            raise TooLarge("result too large")
+    if isinstance(result, float) and not math.isfinite(result):
+        raise TooLarge("result too large")
+    if _bits(result) > MAX_RESULT_BITS:
+        raise TooLarge("result too large")
+    return result
+
+
+def evaluate(text, time_budget=TIME_BUDGET_SECONDS):
+    """Value of a calculator expression; raises CalcError (or TooLarge) instead of hanging."""
+    return _evaluate(parse(text), time.perf_counter() + time_budget)
+
+
+# ----------- FORMATTING -----------
+
+def _digit_count(n):
+    # bit_length gives the count to within one; a single comparison settles it
+    digits = max(1, int(n.bit_length() * math.log10(2)))
+    return digits + 1 if n >= 10 ** digits else digits
+
+
+def format_result(value):
+    if isinstance(value, float):
+        return str(value)
+    n = abs(value)
+    if n < 10 ** COMPACT_DIGITS:
+        return str(value)
+    # str() of very long ints is slow (and refused past 4300 digits), so show a mantissa instead
+    digits = _digit_count(n)
+    lead = n // 10 ** (digits - 6)
+    mantissa = f"{lead // 100000}.{lead % 100000:05d}".rstrip("0").rstrip(".")
+    sign = "-" if value < 0 else ""
+    return f"{sign}{mantissa}e+{digits - 1} ({digits} digits)"
+
+
+ERROR = "Error"
+TOO_LARGE = "Too large"
+
+
+def calculate(text):
+    """Formatted result for the calculator display: the value, "Too large" or "Error"."""
+    try:
+        return format_result(evaluate(text))
+    except TooLarge:
+        return TOO_LARGE
+    except (CalcError, ArithmeticError, RecursionError):
+        return ERROR
+
+
+def is_editable(display):
+    # Messages and compact "1.2e+67 (68 digits)" results cannot be typed onto
+    return display not in (ERROR, TOO_LARGE) and not display.endswith("digits)")
@@ -0,0 +1,138 @@
+# chat_pane.py
+#
+# Chat bubbles for the tutoring page. Bubble HTML is memoized per (role, content),
+# so a rerun turns an N-turn dialogue into N cache lookups instead of N string
+# rebuilds; the page renders the dialogue inside a fragment, so sending a reply
+# reruns only the pane and not the whole page (sidebar, CSS, rubric widgets).
+
+import functools
+import re
+import time
+
+import streamlit as st
+
+CHAT_STYLES = """
+<style>
+.chat-container {
+    display: flex;
+    flex-direction: column;
+    gap: 10px;
+    margin-top: 10px;
+    padding-left: 10px;
+    padding-right: 10px;
+}
+
+.bubble {
+    padding: 12px 16px;
+    border-radius: 12px;
+    border: 2px solid;
+    background-color: #000000;
+    font-family: sans-serif;
+    font-size: 16px;
+    display: inline-block;
+    max-width: 70%;
+    word-wrap: break-word;
+    margin-top: 6px;
+    margin-bottom: 6px;
+}
+
+.student {
+    border-color: #ff4d4d;
+    color: #ff4d4d;
+    align-self: flex-end;
+    text-align: left;
+    font-size: 20px;
+}
+
+.tutor {
+    border-color: #3399ff;
+    color: #3399ff;
+    align-self: flex-start;
+    text-align: left;
+    font-size: 20px;
+}
+
+.instruction-box {
+    font-size: 30px;
+    font-weight: 600;
+    line-height: 1.6;
+    margin-top: 20px;
+    margin-bottom: 20px;
+    color: #4CAF50; /* A pleasant green */
+    background-color: rgba(76, 175, 80, 0.1); /* Subtle green tint */
+    padding: 12px;
+    border-left: 5px solid #4CAF50;
+    border-radius: 6px;
+}
+
+.problem {
+    border-color: #9b59b6;
+    color: #9b59b6;
+    align-self: center;
+    text-align: left;
+    font-size: 20px;
+}
+
+</style>
+"""
+
+# Role -> (css class, header) for dialogue turns
+ROLE_BUBBLES = {
+    "user": ("student", "🧑‍🎓 <b>Student:</b>"),
+    "assistant": ("tutor", "🤖 <b>Tutor:</b>"),
+}
+
+
+def _minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    return re.sub(r"\s*([{};:,>])\s*", r"\1", css).strip()
+
+
+# The full page still has to emit the styles on every run; they are sent minified
+MINIFIED_CHAT_STYLES = _minify_css(CHAT_STYLES)
+
+
+@functools.lru_cache(maxsize=4096)
+def bubble_html(css_class, header, content):
+    body = content.replace("\n", "<br>")
+    return f'<div class="bubble {css_class}">{header}<br>{body}</div>'
+
+
+def render_styles():
+    st.markdown(MINIFIED_CHAT_STYLES, unsafe_allow_html=True)
+
+
+def render_bubble(css_class, header, content):
+    st.markdown(bubble_html(css_class, header, content), unsafe_allow_html=True)
+
+
+def render_transcript(transcript):
+    for msg in transcript:
+        if msg["role"] in ROLE_BUBBLES:
+            render_bubble(*ROLE_BUBBLES[msg["role"]], msg["content"])
+
+
+def stream_into_bubble(chunks, css_class, header):
+    """Render streamed chunks into a single bubble; returns the final text and its latency."""
+    placeholder = st.empty()
+    start = time.perf_counter()
+    ttft = None
+    text = ""
+    try:
+        for piece in chunks:
+            if ttft is None:
+                ttft = time.perf_counter() - start
+            text += piece
+            # Not bubble_html: every partial text is distinct, caching it would only evict real bubbles
+            body = text.replace("\n", "<br>")
+            placeholder.markdown(f'<div class="bubble {css_class}">{header}<br>{body}</div>', unsafe_allow_html=True)
+    finally:
+        # A rerun can interrupt the loop; close the stream now instead of when it is garbage collected
+        if hasattr(chunks, "close"):
+            chunks.close()
+    latency = {
+        "ttft_s": round(ttft if ttft is not None else time.perf_counter() - start, 3),
+        "total_s": round(time.perf_counter() - start, 3),
+    }
+    return text, latency
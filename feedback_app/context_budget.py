@@ -0,0 +1,77 @@
+# context_budget.py
+#
+# Keeps the tutoring dialogue sent to the model within a token budget. The system
+# messages (tutor prompt + problem context) and the initial feedback stay verbatim;
+# older turns are folded into a single running-summary message and only the most
+# recent turns are resent as-is, so each request stays roughly the same size.
+
+import os
+
+try:
+    import tiktoken
+except ImportError:  # fall back to a character-based estimate
+    tiktoken = None
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("TUTOR_CONTEXT_TOKENS", "6000"))
+KEEP_RECENT_MESSAGES = 6       # last 3 student/tutor exchanges are never summarized
+MAX_STUDENT_CHARS = 2000       # longer pasted inputs are cut before they reach the model
+SUMMARY_PREFIX = "[SUMMARY OF EARLIER DIALOGUE]\n"
+
+_encoding = None
+
+
+def count_tokens(text):
+    global _encoding
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding("o200k_base")
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages):
+    # ~4 tokens of framing per message plus 3 for the reply primer
+    return sum(count_tokens(m["content"]) + 4 for m in messages) + 3
+
+
+def truncate_student_input(text, max_chars=MAX_STUDENT_CHARS):
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars] + "\n[...input truncated...]"
+
+
+def is_summary(message):
+    return message["role"] == "system" and message["content"].startswith(SUMMARY_PREFIX)
+
+
+def _pinned_count(messages):
+    # Everything up to and including the initial feedback (the first assistant message)
+    for i, m in enumerate(messages):
+        if m["role"] == "assistant":
+            return i + 1
+    return len(messages)
+
+
+def compact_messages(messages, summarize, budget=CONTEXT_TOKEN_BUDGET, keep_recent=KEEP_RECENT_MESSAGES):
+    """
+    Return `messages` unchanged if it fits `budget`; otherwise fold everything between the
+    pinned head and the last `keep_recent` messages into one summary message.
+    `summarize(previous_summary, messages)` produces the new summary text.
+    """
+    if count_message_tokens(messages) <= budget:
+        return messages
+
+    pinned = _pinned_count(messages)
+    head = messages[:pinned]
+    body = messages[pinned:]
+    previous_summary = ""
+    if body and is_summary(body[0]):
+        previous_summary = body[0]["content"][len(SUMMARY_PREFIX):]
+        body = body[1:]
+
+    older, recent = body[:-keep_recent], body[-keep_recent:]
+    if not older:
+        return messages
+
+    summary = summarize(previous_summary, older)
+    return head + [{"role": "system", "content": SUMMARY_PREFIX + summary}] + recent
@@ -0,0 +1,58 @@
+# dataset.py
+#
+# The problem CSV is parsed once into a column-pruned binary store (a pickled
+# DataFrame next to the CSV) and kept in memory for the whole server process.
+# The store is rebuilt only when the CSV's modification time changes.
+
+import functools
+import hashlib
+import os
+import pickle
+
+import pandas as pd
+
+CSV_PATH = os.path.join("data", "student_math_work_posts_augmented_successful_only.csv")
+STORE_DIR = os.path.join("data", ".cache")
+
+# Columns the tutoring page reads; everything else in the forum export is dropped
+USED_COLUMNS = ("problem_statement", "problem_solution", "new_problem", "new_solution")
+
+
+def problem_key(problem):
+    # Stable across whitespace edits of the CSV
+    normalized = " ".join((problem or "").split())
+    return hashlib.sha1(normalized.encode("utf-8")).hexdigest()[:16]
+
+
+def _store_path(csv_path, columns):
+    digest = hashlib.sha1("|".join(columns).encode("utf-8")).hexdigest()[:8]
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(STORE_DIR, f"{name}.{digest}.pkl")
+
+
+def _build_store(csv_path, columns, mtime_ns, store_path):
+    df = pd.read_csv(csv_path, usecols=list(columns))[list(columns)]
+    os.makedirs(os.path.dirname(store_path), exist_ok=True)
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump({"csv_mtime_ns": mtime_ns, "columns": columns, "frame": df}, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, store_path)
+    return df
+
+
+@functools.lru_cache(maxsize=8)
+def _load(csv_path, columns, mtime_ns):
+    store_path = _store_path(csv_path, columns)
+    try:
+        with open(store_path, "rb") as f:
+            stored = pickle.load(f)
+        if stored["csv_mtime_ns"] == mtime_ns and tuple(stored["columns"]) == columns:
+            return stored["frame"]
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        pass
+    return _build_store(csv_path, columns, mtime_ns, store_path)
+
+
+def load_problems(csv_path=CSV_PATH, columns=USED_COLUMNS):
+    """Shared, read-only DataFrame of the problem bank; costs one stat() per call once warm."""
+    return _load(csv_path, tuple(columns), os.stat(csv_path).st_mtime_ns)
@@ -0,0 +1,439 @@
+# fakes.py
+#
+# Local stand-ins for the external services the app talks to, so writers and
+# clients can be exercised without network access or credentials.
+
+import hashlib
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+from openai.types.chat import ChatCompletion, ChatCompletionChunk
+
+
+class FakeResponse:
+    def __init__(self, status_code):
+        self.status_code = status_code
+
+
+class FakeAPIError(Exception):
+    # Shaped like gspread.exceptions.APIError: carries the HTTP response
+    def __init__(self, status_code=429):
+        super().__init__(f"fake API error {status_code}")
+        self.response = FakeResponse(status_code)
+
+
+class FakeWorksheet:
+    """In-memory worksheet implementing the gspread calls SheetWriter uses."""
+
+    def __init__(self, rows=None, fail_next=0, fail_status=429):
+        self.rows = [list(r) for r in (rows or [])]
+        self.fail_next = fail_next        # number of upcoming calls that raise FakeAPIError
+        self.fail_status = fail_status
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _call(self, name):
+        with self._lock:
+            self.calls.append(name)
+            if self.fail_next > 0:
+                self.fail_next -= 1
+                raise FakeAPIError(self.fail_status)
+
+    def row_values(self, row):
+        self._call("row_values")
+        return list(self.rows[row - 1]) if len(self.rows) >= row else []
+
+    def col_values(self, col):
+        self._call("col_values")
+        return [r[col - 1] if len(r) >= col else "" for r in self.rows]
+
+    def append_rows(self, values, value_input_option="RAW"):
+        self._call("append_rows")
+        with self._lock:
+            self.rows.extend(list(v) for v in values)
+
+    def append_row(self, values, value_input_option="RAW"):
+        self.append_rows([values], value_input_option)
+
+    def batch_update(self, data, **kwargs):
+        # Only what SheetWriter sends: single-row updates starting at an A1 cell
+        self._call("batch_update")
+        with self._lock:
+            for update in data:
+                letters, row = re.match(r"([A-Z]+)(\d+)", update["range"]).groups()
+                col = 0
+                for letter in letters:
+                    col = col * 26 + ord(letter) - ord("A") + 1
+                row = int(row)
+                while len(self.rows) < row:
+                    self.rows.append([])
+                cells = self.rows[row - 1]
+                for offset, value in enumerate(update["values"][0]):
+                    while len(cells) < col + offset:
+                        cells.append("")
+                    cells[col + offset - 1] = value
+
+
+# ----------- FAKE CHAT COMPLETIONS -----------
+
+def fake_reply(messages, reply_chars=400):
+    # Deterministic text derived from the request, padded to the requested size
+    digest = hashlib.sha1(json.dumps(messages, sort_keys=True).encode("utf-8")).hexdigest()[:12]
+    text = f"Fake tutor reply {digest}. "
+    return (text * (reply_chars // len(text) + 1))[:reply_chars]
+
+
+def fake_usage(body, completion_chars):
+    prompt_tokens = sum(len(m.get("content") or "") for m in body.get("messages", [])) // 4 + 1
+    completion_tokens = completion_chars // 4 + 1
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": 0},
+    }
+
+
+def fake_completion(body, reply_chars=400, seq=0):
+    """A chat.completion payload (as JSON-ready dict) answering the request `body`."""
+    text = fake_reply(body.get("messages", []), reply_chars)
+    return {
+        "id": f"chatcmpl-fake-{seq}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [
+            {"index": i, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}
+            for i in range(body.get("n") or 1)
+        ],
+        "usage": fake_usage(body, len(text)),
+    }
+
+
+def fake_stream_chunks(body, reply_chars=400, chunk_chars=20, seq=0):
+    """chat.completion.chunk payloads for a streamed reply, with a usage chunk when requested."""
+    text = fake_reply(body.get("messages", []), reply_chars)
+    base = {"id": f"chatcmpl-fake-{seq}", "object": "chat.completion.chunk",
+            "created": int(time.time()), "model": body.get("model", "gpt-4o")}
+    for start in range(0, len(text), chunk_chars):
+        delta = {"content": text[start:start + chunk_chars]}
+        yield dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+    yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    if (body.get("stream_options") or {}).get("include_usage"):
+        yield dict(base, choices=[], usage=fake_usage(body, len(text)))
+
+
+class FakeChatClient:
+    """
+    In-process stand-in for openai.OpenAI (pass it to llm_client.configure(client=...)).
+    Each call sleeps `latency` seconds and returns real openai response objects.
+    """
+
+    def __init__(self, latency=0.0, reply_chars=400, chunk_chars=20):
+        self.latency = latency
+        self.reply_chars = reply_chars
+        self.chunk_chars = chunk_chars
+        self.requests = 0
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self.models = SimpleNamespace(list=lambda: [])
+
+    def create(self, **body):
+        self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if body.get("stream"):
+            chunks = fake_stream_chunks(body, self.reply_chars, self.chunk_chars, self.requests)
+            return (ChatCompletionChunk.model_validate(c) for c in chunks)
+        return ChatCompletion.model_validate(fake_completion(body, self.reply_chars, self.requests))
+
+    def with_options(self, **options):
+        return self
+
+    def close(self):
+        pass
+
+
+# ----------- FAKE CHAT COMPLETIONS SERVER -----------
+
+
+class FakeChatServer:
+    """
+    Minimal OpenAI-compatible endpoint (POST /v1/chat/completions, GET /v1/models) on localhost.
+    `latency` seconds are spent before the first byte (after the headers when streaming, like the
+    real API); `model_latency` overrides it per model. Streamed replies are sent in `chunk_chars` pieces.
+
+    Faults for exercising resilience.py: inject() queues one fault per upcoming request, and
+    `error_rate` turns that share of the remaining requests into 503s.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, reply_chars=400, chunk_chars=20, model_latency=None,
+                 error_rate=0.0, seed=0):
+        self.latency = latency
+        self.model_latency = model_latency or {}
+        self.error_rate = error_rate
+        self.faults = []
+        self._faults_lock = threading.Lock()
+        self._random = random.Random(seed)
+        self.reply_chars = reply_chars
+        self.chunk_chars = chunk_chars
+        self.requests = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                self._send_json({"object": "list", "data": [{"id": "gpt-4o", "object": "model", "created": 0, "owned_by": "fake"}]})
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                server.requests += 1
+                latency = server.model_latency.get(body.get("model"), server.latency)
+                fault = server.next_fault(body.get("model"))
+                latency += fault.get("delay", 0.0)
+                try:
+                    if fault.get("drop"):
+                        # Hang up without answering: the client sees a connection error
+                        time.sleep(latency)
+                        self.close_connection = True
+                        return
+                    if fault.get("status"):
+                        time.sleep(latency)
+                        self._send_json(
+                            {"error": {"message": f"injected {fault['status']}", "type": "fake_error"}},
+                            fault["status"],
+                            {"Retry-After": str(fault["retry_after"])} if "retry_after" in fault else None,
+                        )
+                        return
+                    if body.get("stream"):
+                        self._stream(body, latency)
+                    else:
+                        time.sleep(latency)
+                        self._send_json(server.completion(body))
+                except (BrokenPipeError, ConnectionResetError):
+                    # The client gave up (e.g. a deadline passed) before the reply was sent
+                    self.close_connection = True
+
+            def _send_json(self, payload, status=200, headers=None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _stream(self, body, latency):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                self.wfile.flush()
+                time.sleep(latency)
+                for chunk in server.stream_chunks(body):
+                    event = f"data: {json.dumps(chunk) if chunk != '[DONE]' else chunk}\n\n".encode("utf-8")
+                    self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+
+        self._httpd = ThreadingHTTPServer((host, port), Handler)
+        self._httpd.daemon_threads = True
+        self.base_url = f"http://{host}:{self._httpd.server_address[1]}/v1"
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="fake-chat-server", daemon=True)
+
+    def inject(self, *faults):
+        """
+        Queue faults, each used by one upcoming request: {"status": 503}, {"status": 429, "retry_after": 1},
+        {"delay": 3.0} (extra latency), {"drop": True} (close without answering). "model" limits one to a model.
+        """
+        with self._faults_lock:
+            self.faults.extend(faults)
+
+    def next_fault(self, model=None):
+        with self._faults_lock:
+            for i, fault in enumerate(self.faults):
+                if fault.get("model") in (None, model):
+                    return self.faults.pop(i)
+            if self.error_rate and self._random.random() < self.error_rate:
+                return {"status": 503}
+        return {}
+
+    def completion(self, body):
+        return fake_completion(body, self.reply_chars, self.requests)
+
+    def stream_chunks(self, body):
+        yield from fake_stream_chunks(body, self.reply_chars, self.chunk_chars, self.requests)
+        yield "[DONE]"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+# ----------- FAKE REDIS (RESP) SERVER -----------
+
+class FakeRedisServer:
+    """
+    In-process stand-in for the Redis commands session_store.RedisBackend uses:
+    PING, AUTH, SELECT, HGET, HMGET, HSET, DEL, EXPIRE, WATCH, UNWATCH, MULTI, EXEC.
+    Expiry is accepted but not enforced. Commands named in fail_commands (e.g. b"EXPIRE")
+    are answered with an error, and a transaction that queued one is aborted at EXEC.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0):
+        self.hashes = {}
+        self.modified = {}      # key -> change counter, what WATCH compares
+        self.fail_commands = set()
+        self.lock = threading.Lock()
+        server = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                watched, queue, aborted = {}, None, False
+                while True:
+                    try:
+                        args = server.read_command(self.rfile)
+                    except (ConnectionError, ValueError):
+                        return
+                    if args is None:
+                        return
+                    name = args[0].upper()
+                    if name in server.fail_commands:
+                        aborted = queue is not None
+                        reply = "-ERR injected failure"
+                    elif name == b"MULTI":
+                        queue, aborted = [], False
+                        reply = "+OK"
+                    elif queue is not None and name not in (b"EXEC", b"DISCARD"):
+                        queue.append(args)
+                        reply = "+QUEUED"
+                    elif name == b"EXEC" and aborted:
+                        reply = "-EXECABORT Transaction discarded because of previous errors."
+                        watched, queue, aborted = {}, None, False
+                    elif name == b"EXEC":
+                        with server.lock:
+                            if any(server.modified.get(k, 0) != v for k, v in watched.items()):
+                                reply = None
+                            else:
+                                reply = [server.execute(cmd) for cmd in queue or []]
+                        watched, queue = {}, None
+                    elif name == b"WATCH":
+                        with server.lock:
+                            watched.update({k: server.modified.get(k, 0) for k in args[1:]})
+                        reply = "+OK"
+                    elif name == b"UNWATCH":
+                        watched = {}
+                        reply = "+OK"
+                    else:
+                        with server.lock:
+                            reply = server.execute(args)
+                    self.wfile.write(server.encode(reply))
+                    self.wfile.flush()
+
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.address = self._server.server_address
+        self.url = f"redis://{self.address[0]}:{self.address[1]}/0"
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-redis", daemon=True)
+
+    @staticmethod
+    def read_command(f):
+        line = f.readline()
+        if not line:
+            return None
+        if line[:1] != b"*":
+            raise ValueError("inline commands are not supported")
+        args = []
+        for _ in range(int(line[1:-2])):
+            n = int(f.readline()[1:-2])
+            args.append(f.read(n + 2)[:-2])
+        return args
+
+    def encode(self, reply):
+        if reply is None:
+            return b"$-1\r\n"
+        if isinstance(reply, str):
+            return reply.encode("utf-8") + b"\r\n"
+        if isinstance(reply, int):
+            return b":%d\r\n" % reply
+        if isinstance(reply, bytes):
+            return b"$%d\r\n%s\r\n" % (len(reply), reply)
+        if isinstance(reply, list):
+            return b"*%d\r\n" % len(reply) + b"".join(self.encode(item) for item in reply)
+        raise TypeError(reply)
+
+    def execute(self, args):
+        # Caller holds self.lock
+        name, rest = args[0].upper(), args[1:]
+        if name in (b"PING", b"AUTH", b"SELECT"):
+            return "+PONG" if name == b"PING" else "+OK"
+        if name == b"HGET":
+            return self.hashes.get(rest[0], {}).get(rest[1])
+        if name == b"HMGET":
+            fields = self.hashes.get(rest[0], {})
+            return [fields.get(f) for f in rest[1:]]
+        if name == b"HSET":
+            fields = self.hashes.setdefault(rest[0], {})
+            added = sum(1 for f in rest[1::2] if f not in fields)
+            fields.update(zip(rest[1::2], rest[2::2]))
+            self.modified[rest[0]] = self.modified.get(rest[0], 0) + 1
+            return added
+        if name == b"DEL":
+            removed = 0
+            for key in rest:
+                if self.hashes.pop(key, None) is not None:
+                    removed += 1
+                    self.modified[key] = self.modified.get(key, 0) + 1
+            return removed
+        if name == b"EXPIRE":
+            return 1 if rest[0] in self.hashes else 0
+        return f"-ERR unknown command '{name.decode()}'"
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run the fake chat-completions endpoint.")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0)
+    parser.add_argument("--reply-chars", type=int, default=400)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 503")
+    args = parser.parse_args()
+    fake = FakeChatServer(port=args.port, latency=args.latency, reply_chars=args.reply_chars,
+                          error_rate=args.error_rate).start()
+    print(f"Fake chat server listening on {fake.base_url}")
+    fake._thread.join()
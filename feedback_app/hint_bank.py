@@ -0,0 +1,182 @@
+# hint_bank.py
+#
+# Precomputed starter hints for low-information first attempts ("idk", "?", ...).
+# Build the bank offline with
+#     python -m feedback_app.hint_bank --variants 4
+# and provide_initial_feedback serves a rotating variant instantly instead of calling the model.
+
+import argparse
+import gzip
+import itertools
+import json
+import os
+import re
+import threading
+
+from feedback_app.dataset import CSV_PATH, load_problems, problem_key
+from feedback_app.llm_client import chat_completion
+from feedback_app.prompt_builder import build_initial_feedback_messages
+
+HINT_BANK_PATH = os.path.join("data", "hint_bank.json.gz")
+MAX_HINT_CHARS = 900
+
+
+# ----------- OFFLINE PRECOMPUTE -----------
+
+_NUMBER = r"\d+(?:\.\d+)?"
+_ONES = ("zero one two three four five six seven eight nine ten eleven twelve thirteen fourteen "
+         "fifteen sixteen seventeen eighteen nineteen").split()
+_TENS = "twenty thirty forty fifty sixty seventy eighty ninety".split()
+
+
+def _final_answer(solution):
+    # Last number of the official solution, which a starter hint must never mention
+    numbers = re.findall(_NUMBER, solution or "")
+    return numbers[-1] if numbers else None
+
+
+def _key_values(solution):
+    # The final answer plus every value the solution derives ("= 120", not the 2 of "= 2^n")
+    values = set(re.findall(rf"=\s*\$?\s*-?\s*({_NUMBER})(?=[\s$.,;:)]|$)", solution or ""))
+    answer = _final_answer(solution)
+    return values | {answer} if answer else values
+
+
+def _final_line(solution):
+    lines = [line.strip() for line in (solution or "").splitlines() if line.strip()]
+    return lines[-1] if lines else ""
+
+
+def _final_expression(solution):
+    # \boxed{...} if the solution has one, else whatever follows the last "=" of its final line
+    boxed = re.findall(r"\\boxed\{([^{}]*)\}", solution or "")
+    if boxed:
+        return boxed[-1]
+    line = _final_line(solution)
+    return line.rsplit("=", 1)[1].strip(" .") if "=" in line else ""
+
+
+def _squash(text):
+    # Compare expressions ignoring case, spacing and TeX math delimiters
+    return re.sub(r"[\s$]+", "", (text or "").lower())
+
+
+def number_words(n):
+    """English words for a non-negative integer: 42 -> "forty two" (hyphens as spaces, no "and")."""
+    if n < 20:
+        return _ONES[n]
+    if n < 100:
+        return _TENS[n // 10 - 2] + (f" {_ONES[n % 10]}" if n % 10 else "")
+    for size, name in ((10 ** 9, "billion"), (10 ** 6, "million"), (1000, "thousand"), (100, "hundred")):
+        if n >= size:
+            head, rest = divmod(n, size)
+            return f"{number_words(head)} {name}" + (f" {number_words(rest)}" if rest else "")
+
+
+def vet_hint(hint, problem, solution):
+    """
+    True if `hint` is short and gives nothing of the solution away: not the final answer or a
+    value the solution derives (as digits or spelled out), not the final expression and not
+    the final line. Values that already appear in the problem statement are allowed.
+    """
+    hint = (hint or "").strip()
+    if not hint or len(hint) > MAX_HINT_CHARS:
+        return False
+    given = set(re.findall(_NUMBER, problem or ""))
+    words = " ".join(re.sub(r"-|\band\b", " ", hint.lower()).split())
+    for value in _key_values(solution) - given:
+        if re.search(rf"(?<!\d)(?<!\d\.){re.escape(value)}(?!\.?\d)", hint):
+            return False
+        # "zero", "one" and "two" are too common in ordinary hint prose to count as a leak
+        if value.isdigit() and 3 <= int(value) < 10 ** 12 and re.search(rf"\b{number_words(int(value))}\b", words):
+            return False
+    squashed, statement = _squash(hint), _squash(problem)
+    for leak, min_length in ((_final_line(solution), 12), (_final_expression(solution), 2)):
+        leak = _squash(leak)
+        if len(leak) >= min_length and leak in squashed and leak not in statement:
+            return False
+    return True
+
+
+def generate_hints(problem, solution, variants=4, model="gpt-4o"):
+    resp = chat_completion(
+        model=model,
+        temperature=0.8,      # diversity between variants; vetting filters the rest
+        n=variants * 2,
+        messages=build_initial_feedback_messages(problem, "", solution, None, low_info=True),
+    )
+    hints = []
+    for choice in resp.choices:
+        text = (choice.message.content or "").strip()
+        if text not in hints and vet_hint(text, problem, solution):
+            hints.append(text)
+    return hints[:variants]
+
+
+def build_hint_bank(csv_path=CSV_PATH, out_path=HINT_BANK_PATH, variants=4, model="gpt-4o"):
+    bank = load_hint_bank(out_path) if os.path.exists(out_path) else {}
+    df = load_problems(csv_path, ("problem_statement", "problem_solution"))
+
+    for _, row in df.iterrows():
+        problem = row["problem_statement"]
+        if not isinstance(problem, str) or not problem.strip():
+            continue
+        key = problem_key(problem)
+        if len(bank.get(key, [])) >= variants:
+            continue
+        solution = row["problem_solution"] if isinstance(row["problem_solution"], str) else ""
+        hints = generate_hints(problem, solution, variants=variants, model=model)
+        if hints:
+            bank[key] = hints
+        print(f"{key}: {len(hints)} vetted hint(s)")
+
+    save_hint_bank(bank, out_path)
+    return bank
+
+
+def save_hint_bank(bank, path=HINT_BANK_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+        json.dump({"version": 1, "problems": bank}, f, ensure_ascii=False, separators=(",", ":"))
+    os.replace(tmp_path, path)
+
+
+# ----------- SERVING -----------
+
+_bank = None
+_bank_lock = threading.Lock()
+_rotation = {}
+
+
+def load_hint_bank(path=HINT_BANK_PATH):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        return json.load(f)["problems"]
+
+
+def _get_bank():
+    global _bank
+    with _bank_lock:
+        if _bank is None:
+            _bank = load_hint_bank(HINT_BANK_PATH) if os.path.exists(HINT_BANK_PATH) else {}
+        return _bank
+
+
+def get_starter_hint(problem):
+    """Next vetted hint variant for this problem, or None if it is missing from the bank."""
+    hints = _get_bank().get(problem_key(problem))
+    if not hints:
+        return None
+    with _bank_lock:
+        counter = _rotation.setdefault(problem_key(problem), itertools.count())
+        return hints[next(counter) % len(hints)]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute starter hints for low-information attempts.")
+    parser.add_argument("--csv", default=CSV_PATH)
+    parser.add_argument("--out", default=HINT_BANK_PATH)
+    parser.add_argument("--variants", type=int, default=4)
+    parser.add_argument("--model", default="gpt-4o")
+    args = parser.parse_args()
+    build_hint_bank(args.csv, args.out, args.variants, args.model)
@@ -1,175 +1,278 @@
-import openai
-import os
-from datetime import datetime
-import gspread
-from google.oauth2.service_account import Credentials
+import itertools
+import logging
+import time
 import streamlit as st
-import json
+import httpx
+import openai
 
-from feedback_app.prompts import INITIAL_FEEDBACK_SYSTEM_PROMPT
+from feedback_app.prompts import DIALOGUE_SUMMARY_SYSTEM_PROMPT
+from feedback_app.prompt_builder import (
+    build_initial_feedback_messages,
+    build_tutoring_messages,
+    build_followup_messages,
+    record_prompt_usage,
+)
+from feedback_app.context_budget import compact_messages
+from feedback_app.hint_bank import get_starter_hint
+from feedback_app.llm_client import chat_completion, warm_up
+from feedback_app.metrics import count_event, start_call, start_exporter
+from feedback_app.model_router import model_for, note_served, route_for
+from feedback_app.resilience import ModelUnavailable, policy_for, call as resilient_call
+from feedback_app.response_cache import get_response_cache, is_cacheable, make_cache_key, normalize_student_text
+from feedback_app.sheets import get_sheet_writer
+from feedback_app.log_store import get_log_store, new_id
+
+# The API key and connection pool settings are read from the environment by llm_client
+
+log = logging.getLogger(__name__)
+
+
+@st.cache_resource(show_spinner=False)
+def warm_llm_client():
+    # Runs once per server process: the first participant finds a warm connection,
+    # and per-call metrics start being exported (see metrics.py)
+    start_exporter()
+    return warm_up()
+
+# ----------- STREAMING HELPERS -----------
+def _stream_text(response, call_site, call, close=None):
+    # Yield only the text deltas of a streamed chat completion; the final chunk carries usage
+    usage, error = None, None
+    try:
+        for chunk in response:
+            if chunk.usage is not None:
+                usage = chunk.usage
+                record_prompt_usage(call_site, usage)
+            if chunk.choices and chunk.choices[0].delta.content:
+                call.first_token()
+                yield chunk.choices[0].delta.content
+    except (openai.APIError, httpx.HTTPError) as e:
+        # Tokens may already be on screen, so a broken stream is not retried
+        error = e
+        raise ModelUnavailable(f"stream interrupted: {e}") from e
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        # Close the HTTP response here rather than leaving an abandoned stream to the garbage
+        # collector, which may finalize it inside the connection pool's lock on another thread
+        if close is not None:
+            close()
+        call.finish(usage, error)
+
+def _close_stream(result):
+    result[0].close()
+
+def _call_model(call_site, stream, deadline, **request):
+    call = start_call(call_site, request.get("model"), stream)
+
+    def send(timeout):
+        # One HTTP attempt; deadlines, retries, hedging and the circuit breaker live in resilience.py
+        if not stream:
+            return chat_completion(max_retries=0, timeout=timeout, **request)
+        resp = chat_completion(max_retries=0, timeout=timeout, stream=True, stream_options={"include_usage": True}, **request)
+        # Wait for the first chunk here, so a slow first token counts against the deadline (and the hedge)
+        chunks = iter(resp)
+        try:
+            first = next(chunks)
+        except BaseException:
+            resp.close()
+            raise
+        return resp, itertools.chain([first], chunks)
+
+    try:
+        with call.counting_attempts():
+            resp = resilient_call(call_site, request["model"], send,
+                                  discard=_close_stream if stream else None, deadline_s=deadline)
+    except Exception as e:
+        call.finish(error=e)
+        raise
+    if stream:
+        return _stream_text(resp[1], call_site, call, close=resp[0].close)
+    record_prompt_usage(call_site, resp.usage)
+    call.finish(resp.usage)
+    return resp.choices[0].message.content
 
-# Load API key from environment
-SPREADSHEET_ID = "1LudHYryIASXAWYaqpsNhjt1HXJQ_2S52D9b_XjtJ2W0"
-openai.api_key = os.getenv("OPENAI_API_KEY")
+def _routed_completion(call_site, stream, request):
+    # (result, fell_back). The router picks the model; a primary tier that misses its
+    # deadline (or is down) hands over to the fallback
+    plan = route_for(call_site).plan()
+    started = time.monotonic()
+    missed = []
+    for i, (tier, model, deadline) in enumerate(plan):
+        if deadline is None:
+            # The last tier gets what is left of the call site's overall deadline
+            deadline = max(1.0, policy_for(call_site).deadline_s - (time.monotonic() - started))
+        try:
+            result = _call_model(call_site, stream, deadline, **dict(request, model=model))
+        except ModelUnavailable as e:
+            if i == len(plan) - 1:
+                raise
+            count_event("llm_fallbacks_total", call_site, model, error=type(e).__name__)
+            log.warning("%s: %s unavailable (%s), falling back", call_site, model, e.detail)
+            missed.append(model)
+            continue
+        note_served(call_site, tier, model, fell_back=bool(missed), missed=missed)
+        return result, bool(missed)
+
+def _completion(call_site, stream=False, **request):
+    return _routed_completion(call_site, stream, request)[0]
+
+def _store_when_complete(chunks, cache, key):
+    # Pass chunks through and cache the full text only if the stream finished
+    parts = []
+    for piece in chunks:
+        parts.append(piece)
+        yield piece
+    cache.set(key, "".join(parts))
+
+def _cached_completion(call_site, use_cache=None, stream=False, **request):
+    # Deterministic (low-temperature) requests are served from the response cache by default
+    if use_cache is None:
+        use_cache = is_cacheable(request.get("temperature"))
+    if not use_cache:
+        return _completion(call_site, stream=stream, **request)
+
+    cache = get_response_cache()
+    key = make_cache_key(**request)
+    cached = cache.get(key)
+    if cached is not None:
+        note_served(call_site, "cache", None)
+        return iter([cached]) if stream else cached
+
+    result, fell_back = _routed_completion(call_site, stream, request)
+    if fell_back:
+        # The key names the primary model; a fallback tier's reply must not be served under it
+        return result
+    if stream:
+        return _store_when_complete(result, cache, key)
+    cache.set(key, result)
+    return result
 
 # ----------- MAIN SESSION FUNCTIONS -----------
-def provide_initial_feedback(problem, student_sol, correct_solution, initial_feedback_prompt):
+def initial_feedback_request(problem, student_sol, correct_solution, initial_feedback_instructions):
+    """(low_info, request kwargs) for the initial-feedback call; shared with the batch runner."""
+    student_sol = normalize_student_text(student_sol)
     student_clean = (student_sol or "").strip().lower()
     low_info = (len(student_clean) < 20) or student_clean in {"", "hmm", "idk", "?", "i don't know", "na"}
 
-    system_msg = INITIAL_FEEDBACK_SYSTEM_PROMPT
-
-    if low_info:
-                # Even stricter instructions for empty attempts
-                user_template = """Problem:
-        {problem}
-
-        Student wrote EXACTLY:
-        <<<
-        {student_sol}
-        >>>
-
-        Official Solution (use only to guide hints; NEVER reveal it):
-        {correct_solution}
-
-        The student provided no substantive attempt. Do NOT critique non-existent steps.
-        - Say you can't evaluate yet because there are no steps.
-        - Give 1–2 concrete starter hints or guiding questions (tiny, not revealing).
-        - Invite them to try an attempt."""
-    else:
-        user_template = initial_feedback_prompt
-
-    filled = user_template.format(
-        problem=problem,
-        student_sol=student_sol,
-        correct_solution=correct_solution
+    # Empty attempts get even stricter instructions (see LOW_INFO_FEEDBACK_INSTRUCTIONS)
+    messages = build_initial_feedback_messages(
+        problem, student_sol, correct_solution, initial_feedback_instructions, low_info=low_info
     )
-
-    resp = openai.chat.completions.create(
-        model="gpt-4o",
+    return low_info, dict(
+        model=model_for("initial_feedback_low_info" if low_info else "initial_feedback"),
         temperature=0.2,      # reduce “creative guessing”
         top_p=0.2,
         presence_penalty=0.0,
-        messages=[
-            {"role": "system", "content": system_msg},
-            {"role": "user", "content": filled},
-        ],
+        messages=messages,
     )
 
-    return resp.choices[0].message.content
-
-def start_session(problem, student_sol, correct_solution, system_prompt, initial_feedback_prompt):
-    # Generate initial feedback
-    initial_feedback = provide_initial_feedback(problem, student_sol, correct_solution, initial_feedback_prompt)
-
-    tutoring_context = f"""
-        You are an AI math tutor helping a student. Here is the problem, their attempt, and the correct solution:
-
-        [PROBLEM]
-        {problem}
-        [/PROBLEM]
+def provide_initial_feedback(problem, student_sol, correct_solution, initial_feedback_instructions, stream=False, use_cache=None):
+    low_info, request = initial_feedback_request(problem, student_sol, correct_solution, initial_feedback_instructions)
 
-        [STUDENT_ATTEMPT]
-        {student_sol}
-        [/STUDENT_ATTEMPT]
-
-        [OFFICIAL_SOLUTION]
-        {correct_solution}
-        [/OFFICIAL_SOLUTION]
+    if low_info:
+        # Serve a precomputed starter hint when the bank has this problem
+        hint = get_starter_hint(problem)
+        if hint is not None:
+            note_served("initial_feedback_low_info", "hint_bank", None)
+            return iter([hint]) if stream else hint
 
-        Begin tutoring by asking clarifying questions. Do NOT reveal the correct solution directly.
-        Instead, use it internally to guide the student with subtle, progressive hints.
-    """
+    call_site = "initial_feedback_low_info" if low_info else "initial_feedback"
+    return _cached_completion(call_site, use_cache=use_cache, stream=stream, **request)
 
-    messages = [
-        {"role": "system", "content": system_prompt + "\n" + tutoring_context},
-        {"role": "assistant", "content": initial_feedback}
-    ]
+def start_session(problem, student_sol, correct_solution, system_prompt, initial_feedback_instructions):
+    # Generate initial feedback
+    initial_feedback = provide_initial_feedback(problem, student_sol, correct_solution, initial_feedback_instructions)
+    messages = build_tutoring_messages(problem, student_sol, correct_solution, system_prompt, initial_feedback)
 
     return initial_feedback, messages
 
 
-def continue_session(messages):
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=messages
+def continue_session(messages, stream=False):
+    return _completion("tutoring_turn", stream=stream, model=model_for("tutoring_turn"), messages=messages)
+
+def summarize_dialogue(previous_summary, messages):
+    dialogue = "\n\n".join(
+        f"{'Tutor' if m['role'] == 'assistant' else 'Student'}: {m['content']}" for m in messages
     )
-    return response.choices[0].message.content
+    if previous_summary:
+        dialogue = f"Summary so far:\n{previous_summary}\n\nLater turns:\n{dialogue}"
+    try:
+        return _completion(
+            "dialogue_summary",
+            model=model_for("dialogue_summary"),
+            temperature=0.2,
+            messages=[
+                {"role": "system", "content": DIALOGUE_SUMMARY_SYSTEM_PROMPT},
+                {"role": "user", "content": dialogue}
+            ]
+        )
+    except Exception as e:
+        # Never block tutoring on the summary: keep a clipped transcript instead
+        log.warning("Dialogue summary failed, clipping turns instead: %s", e)
+        clipped = [f"{'Tutor' if m['role'] == 'assistant' else 'Student'}: {m['content'][:200]}" for m in messages]
+        return "\n".join(filter(None, [previous_summary] + clipped))
+
+
+def compact_history(messages):
+    # Keep each tutoring request within the context budget (see context_budget.py)
+    return compact_messages(messages, summarize_dialogue)
 
 # ----------- FOLLOW-UP EVALUATION -----------
 
-def evaluate_followup(problem, student_response, correct_solution, evaluation_prompt):
-    filled_prompt = evaluation_prompt.format(
-        statement = problem.strip(),
-        solution=correct_solution.strip(),
-        student_response=student_response.strip()
+def followup_request(student_response, correct_solution, evaluation_instructions):
+    # The grader sees only the official solution and the answer, as before
+    messages = build_followup_messages(
+        normalize_student_text(student_response),
+        correct_solution,
+        evaluation_instructions
     )
-
-    response = openai.chat.completions.create(
-        model="gpt-4o",
-        messages=[
-            {"role": "system", "content": "You are an objective math tutor evaluating student answers."},
-            {"role": "user", "content": filled_prompt}
-        ]
+    return dict(
+        model=model_for("followup_grading"),
+        messages=messages
     )
 
-    return response.choices[0].message.content
+def evaluate_followup(problem, student_response, correct_solution, evaluation_instructions, use_cache=None):
+    # `problem` is kept for callers/logs
+    request = followup_request(student_response, correct_solution, evaluation_instructions)
+    return _cached_completion("followup_grading", use_cache=use_cache, **request)
 
 # ----------- LOGGING -----------
 
-def save_session_log(problem, student_attempt, correct_solution, messages, tag=None, notes=None):
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    log_dir = "tutoring_logs"
-    os.makedirs(log_dir, exist_ok=True)
-    filename = os.path.join(log_dir, f"session_{timestamp}.txt")
-
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("=== Main Tutoring Session ===\n")
-        f.write(f"Problem: {problem}\n\n")
-        f.write(f"Student Attempt: {student_attempt}\n\n")
-        f.write(f"Correct Solution: {correct_solution}\n\n")
-        f.write("Dialogue:\n")
-        for msg in messages:
-            role = "GPT" if msg["role"] == "assistant" else "Student"
-            f.write(f"{role}: {msg['content']}\n\n")
-
-        if tag or notes:
-            f.write("\n=== Researcher Annotation ===\n")
-            if tag:
-                f.write(f"Tag: {tag}\n")
-            if notes:
-                f.write(f"Notes: {notes}\n")
-
-    print(f"Main session saved to {filename}")
-
-def save_followup_log(problem, student_response, correct_solution, feedback):
-    timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-    log_dir = "checkup_logs"
-    os.makedirs(log_dir, exist_ok=True)
-    filename = os.path.join(log_dir, f"followup_{timestamp}.txt")
-
-    with open(filename, "w", encoding="utf-8") as f:
-        f.write("=== Similar Problem Evaluation ===\n")
-        f.write(f"Problem: {problem}\n\n")
-        f.write(f"Student Response: {student_response}\n\n")
-        f.write(f"Correct Solution: {correct_solution}\n\n")
-        f.write(f"GPT Feedback:\n{feedback}\n")
-
-    print(f"Follow-up log saved to {filename}")
+def save_session_log(problem, student_attempt, correct_solution, messages, tag=None, notes=None, session_id=None):
+    session_id = session_id or new_id("session")
+    get_log_store("tutoring_logs", "session").append(session_id, {
+        "kind": "main_tutoring_session",
+        "problem": problem,
+        "student_attempt": student_attempt,
+        "correct_solution": correct_solution,
+        "dialogue": [{"role": m["role"], "content": m["content"]} for m in messages],
+        "tag": tag,
+        "notes": notes,
+    })
+
+    print(f"Main session {session_id} saved to tutoring_logs")
+    return session_id
+
+def save_followup_log(problem, student_response, correct_solution, feedback, session_id=None):
+    session_id = session_id or new_id("followup")
+    get_log_store("checkup_logs", "followup").append(session_id, {
+        "kind": "similar_problem_evaluation",
+        "problem": problem,
+        "student_response": student_response,
+        "correct_solution": correct_solution,
+        "feedback": feedback,
+    })
+
+    print(f"Follow-up log {session_id} saved to checkup_logs")
+    return session_id
 
 def save_session_to_google_sheet(data):
-    # Connect to your Google Sheet
-    scopes = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
-    creds_dict = st.secrets["gcp_service_account"]
-    creds = Credentials.from_service_account_info(dict(creds_dict), scopes=scopes)
-    client = gspread.authorize(creds)
-
-    sheet = client.open_by_key(SPREADSHEET_ID).sheet1  # or specific worksheet
-
-    if sheet.row_count == 0 or sheet.cell(1, 1).value == "":
-        sheet.append_row(list(data.keys()))
-
-    sheet.append_row(list(data.values()))
+    # Shared writer: one authorized client per process; rows queued by other sessions go out in the same batch
+    writer = get_sheet_writer()
+    writer.append(data)
+    writer.flush()
 
 
 
@@ -0,0 +1,137 @@
+# llm_client.py
+#
+# One process-wide OpenAI client (plus an asyncio twin) sharing a pooled, keep-alive
+# HTTP transport, so every Streamlit session in the worker reuses warm sockets.
+
+import os
+import threading
+from dataclasses import dataclass
+
+import httpx
+import openai
+
+from feedback_app.metrics import acount_http_attempt, count_http_attempt
+
+
+@dataclass(frozen=True)
+class LLMConfig:
+    api_key: str = None
+    base_url: str = None
+    max_connections: int = 100           # total sockets the pool may open
+    max_keepalive_connections: int = 50  # idle sockets kept warm between calls
+    keepalive_expiry: float = 120.0      # seconds an idle socket stays open
+    connect_timeout: float = 5.0
+    read_timeout: float = 60.0
+    max_retries: int = 2
+
+    @classmethod
+    def from_env(cls):
+        env = os.environ
+        return cls(
+            api_key=env.get("OPENAI_API_KEY"),
+            base_url=env.get("OPENAI_BASE_URL") or None,
+            max_connections=int(env.get("LLM_MAX_CONNECTIONS", cls.max_connections)),
+            max_keepalive_connections=int(env.get("LLM_MAX_KEEPALIVE", cls.max_keepalive_connections)),
+            keepalive_expiry=float(env.get("LLM_KEEPALIVE_EXPIRY", cls.keepalive_expiry)),
+            connect_timeout=float(env.get("LLM_CONNECT_TIMEOUT", cls.connect_timeout)),
+            read_timeout=float(env.get("LLM_READ_TIMEOUT", cls.read_timeout)),
+            max_retries=int(env.get("LLM_MAX_RETRIES", cls.max_retries)),
+        )
+
+    def limits(self):
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    def timeout(self):
+        return httpx.Timeout(self.read_timeout, connect=self.connect_timeout)
+
+
+_lock = threading.Lock()
+_config = None
+_client = None
+_async_client = None
+
+
+def configure(config=None, client=None, async_client=None):
+    """Replace the shared configuration and/or clients (e.g. a fake backend in tests)."""
+    global _config, _client, _async_client
+    with _lock:
+        if _client is not None and _client is not client:
+            _client.close()
+        _config = config
+        _client = client
+        _async_client = async_client
+
+
+def get_config():
+    global _config
+    with _lock:
+        if _config is None:
+            _config = LLMConfig.from_env()
+        return _config
+
+
+def get_client():
+    global _client
+    config = get_config()
+    with _lock:
+        if _client is None:
+            _client = openai.OpenAI(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                max_retries=config.max_retries,
+                timeout=config.timeout(),
+                http_client=httpx.Client(
+                    limits=config.limits(),
+                    timeout=config.timeout(),
+                    # Every attempt, including the client's own retries, is counted per call (metrics.py)
+                    event_hooks={"request": [count_http_attempt]},
+                ),
+            )
+        return _client
+
+
+def get_async_client():
+    global _async_client
+    config = get_config()
+    with _lock:
+        if _async_client is None:
+            _async_client = openai.AsyncOpenAI(
+                api_key=config.api_key,
+                base_url=config.base_url,
+                max_retries=config.max_retries,
+                timeout=config.timeout(),
+                http_client=httpx.AsyncClient(
+                    limits=config.limits(),
+                    timeout=config.timeout(),
+                    event_hooks={"request": [acount_http_attempt]},
+                ),
+            )
+        return _async_client
+
+
+def warm_up():
+    """Open (and keep alive) a connection to the API so the first participant skips TLS setup."""
+    try:
+        get_client().models.list()
+        return True
+    except Exception as e:
+        print(f"LLM client warm-up failed: {e}")
+        return False
+
+
+# ----------- CALL HELPERS -----------
+
+def chat_completion(max_retries=None, **kwargs):
+    client = get_client()
+    if max_retries is not None:
+        # A per-call copy sharing the same connection pool
+        client = client.with_options(max_retries=max_retries)
+    return client.chat.completions.create(**kwargs)
+
+
+async def achat_completion(**kwargs):
+    return await get_async_client().chat.completions.create(**kwargs)
@@ -0,0 +1,190 @@
+# log_store.py
+#
+# Structured, append-only JSONL log store. Records carry a schema version and a
+# key (session or student id); segments rotate by size and age, rotated segments
+# are gzip-compressed, and a small SQLite index maps each key to the (segment,
+# offset, length) of its records so one session is fetched without a full scan.
+#
+# Several worker processes may write to the same directory: each process appends
+# only to its own segments (the pid is part of the name) and is the only one that
+# rotates and compresses them, and the shared index is SQLite, which serializes
+# writers across processes. Compression publishes the .gz atomically before the
+# plain segment is removed, and readers that lose that race retry on the .gz.
+# Concurrent sessions inside one process are serialized by a lock.
+
+import contextlib
+import gzip
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime
+
+SCHEMA_VERSION = 1
+
+
+def new_id(prefix):
+    """Sortable, collision-free id such as user_20250804_013306_3f9a1c2b7d4e."""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:12]}"
+
+
+class LogStore:
+    def __init__(self, directory, name, max_bytes=16 * 1024 * 1024, max_age_seconds=24 * 3600):
+        self.directory = directory
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self._lock = threading.Lock()
+        self._file = None
+        self._segment = None
+        self._opened_at = None
+
+        os.makedirs(directory, exist_ok=True)
+        # Other processes' index writes hold the lock briefly; wait for them rather than fail
+        self._index = sqlite3.connect(os.path.join(directory, f"{name}.index.sqlite"), check_same_thread=False,
+                                      timeout=30)
+        self._index.execute("PRAGMA journal_mode=WAL")
+        self._index.execute("PRAGMA synchronous=NORMAL")
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT NOT NULL, segment TEXT NOT NULL, offset INTEGER NOT NULL, length INTEGER NOT NULL)"
+        )
+        self._index.execute("CREATE INDEX IF NOT EXISTS entries_key ON entries(key)")
+        self._index.commit()
+
+    # ----------- WRITING -----------
+
+    def append(self, key, record):
+        """Append one record under `key`; returns the record as written."""
+        record = {"schema_version": SCHEMA_VERSION, "id": key, "ts": str(datetime.now()), **record}
+        line = (json.dumps(record, ensure_ascii=False) + "\n").encode("utf-8")
+        with self._lock:
+            self._rotate_if_needed()
+            offset = self._file.tell()
+            self._file.write(line)
+            self._file.flush()
+            self._index.execute(
+                "INSERT INTO entries (key, segment, offset, length) VALUES (?, ?, ?, ?)",
+                (key, self._segment, offset, len(line)),
+            )
+            self._index.commit()
+        return record
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def _rotate_if_needed(self):
+        if self._file is not None:
+            too_big = self._file.tell() >= self.max_bytes
+            too_old = time.time() - self._opened_at >= self.max_age_seconds
+            if not (too_big or too_old):
+                return
+            self._file.close()
+            self._compress(self._segment)
+
+        # Microsecond timestamp keeps segments in write order when sorted by name
+        self._segment = f"{self.name}-{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.jsonl"
+        self._file = open(os.path.join(self.directory, self._segment), "ab")
+        self._opened_at = time.time()
+
+    def _compress(self, segment):
+        path = os.path.join(self.directory, segment)
+        tmp_path = f"{path}.gz.tmp"
+        with open(path, "rb") as src, gzip.open(tmp_path, "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.replace(tmp_path, path + ".gz")
+        # Offsets stay valid: they address the decompressed stream
+        self._index.execute("UPDATE entries SET segment = ? WHERE segment = ?", (segment + ".gz", segment))
+        self._index.commit()
+        os.remove(path)
+
+    # ----------- READING -----------
+
+    def get(self, key):
+        """All records stored under `key`, in write order."""
+        # Held for the whole read so this process's rotation cannot compress a segment away under us;
+        # other processes' rotations are handled by _open_segment
+        with self._lock:
+            if self._file is not None:
+                self._file.flush()
+            rows = self._index.execute(
+                "SELECT segment, offset, length FROM entries WHERE key = ? ORDER BY rowid", (key,)
+            ).fetchall()
+
+            records = []
+            handles = {}
+            try:
+                for segment, offset, length in rows:
+                    if segment not in handles:
+                        handles[segment] = self._open_segment(segment)
+                    f = handles[segment]
+                    f.seek(offset)
+                    records.append(json.loads(f.read(length)))
+            finally:
+                for f in handles.values():
+                    f.close()
+        return records
+
+    def _open_segment(self, segment, text=False):
+        options = {"mode": "rt", "encoding": "utf-8"} if text else {"mode": "rb"}
+        path = os.path.join(self.directory, segment)
+        if not segment.endswith(".gz"):
+            try:
+                return open(path, **options)
+            except FileNotFoundError:
+                # Compressed by its writer (possibly another process) since we looked it up
+                path += ".gz"
+        return gzip.open(path, **options)
+
+    def keys(self):
+        with self._lock:
+            return [k for (k,) in self._index.execute("SELECT DISTINCT key FROM entries")]
+
+    def iter_records(self):
+        """Every record in every segment (oldest segment first), without using the index."""
+        names = set(os.listdir(self.directory))
+        for segment in sorted(names):
+            if not segment.startswith(self.name + "-") or not segment.endswith((".jsonl", ".jsonl.gz")):
+                continue
+            if segment + ".gz" in names:
+                continue    # caught mid-compression: the .gz is complete, read that one
+            with self._open_segment(segment, text=True) as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_log_store(directory, name):
+    with _stores_lock:
+        if (directory, name) not in _stores:
+            _stores[(directory, name)] = LogStore(directory, name)
+        return _stores[(directory, name)]
+
+
+@contextlib.contextmanager
+def isolated_stores():
+    """
+    Stores opened inside the block are private to it and closed when it exits; the
+    process-wide ones are set aside meanwhile. For runs in a scratch directory (the
+    benchmarks), so no cached store is left pointing at a directory that is gone.
+    """
+    global _stores
+    with _stores_lock:
+        saved, _stores = _stores, {}
+    try:
+        yield
+    finally:
+        with _stores_lock:
+            scratch, _stores = _stores, saved
+        for store in scratch.values():
+            store.close()
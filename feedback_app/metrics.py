@@ -0,0 +1,261 @@
+# metrics.py
+#
+# Per-call instrumentation of model requests: wall time, time to first token
+# (streaming), prompt/completion/cached tokens, HTTP retries and errors, labelled by
+# call site, model and study task (Easy/Medium/Hard). Everything is kept in memory in
+# a small Prometheus-style registry and exported as a text file (node_exporter
+# textfile format) and, optionally, on a local /metrics HTTP endpoint.
+#
+#     METRICS_TEXTFILE=metrics/llm.prom   (empty to disable)
+#     METRICS_PORT=9109                   (unset to disable)
+
+import contextlib
+import contextvars
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0, 64.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", os.path.join("metrics", "llm.prom"))
+METRICS_PORT = os.getenv("METRICS_PORT", "")
+EXPORT_INTERVAL = float(os.getenv("METRICS_EXPORT_INTERVAL", "15"))
+
+HELP = {
+    "llm_requests_total": ("counter", "Model calls by outcome."),
+    "llm_errors_total": ("counter", "Failed model calls by exception type."),
+    "llm_retries_total": ("counter", "HTTP attempts beyond the first (retries and hedges, see resilience.py)."),
+    "llm_tokens_total": ("counter", "Tokens by kind (prompt, completion, cached)."),
+    "llm_request_duration_seconds": ("histogram", "Wall time from request to last token."),
+    "llm_time_to_first_token_seconds": ("histogram", "Time from request to the first streamed token."),
+    "llm_prompt_tokens": ("histogram", "Prompt tokens per call."),
+    "llm_hedged_requests_total": ("counter", "Duplicate requests sent because an attempt outlived the recent p95."),
+    "llm_hedge_wins_total": ("counter", "Hedged attempts by which request answered first."),
+    "llm_circuit_rejections_total": ("counter", "Calls refused without a request because the model's circuit was open."),
+    "llm_circuit_opens_total": ("counter", "Times a model's circuit opened after repeated failures."),
+    "llm_backoff_retries_total": ("counter", "Attempts retried after a backoff sleep, by error type."),
+    "llm_fallbacks_total": ("counter", "Calls handed to the route's fallback tier, by the model that missed."),
+}
+
+# Study task the current script run (or background task) is working on
+_task_label = contextvars.ContextVar("llm_task_label", default="none")
+# HTTP attempts made for the model call in progress; bumped by the llm_client transport hooks
+_attempts = contextvars.ContextVar("llm_http_attempts", default=None)
+
+
+def set_task_label(label):
+    _task_label.set(label or "none")
+
+
+@contextlib.contextmanager
+def task_label(label):
+    token = _task_label.set(label or "none")
+    try:
+        yield
+    finally:
+        _task_label.reset(token)
+
+
+def count_http_attempt(request=None):
+    counter = _attempts.get()
+    if counter is not None:
+        counter[0] += 1
+
+
+async def acount_http_attempt(request=None):
+    count_http_attempt(request)
+
+
+# ----------- REGISTRY -----------
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(labels, **extra):
+    items = list(labels) + sorted(extra.items())
+    if not items:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in items) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    def inc(self, name, labels, value=1):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, buckets=LATENCY_BUCKETS):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram(buckets)
+            self.histograms[key].observe(value)
+
+    def render(self):
+        """Prometheus text exposition format."""
+        with self._lock:
+            series = {}
+            for (name, labels), value in self.counters.items():
+                series.setdefault(name, []).append(f"{name}{_labels(labels)} {value}")
+            for (name, labels), h in self.histograms.items():
+                lines = series.setdefault(name, [])
+                for bound, count in zip(h.buckets, h.counts):
+                    lines.append(f"{name}_bucket{_labels(labels, le=bound)} {count}")
+                lines.append(f"{name}_bucket{_labels(labels, le='+Inf')} {h.count}")
+                lines.append(f"{name}_sum{_labels(labels)} {round(h.sum, 6)}")
+                lines.append(f"{name}_count{_labels(labels)} {h.count}")
+        out = []
+        for name in sorted(series):
+            kind, text = HELP.get(name, ("untyped", ""))
+            out += [f"# HELP {name} {text}", f"# TYPE {name} {kind}", *series[name]]
+        return "\n".join(out) + "\n"
+
+
+_registry = Registry()
+
+
+def get_registry():
+    return _registry
+
+
+# ----------- ONE MODEL CALL -----------
+
+class LLMCall:
+    def __init__(self, call_site, model, stream=False, registry=None):
+        self.labels = {"call_site": call_site, "model": model or "unknown", "task": _task_label.get()}
+        self.stream = stream
+        self.registry = registry or _registry
+        self.started = time.perf_counter()
+        self.ttft = None
+        self.http_attempts = [0]
+        self.finished = False
+
+    @contextlib.contextmanager
+    def counting_attempts(self):
+        # Wrap the client call so retries made inside the OpenAI client are counted
+        token = _attempts.set(self.http_attempts)
+        try:
+            yield
+        finally:
+            _attempts.reset(token)
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.started
+
+    def finish(self, usage=None, error=None):
+        if self.finished:
+            return
+        self.finished = True
+        r, labels = self.registry, self.labels
+        r.observe("llm_request_duration_seconds", dict(labels, stream=str(self.stream).lower()),
+                  time.perf_counter() - self.started)
+        if self.ttft is not None:
+            r.observe("llm_time_to_first_token_seconds", labels, self.ttft)
+        if self.http_attempts[0] > 1:
+            r.inc("llm_retries_total", labels, self.http_attempts[0] - 1)
+        if error is not None:
+            r.inc("llm_requests_total", dict(labels, outcome="error"))
+            r.inc("llm_errors_total", dict(labels, error=type(error).__name__))
+            return
+        r.inc("llm_requests_total", dict(labels, outcome="ok"))
+        if usage is not None:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+            r.inc("llm_tokens_total", dict(labels, kind="prompt"), usage.prompt_tokens or 0)
+            r.inc("llm_tokens_total", dict(labels, kind="completion"), usage.completion_tokens or 0)
+            r.inc("llm_tokens_total", dict(labels, kind="cached"), cached)
+            r.observe("llm_prompt_tokens", labels, usage.prompt_tokens or 0, TOKEN_BUCKETS)
+
+
+def start_call(call_site, model, stream=False):
+    return LLMCall(call_site, model, stream)
+
+
+def count_event(name, call_site, model, **labels):
+    _registry.inc(name, {"call_site": call_site, "model": model or "unknown", "task": _task_label.get(), **labels})
+
+
+# ----------- EXPORT -----------
+
+def write_textfile(path=METRICS_TEXTFILE):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(_registry.render())
+    # Atomic swap so a scraper never reads a half-written file
+    os.replace(tmp_path, path)
+
+
+def serve(port, host="127.0.0.1"):
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = _registry.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, name="metrics-http", daemon=True).start()
+    return httpd
+
+
+_exporter_started = False
+_exporter_lock = threading.Lock()
+
+
+def _export_loop(path, interval):
+    while True:
+        time.sleep(interval)
+        try:
+            write_textfile(path)
+        except OSError as e:
+            print(f"Writing metrics to {path} failed: {e}")
+
+
+def start_exporter(textfile=METRICS_TEXTFILE, port=METRICS_PORT, interval=EXPORT_INTERVAL):
+    """Start the periodic textfile writer and the optional HTTP endpoint (once per process)."""
+    global _exporter_started
+    with _exporter_lock:
+        if _exporter_started:
+            return
+        _exporter_started = True
+    if textfile:
+        threading.Thread(target=_export_loop, args=(textfile, interval), name="metrics-textfile", daemon=True).start()
+    if port:
+        try:
+            serve(int(port))
+        except OSError as e:
+            print(f"Metrics endpoint on port {port} unavailable: {e}")
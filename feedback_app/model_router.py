@@ -0,0 +1,99 @@
+# model_router.py
+#
+# Which model serves each call site. Every call site is mapped to a tier (a model)
+# and a latency SLO: the primary tier gets `deadline_s` seconds (to the first token
+# when streaming, to the full reply otherwise), and if it misses the deadline the
+# request is re-sent to the route's fallback tier, or fails if the route has none.
+# Cheap call sites (the low-info nudge, the one-per-task grader, dialogue summaries)
+# go to the fast tier directly.
+# The tier that actually served each request is reported to whoever collects routes
+# for the current script run (see record_routes), which the page puts in the task log.
+#
+#     MODEL_TIER_QUALITY=gpt-4o
+#     MODEL_TIER_FAST=gpt-4o-mini
+#     MODEL_ROUTES='{"followup_grading": {"tier": "quality", "deadline_s": 20}}'
+
+import contextlib
+import contextvars
+import json
+import os
+from dataclasses import dataclass, replace
+
+TIERS = {
+    "quality": os.getenv("MODEL_TIER_QUALITY", "gpt-4o"),
+    "fast": os.getenv("MODEL_TIER_FAST", "gpt-4o-mini"),
+}
+
+
+@dataclass(frozen=True)
+class Route:
+    tier: str
+    deadline_s: float          # SLO for the primary tier
+    fallback: str = None       # tier to retry on when the deadline is missed
+
+    def plan(self):
+        """[(tier, model, deadline)] in the order they are tried; None means the call site's overall deadline."""
+        steps = [(self.tier, TIERS[self.tier], self.deadline_s)]
+        if self.fallback:
+            steps.append((self.fallback, TIERS[self.fallback], None))
+        return steps
+
+
+DEFAULT_ROUTES = {
+    "initial_feedback": Route("quality", 12.0, fallback="fast"),
+    "initial_feedback_low_info": Route("fast", 8.0),
+    "tutoring_turn": Route("quality", 6.0, fallback="fast"),
+    "followup_grading": Route("fast", 15.0),
+    "dialogue_summary": Route("fast", 10.0),
+}
+
+
+def _load_routes():
+    routes = dict(DEFAULT_ROUTES)
+    overrides = os.getenv("MODEL_ROUTES")
+    if overrides:
+        for call_site, fields in json.loads(overrides).items():
+            base = routes.get(call_site, Route("quality", 30.0))
+            routes[call_site] = replace(base, **fields)
+    for call_site, route in routes.items():
+        for tier in (route.tier, route.fallback):
+            if tier is not None and tier not in TIERS:
+                raise ValueError(f"route {call_site!r} uses unknown tier {tier!r}")
+    return routes
+
+
+ROUTES = _load_routes()
+
+
+def route_for(call_site):
+    # Unlisted call sites (e.g. the batch runner's) stay on the quality tier without a deadline
+    return ROUTES.get(call_site, Route("quality", None))
+
+
+def model_for(call_site):
+    return TIERS[route_for(call_site).tier]
+
+
+# ----------- SERVED-BY RECORDS -----------
+
+# List the current script run (and background tasks it submits) appends route records to
+_routes = contextvars.ContextVar("served_routes", default=None)
+
+
+@contextlib.contextmanager
+def record_routes(into):
+    """Append a record of every model request made inside the block to the list `into`."""
+    token = _routes.set(into)
+    try:
+        yield into
+    finally:
+        _routes.reset(token)
+
+
+def note_served(call_site, tier, model, fell_back=False, missed=None):
+    records = _routes.get()
+    if records is not None:
+        record = {"call_site": call_site, "tier": tier, "model": model, "fell_back": fell_back}
+        if missed:
+            record["missed"] = missed
+        records.append(record)
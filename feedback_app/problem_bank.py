@@ -0,0 +1,280 @@
+# problem_bank.py
+#
+# The problem CSV as a bank of Problem records with in-memory indexes, built once
+# per server process (and again only when the CSV changes, like dataset.py). Each
+# problem has a stable id (the forum thread id, not a row position), and every
+# indexed field maps a value to the matching ids, so a lookup is one dict access
+# and a composite query ("week 5 relations, medium") intersects a few small sets.
+#
+# Indexed fields: week, category, subcategory, exercise, work_score, difficulty
+# (curated: set only for the problems the study designers labelled, see
+# STUDY_TASKS), length_tier (short / medium / long by tertile of the official
+# solution's length, for every problem), topic (words of the subcategory, e.g.
+# "relations") and key (dataset.problem_key of the statement, shared with the hint
+# bank and analytics).
+#
+#     python -m feedback_app.problem_bank "week 10 counting, hard"
+
+import functools
+import math
+import os
+import random
+import re
+from dataclasses import dataclass
+
+from feedback_app.dataset import CSV_PATH, load_problems, problem_key
+
+BANK_COLUMNS = (
+    "thread_id", "week_number", "category", "subcategory", "exercise_number", "work_score",
+    "problem_statement", "problem_solution", "new_problem", "new_solution", "title", "question",
+)
+INDEXED_FIELDS = (
+    "week", "category", "subcategory", "exercise", "work_score", "difficulty", "length_tier", "topic", "key",
+)
+DIFFICULTIES = ("Easy", "Medium", "Hard")
+LENGTH_TIERS = ("short", "medium", "long")
+
+# The study's task sequence: (problem id, difficulty as labelled by the study designers)
+STUDY_TASKS = (("10896", "Easy"), ("71233", "Medium"), ("12342", "Hard"))
+
+# Words of a subcategory ("Week5 : Relations - Sequences") that say nothing about the topic
+_TOPIC_STOPWORDS = {"week", "w", "to", "and", "intro", "the", "of"}
+
+
+@dataclass(frozen=True)
+class Problem:
+    id: str
+    key: str
+    week: int = None
+    category: str = None
+    subcategory: str = None
+    exercise: int = None
+    work_score: float = None
+    difficulty: str = None      # curated label; None for problems nobody labelled
+    length_tier: str = None
+    problem: str = ""
+    solution: str = ""
+    similar_problem: str = ""
+    similar_solution: str = ""
+    title: str = ""             # the forum post the problem was taken from
+    question: str = ""
+
+    @property
+    def topics(self):
+        return topic_words(self.subcategory)
+
+
+def topic_words(text):
+    words = re.findall(r"[a-z]+", (text or "").lower())
+    return tuple(dict.fromkeys(w for w in words if w not in _TOPIC_STOPWORDS and len(w) > 2))
+
+
+def _clean(value):
+    if value is None or (isinstance(value, float) and math.isnan(value)):
+        return None
+    return value.strip() if isinstance(value, str) else value
+
+
+def _as_int(value):
+    value = _clean(value)
+    return int(value) if value is not None else None
+
+
+def _length_tiers(solutions):
+    """
+    short / medium / long by tertile of the official solution's length in words, relative
+    to the rest of the bank; problems without a solution get no tier. A rough proxy for
+    effort, not a difficulty rating.
+    """
+    lengths = sorted(len(s.split()) for s in solutions if s)
+    if not lengths:
+        return [None] * len(solutions)
+    low, high = lengths[len(lengths) // 3], lengths[2 * len(lengths) // 3]
+    tiers = []
+    for s in solutions:
+        n = len(s.split()) if s else None
+        tiers.append(None if n is None else "short" if n < low else "medium" if n < high else "long")
+    return tiers
+
+
+# ----------- THE BANK -----------
+
+class ProblemBank:
+    def __init__(self, problems):
+        self.problems = list(problems)
+        self.by_id = {p.id: p for p in self.problems}
+        if len(self.by_id) != len(self.problems):
+            raise ValueError("problem ids are not unique")
+        self.indexes = {field: {} for field in INDEXED_FIELDS}
+        for p in self.problems:
+            for field in INDEXED_FIELDS:
+                for value in self._values(p, field):
+                    self.indexes[field].setdefault(value, []).append(p.id)
+        # Frozen sets for fast intersection; lists keep the CSV order for results
+        self._sets = {f: {v: frozenset(ids) for v, ids in index.items()} for f, index in self.indexes.items()}
+        self._order = {p.id: i for i, p in enumerate(self.problems)}
+
+    @staticmethod
+    def _values(problem, field):
+        if field == "topic":
+            return problem.topics
+        value = getattr(problem, field)
+        if value is None:
+            return ()
+        return (value.lower(),) if isinstance(value, str) else (value,)
+
+    def __len__(self):
+        return len(self.problems)
+
+    def get(self, problem_id):
+        """The problem with this id; KeyError if there is none."""
+        return self.by_id[str(problem_id)]
+
+    def lookup(self, field, value):
+        """Ids whose `field` equals `value` (case-insensitive for text), in CSV order."""
+        if field not in self.indexes:
+            raise ValueError(f"{field!r} is not indexed; choose from {', '.join(INDEXED_FIELDS)}")
+        return list(self.indexes[field].get(value.lower() if isinstance(value, str) else value, ()))
+
+    def values(self, field):
+        return sorted(self.indexes[field], key=str)
+
+    def _ids(self, field, options):
+        if field not in self._sets:
+            raise ValueError(f"{field!r} is not indexed; choose from {', '.join(INDEXED_FIELDS)}")
+        index = self._sets[field]
+        return frozenset().union(*(index.get(o.lower() if isinstance(o, str) else o, frozenset()) for o in options))
+
+    def query(self, topics=(), **criteria):
+        """
+        Problems matching every criterion; a list or tuple value matches any of its items,
+        while `topics` must all match. query(week=5, topic="relations", difficulty="Medium"),
+        query(week=[10, 11], category="labs"), query(topics=["advanced", "counting"])
+        """
+        candidates = [self._ids("topic", [t]) for t in topics]
+        for field, wanted in criteria.items():
+            if wanted is not None:
+                candidates.append(self._ids(field, wanted if isinstance(wanted, (list, tuple, set, frozenset)) else [wanted]))
+        matched = None
+        # Smallest candidate sets first, so intersections stay small
+        for ids in sorted(candidates, key=len):
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return []
+        if matched is None:
+            return list(self.problems)
+        return [self.by_id[i] for i in sorted(matched, key=self._order.__getitem__)]
+
+    def search(self, text):
+        return self.query(**parse_query(text, self))
+
+    def draw(self, plan, seed):
+        """
+        One distinct problem per criteria dict in `plan`, drawn reproducibly for `seed`
+        (e.g. a student id), so each participant can get their own task set.
+        """
+        rng = random.Random(seed)
+        chosen = []
+        for criteria in plan:
+            pool = [p for p in self.query(**criteria) if p not in chosen]
+            if not pool:
+                raise LookupError(f"no unused problem matches {criteria}")
+            chosen.append(rng.choice(pool))
+        return chosen
+
+
+# ----------- QUERY STRINGS -----------
+
+_NUMBERED = re.compile(r"\b(week|w|exercise|ex|score)\s*(\d+)\b")
+
+
+def parse_query(text, bank=None):
+    """
+    "week 5 relations, medium" -> {"week": 5, "topic": "relations", "difficulty": "Medium"}.
+    Difficulty words match the curated labels, "short" / "long" the length tier; words
+    naming a category of `bank` filter on it; every other word is a topic.
+    """
+    text = (text or "").lower()
+    criteria = {}
+    fields = {"week": "week", "w": "week", "exercise": "exercise", "ex": "exercise", "score": "work_score"}
+    for name, number in _NUMBERED.findall(text):
+        criteria[fields[name]] = int(number)
+    text = _NUMBERED.sub(" ", text)
+    categories = {c.rstrip("s"): c for c in bank.values("category")} if bank is not None else {}
+    topics = []
+    for word in re.findall(r"[a-z]+", text):
+        if word.capitalize() in DIFFICULTIES:
+            criteria["difficulty"] = word.capitalize()
+        elif word in LENGTH_TIERS:
+            criteria["length_tier"] = word
+        elif word.rstrip("s") in categories:
+            criteria["category"] = categories[word.rstrip("s")]
+        elif word not in _TOPIC_STOPWORDS and len(word) > 2:
+            topics.append(word)
+    if len(topics) == 1:
+        criteria["topic"] = topics[0]
+    elif topics:
+        criteria["topics"] = topics
+    return criteria
+
+
+def build_bank(df, difficulties=None):
+    """`difficulties` maps problem id -> curated difficulty label (default: STUDY_TASKS)."""
+    difficulties = dict(STUDY_TASKS) if difficulties is None else difficulties
+    rows = [r for r in df.itertuples(index=False) if isinstance(r.problem_statement, str) and r.problem_statement.strip()]
+    solutions = [_clean(r.problem_solution) or "" for r in rows]
+    tiers = _length_tiers(solutions)
+    problems = []
+    for r, solution, tier in zip(rows, solutions, tiers):
+        thread_id = _as_int(r.thread_id)
+        key = problem_key(r.problem_statement)
+        problem_id = str(thread_id) if thread_id is not None else f"k{key}"
+        problems.append(Problem(
+            id=problem_id,
+            key=key,
+            week=_as_int(r.week_number),
+            category=_clean(r.category),
+            subcategory=_clean(r.subcategory),
+            exercise=_as_int(r.exercise_number),
+            work_score=_clean(r.work_score),
+            difficulty=difficulties.get(problem_id),
+            length_tier=tier,
+            problem=r.problem_statement.strip(),
+            solution=solution,
+            similar_problem=_clean(r.new_problem) or "",
+            similar_solution=_clean(r.new_solution) or "",
+            title=_clean(r.title) or "",
+            question=_clean(r.question) or "",
+        ))
+    return ProblemBank(problems)
+
+
+@functools.lru_cache(maxsize=4)
+def _bank(csv_path, mtime_ns):
+    return build_bank(load_problems(csv_path, BANK_COLUMNS))
+
+
+def get_problem_bank(csv_path=CSV_PATH):
+    """Shared, read-only bank for the process; costs one stat() per call once built."""
+    return _bank(csv_path, os.stat(csv_path).st_mtime_ns)
+
+
+def main():
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Query the problem bank.")
+    parser.add_argument("query", nargs="?", default="", help='e.g. "week 5 relations, medium"')
+    parser.add_argument("--csv", default=CSV_PATH)
+    args = parser.parse_args()
+
+    bank = get_problem_bank(args.csv)
+    criteria = parse_query(args.query, bank)
+    results = bank.search(args.query)
+    print(f"{len(results)} of {len(bank)} problems match {criteria or 'everything'}")
+    for p in results:
+        print(f"{p.id:>8}  week {p.week or '-':<3} {p.difficulty or '-':<7} {p.length_tier or '-':<7} "
+              f"{p.category or '-':<10} {p.subcategory or '-'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# prompt_builder.py
+#
+# Message construction for every model call site. Each request is laid out as
+#     [static instructions] -> [per-problem content] -> [per-student content]
+# with the static part dedented and whitespace-normalized, so it is byte-identical
+# across participants and turns and the provider's prompt cache can reuse it.
+
+import re
+import textwrap
+import threading
+
+from feedback_app.prompts import (
+    INITIAL_FEEDBACK_SYSTEM_PROMPT,
+    LOW_INFO_FEEDBACK_INSTRUCTIONS,
+    TUTORING_CONTEXT_INSTRUCTIONS,
+    FOLLOWUP_EVALUATOR_SYSTEM_PROMPT,
+)
+
+
+def normalize_block(text):
+    # Dedent, drop trailing spaces and collapse runs of blank lines
+    text = textwrap.dedent((text or "").replace("\r\n", "\n"))
+    text = "\n".join(line.rstrip() for line in text.split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", text).strip()
+
+
+def _static(*blocks):
+    return "\n\n".join(normalize_block(b) for b in blocks if b)
+
+
+def _problem_block(problem, correct_solution):
+    return (
+        f"Problem:\n{normalize_block(problem)}\n\n"
+        f"Official Solution (use only to guide hints; NEVER reveal it):\n{normalize_block(correct_solution)}"
+    )
+
+
+def _student_block(student_sol):
+    return f"Student wrote EXACTLY:\n<<<\n{student_sol}\n>>>"
+
+
+def _tutoring_problem_block(problem, correct_solution):
+    return (
+        f"[PROBLEM]\n{normalize_block(problem)}\n[/PROBLEM]\n\n"
+        f"[OFFICIAL_SOLUTION]\n{normalize_block(correct_solution)}\n[/OFFICIAL_SOLUTION]"
+    )
+
+
+# ----------- CALL SITES -----------
+
+def build_initial_feedback_messages(problem, student_sol, correct_solution, instructions, low_info=False):
+    if low_info:
+        instructions = LOW_INFO_FEEDBACK_INSTRUCTIONS
+    return [
+        {"role": "system", "content": _static(INITIAL_FEEDBACK_SYSTEM_PROMPT, instructions)},
+        {"role": "user", "content": _problem_block(problem, correct_solution)},
+        {"role": "user", "content": _student_block(student_sol)},
+    ]
+
+
+def build_tutoring_messages(problem, student_sol, correct_solution, system_prompt, initial_feedback):
+    # Seed the tutoring dialogue once the initial feedback text is known
+    return [
+        {"role": "system", "content": _static(system_prompt, TUTORING_CONTEXT_INSTRUCTIONS)},
+        {"role": "system", "content": _tutoring_problem_block(problem, correct_solution)},
+        {"role": "system", "content": f"[STUDENT_ATTEMPT]\n{student_sol}\n[/STUDENT_ATTEMPT]"},
+        {"role": "assistant", "content": initial_feedback},
+    ]
+
+
+def build_followup_messages(student_response, correct_solution, instructions):
+    return [
+        {"role": "system", "content": _static(FOLLOWUP_EVALUATOR_SYSTEM_PROMPT, instructions)},
+        {"role": "user", "content": f"The correct answer is:\n{normalize_block(correct_solution)}"},
+        {"role": "user", "content": f"The student's answer was:\n{student_response}"},
+    ]
+
+
+# ----------- PROMPT CACHE REPORTING -----------
+
+_usage_lock = threading.Lock()
+_usage_totals = {}
+
+
+def record_prompt_usage(call_site, usage):
+    """Accumulate prompt/cached token counts from a response's `usage`; returns this call's cached share."""
+    if usage is None:
+        return None
+    prompt_tokens = usage.prompt_tokens or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached_tokens = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+    with _usage_lock:
+        totals = _usage_totals.setdefault(call_site, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0})
+        totals["calls"] += 1
+        totals["prompt_tokens"] += prompt_tokens
+        totals["cached_tokens"] += cached_tokens
+    return cached_tokens / prompt_tokens if prompt_tokens else 0.0
+
+
+def prompt_cache_report():
+    """Per call site: calls, prompt tokens, cached tokens and the cached share so far."""
+    with _usage_lock:
+        return {
+            site: dict(totals, cached_share=(totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0))
+            for site, totals in _usage_totals.items()
+        }
@@ -0,0 +1,318 @@
+# resilience.py
+#
+# Guard rails around every chat-completion request the app makes. Each call site has
+# a policy: an overall deadline, a bounded number of attempts with full-jitter
+# exponential backoff (Retry-After is honoured, but no sleep runs past the deadline)
+# and, for the interactive call sites, hedging: an attempt still unanswered after the
+# call site's recent p95 latency gets an identical twin request, the first answer wins
+# and the other one is closed. A circuit breaker per model fails fast after repeated
+# failures, so an outage shows participants a short message instead of a page hanging
+# on a socket or a raw traceback.
+#
+# The sync HTTP client cannot abort a request already in flight: a losing hedge is
+# cancelled if it has not been sent yet, and otherwise closed the moment it returns
+# (for streams that is as soon as its headers arrive, before any tokens are read).
+#
+#     LLM_POLICIES='{"tutoring_turn": {"deadline_s": 20, "hedge": false}}'
+#     LLM_BREAKER_THRESHOLD=5
+#     LLM_BREAKER_COOLDOWN=30
+
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass, replace
+
+import httpx
+import openai
+
+from feedback_app.metrics import count_event
+
+FRIENDLY_MESSAGE = "The tutor is not responding right now. Please wait a moment and try again."
+
+BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))       # consecutive failures that open it
+BREAKER_COOLDOWN = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))      # seconds before a trial request
+log = logging.getLogger(__name__)
+
+HEDGE_WORKERS = int(os.getenv("LLM_HEDGE_WORKERS", "32"))
+LATENCY_WINDOW = 200        # recent successful attempts kept per (call site, model)
+MIN_SAMPLES = 20            # no hedging until the p95 is based on this many
+
+
+class ModelUnavailable(Exception):
+    """A model call that failed for good; str() is safe to show to participants."""
+
+    def __init__(self, detail=None):
+        super().__init__(FRIENDLY_MESSAGE)
+        self.detail = detail
+
+
+class DeadlineExceeded(ModelUnavailable):
+    pass
+
+
+class CircuitOpen(ModelUnavailable):
+    pass
+
+
+@dataclass(frozen=True)
+class Policy:
+    deadline_s: float = 60.0        # the whole call, retries included
+    max_attempts: int = 3
+    backoff_base_s: float = 0.5
+    backoff_cap_s: float = 8.0
+    hedge: bool = False             # duplicate an attempt that outlives the recent p95
+    hedge_min_delay_s: float = 1.0
+
+
+DEFAULT_POLICIES = {
+    "initial_feedback": Policy(45.0, hedge=True),
+    "initial_feedback_low_info": Policy(20.0, hedge=True),
+    "tutoring_turn": Policy(30.0, hedge=True),
+    "followup_grading": Policy(60.0),
+    "dialogue_summary": Policy(20.0, max_attempts=2),
+}
+
+
+def _load_policies():
+    policies = dict(DEFAULT_POLICIES)
+    overrides = os.getenv("LLM_POLICIES")
+    if overrides:
+        for call_site, fields in json.loads(overrides).items():
+            policies[call_site] = replace(policies.get(call_site, Policy()), **fields)
+    return policies
+
+
+POLICIES = _load_policies()
+
+
+def policy_for(call_site):
+    return POLICIES.get(call_site, Policy())
+
+
+# ----------- ERROR CLASSIFICATION -----------
+
+def is_timeout(error):
+    return isinstance(error, (openai.APITimeoutError, httpx.TimeoutException, TimeoutError))
+
+
+def is_retryable(error):
+    # Connection problems, timeouts, 408/409/429 and 5xx; other 4xx would fail the same way again
+    if isinstance(error, (openai.APIConnectionError, httpx.TransportError, TimeoutError)):
+        return True
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        if "retry-after-ms" in response.headers:
+            return float(response.headers["retry-after-ms"]) / 1000
+        if "retry-after" in response.headers:
+            return float(response.headers["retry-after"])
+    except ValueError:
+        pass
+    return None
+
+
+def backoff(policy, attempt, hint=None):
+    # Full jitter: a random point in [0, min(cap, base * 2^attempt)], or the server's own hint if longer
+    delay = random.uniform(0, min(policy.backoff_cap_s, policy.backoff_base_s * 2 ** attempt))
+    return max(delay, min(hint, policy.backoff_cap_s)) if hint else delay
+
+
+# ----------- LATENCY WINDOWS (hedge trigger) -----------
+
+class LatencyWindow:
+    def __init__(self, size=LATENCY_WINDOW):
+        self._samples = deque(maxlen=size)
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def p95(self):
+        with self._lock:
+            if len(self._samples) < MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+
+# ----------- CIRCUIT BREAKER -----------
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> one trial after `cooldown` -> closed or open."""
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, cooldown=BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if time.monotonic() - self.opened_at >= self.cooldown:
+                # Let exactly one request through to probe the model (another one if a probe
+                # never reported back, e.g. it died on an error that is not the model's)
+                self.state = "half_open"
+                self.opened_at = time.monotonic()
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        """Returns True when this failure opened the circuit."""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.threshold:
+                opened = self.state != "open"
+                self.state = "open"
+                self.opened_at = time.monotonic()
+                return opened
+            return False
+
+
+_lock = threading.Lock()
+_breakers = {}
+_windows = {}
+_pool = None
+
+
+def get_breaker(model):
+    with _lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker()
+        return _breakers[model]
+
+
+def get_window(call_site, model):
+    with _lock:
+        key = (call_site, model)
+        if key not in _windows:
+            _windows[key] = LatencyWindow()
+        return _windows[key]
+
+
+def _hedge_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=HEDGE_WORKERS, thread_name_prefix="llm-hedge")
+        return _pool
+
+
+# ----------- CALLING -----------
+
+def _drop(future, discard):
+    # Loser of a hedge race: never sent if still queued, otherwise released once it returns
+    if future.cancel() or discard is None:
+        return
+    future.add_done_callback(lambda f: discard(f.result()) if f.exception() is None else None)
+
+
+def _attempt(call_site, model, send, discard, policy, remaining):
+    window = get_window(call_site, model)
+    p95 = window.p95() if policy.hedge else None
+    delay = max(p95, policy.hedge_min_delay_s) if p95 is not None else None
+    if delay is None or delay >= remaining:
+        return send(remaining)
+
+    pool = _hedge_pool()
+    # Each attempt runs in its own copy of the caller's context (metrics labels, route records)
+    primary = pool.submit(contextvars.copy_context().run, send, remaining)
+    done, _ = wait([primary], timeout=delay)
+    if done:
+        return primary.result()
+
+    count_event("llm_hedged_requests_total", call_site, model)
+    hedge = pool.submit(contextvars.copy_context().run, send, remaining - delay)
+    pending = {primary, hedge}
+    ends_at = time.monotonic() + remaining - delay
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=max(0.0, ends_at - time.monotonic()), return_when=FIRST_COMPLETED)
+        if not done:
+            break
+        for future in done:
+            if future.exception() is None:
+                count_event("llm_hedge_wins_total", call_site, model, winner="hedge" if future is hedge else "primary")
+                for loser in pending:
+                    _drop(loser, discard)
+                return future.result()
+            error = error or future.exception()
+    for loser in pending:
+        _drop(loser, discard)
+    raise error or TimeoutError(f"{call_site}: no hedged attempt finished in time")
+
+
+def call(call_site, model, send, discard=None, deadline_s=None):
+    """
+    Run `send(timeout)` (one HTTP attempt, returning its result) under the call site's
+    policy. `discard(result)` releases a result that lost a hedge race (e.g. closes a
+    stream); `deadline_s` can only shorten the policy's deadline. Raises CircuitOpen,
+    DeadlineExceeded or ModelUnavailable, chained to the last underlying error.
+    """
+    policy = policy_for(call_site)
+    budget = policy.deadline_s if deadline_s is None else min(deadline_s, policy.deadline_s)
+    deadline = time.monotonic() + budget
+    breaker = get_breaker(model)
+    error = None
+    for attempt in range(policy.max_attempts):
+        if not breaker.allow():
+            count_event("llm_circuit_rejections_total", call_site, model)
+            raise CircuitOpen(f"{model}: circuit open") from error
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            break
+        started = time.monotonic()
+        try:
+            result = _attempt(call_site, model, send, discard, policy, remaining)
+        except openai.APIStatusError as e:
+            if is_retryable(e):
+                error = e
+            else:
+                # The model answered (with a client error): nothing wrong with the service itself
+                breaker.record_success()
+                raise ModelUnavailable(f"{model}: {e}") from e
+        except Exception as e:
+            if not is_retryable(e):
+                # Anything else (e.g. a bug in `send`) is not the model's fault: let it surface as is
+                raise
+            error = e
+        else:
+            breaker.record_success()
+            get_window(call_site, model).add(time.monotonic() - started)
+            return result
+
+        if breaker.record_failure():
+            count_event("llm_circuit_opens_total", call_site, model)
+            log.warning("%s: circuit for %s opened after %d consecutive failures", call_site, model, breaker.failures)
+        delay = backoff(policy, attempt, retry_after(error))
+        if attempt + 1 >= policy.max_attempts or time.monotonic() + delay >= deadline:
+            break
+        count_event("llm_backoff_retries_total", call_site, model, error=type(error).__name__)
+        log.info("%s: %s from %s, retrying in %.2fs", call_site, type(error).__name__, model, delay)
+        time.sleep(delay)
+
+    if error is None or is_timeout(error):
+        raise DeadlineExceeded(f"{model}: no answer within {budget:.1f}s") from error
+    raise ModelUnavailable(f"{model}: {type(error).__name__} after retries: {error}") from error
@@ -0,0 +1,158 @@
+# response_cache.py
+#
+# Two-tier cache for deterministic model calls: an in-process LRU in front of an
+# on-disk SQLite store, both honouring the same TTL, with a size bound on disk. Keys
+# are content hashes of the fully rendered request (model, sampling parameters and
+# messages). The store's total size is tracked as a running total, so a write does
+# not scan the table; it is re-read from SQLite at every expiry sweep, which also
+# picks up writes by other processes sharing the file.
+
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+CACHE_DIR = "cache"
+CACHE_PATH = os.path.join(CACHE_DIR, "responses.sqlite")
+
+# Only calls at or below this temperature are cached unless a caller opts in explicitly
+CACHE_MAX_TEMPERATURE = 0.3
+
+# Set FEEDBACK_CACHE_BYPASS=1 to always call the model (e.g. while experimenting with prompts)
+CACHE_BYPASS = os.getenv("FEEDBACK_CACHE_BYPASS", "") not in ("", "0", "false", "False")
+
+
+def normalize_student_text(text):
+    # Whitespace-only differences between two attempts should not change the request
+    lines = (re.sub(r"[ \t]+", " ", line).strip() for line in (text or "").replace("\r\n", "\n").split("\n"))
+    return re.sub(r"\n{3,}", "\n\n", "\n".join(lines)).strip()
+
+
+def make_cache_key(**request):
+    payload = json.dumps(request, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def is_cacheable(temperature):
+    return not CACHE_BYPASS and temperature is not None and temperature <= CACHE_MAX_TEMPERATURE
+
+
+class ResponseCache:
+    def __init__(self, path=CACHE_PATH, max_memory_items=512, ttl_seconds=7 * 24 * 3600, max_disk_bytes=50 * 1024 * 1024,
+                 sweep_interval=300.0):
+        self.path = path
+        self.max_memory_items = max_memory_items
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_bytes = max_disk_bytes
+        self.sweep_interval = sweep_interval
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0, "writes": 0, "evictions": 0}
+
+        self._memory = OrderedDict()     # key -> (value, expires_at)
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses(accessed)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_created ON responses(created)")
+        self._db.commit()
+        self._disk_bytes = 0
+        self._next_sweep = 0.0
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[1] > now:
+                    self._memory.move_to_end(key)
+                    self.stats["memory_hits"] += 1
+                    return entry[0]
+                del self._memory[key]
+
+            row = self._db.execute("SELECT value, created, size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                if row is not None:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._disk_bytes -= row[2]
+                self.stats["misses"] += 1
+                return None
+
+            self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._db.commit()
+            self._remember(key, row[0], row[1] + self.ttl_seconds)
+            self.stats["disk_hits"] += 1
+            return row[0]
+
+    def set(self, key, value):
+        now = time.time()
+        size = len(value.encode("utf-8"))
+        with self._lock:
+            self._remember(key, value, now + self.ttl_seconds)
+            old = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, value, size, now, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._evict(now)
+            self._db.commit()
+            self.stats["writes"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._db.execute("DELETE FROM responses")
+            self._db.commit()
+            self._disk_bytes = 0
+
+    def hit_rate(self):
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"]
+        total = hits + self.stats["misses"]
+        return hits / total if total else 0.0
+
+    def _remember(self, key, value, expires_at):
+        self._memory[key] = (value, expires_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def _evict(self, now):
+        if now >= self._next_sweep:
+            # Periodically: drop expired entries and re-read the true total (other processes write too)
+            expired = self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl_seconds,)).rowcount
+            self.stats["evictions"] += max(expired, 0)
+            self._disk_bytes = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            self._next_sweep = now + self.sweep_interval
+        if self._disk_bytes <= self.max_disk_bytes:
+            return
+        # Least recently used first, until under the size bound
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if self._disk_bytes <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._memory.pop(key, None)
+            self._disk_bytes -= size
+            self.stats["evictions"] += 1
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
@@ -0,0 +1,127 @@
+# session_log.py
+#
+# Append-only event stream per participant. Every step of the study (attempt,
+# feedback, each chat turn, rubrics, follow-up grade) is written as one JSON record
+# the moment it happens, and the final flattened record is materialized from the
+# stream, so a closed browser tab loses at most the step in progress. Events live in
+# the rotated log store (log_store.py), keyed by student_id.
+
+import json
+
+from feedback_app.log_store import get_log_store
+
+EVENTS_DIR = "session_events"
+
+# Event types and the payload fields they carry
+SESSION_STARTED = "session_started"                    # demographics
+ATTEMPT_SUBMITTED = "attempt_submitted"                # problem, student_attempt, correct_solution, similar_problem, similar_solution
+FEEDBACK_GENERATED = "feedback_generated"              # initial_feedback, latency, routes
+CHAT_TURN = "chat_turn"                                # role, content, latency, routes (assistant turns)
+INITIAL_RUBRIC_SUBMITTED = "initial_rubric_submitted"  # rubrics
+RUBRIC_SUBMITTED = "rubric_submitted"                  # rubrics
+FOLLOWUP_GRADED = "followup_graded"                    # response, feedback, routes
+COMMENTS_SUBMITTED = "comments_submitted"              # additional_comments
+
+
+def log_event(student_id, event_type, task_index=None, **payload):
+    """Append one event; cost is independent of how long the session already is."""
+    get_log_store(EVENTS_DIR, "events").append(student_id, {"type": event_type, "task_index": task_index, **payload})
+
+
+def read_events(student_id):
+    return get_log_store(EVENTS_DIR, "events").get(student_id)
+
+
+def _new_task():
+    return {
+        "problem": "",
+        "student_attempt": "",
+        "correct_solution": "",
+        "initial_feedback": "",
+        "messages": [],
+        "similar_problem": "",
+        "similar_solution": "",
+        "followup_response": "",
+        "followup_feedback": "",
+        "rubrics": {},
+        "latencies": {"turns": []},
+        "routes": [],
+        "timestamp": "",
+    }
+
+
+def materialize_session(events, student_id):
+    """Rebuild the session_log_data structure (student, demographics, tasks) from an event stream."""
+    log = {"student_id": student_id, "demographics": {}, "tasks": [], "additional_comments": ""}
+    tasks = {}
+    for event in events:
+        kind = event["type"]
+        if kind == SESSION_STARTED:
+            log["demographics"] = event.get("demographics", {})
+            continue
+        if kind == COMMENTS_SUBMITTED:
+            log["additional_comments"] = event.get("additional_comments", "")
+            continue
+
+        task = tasks.setdefault(event["task_index"], _new_task())
+        task["timestamp"] = event["ts"]
+        if kind == ATTEMPT_SUBMITTED:
+            for key in ("problem", "student_attempt", "correct_solution", "similar_problem", "similar_solution"):
+                task[key] = event.get(key, "")
+        elif kind == FEEDBACK_GENERATED:
+            task["initial_feedback"] = event.get("initial_feedback", "")
+            task["latencies"]["initial_feedback"] = event.get("latency")
+            task["routes"].extend(event.get("routes", []))
+        elif kind == CHAT_TURN:
+            task["messages"].append({"role": event["role"], "content": event["content"]})
+            if event.get("latency"):
+                task["latencies"]["turns"].append(event["latency"])
+            task["routes"].extend(event.get("routes", []))
+        elif kind == INITIAL_RUBRIC_SUBMITTED:
+            task["initial_rubrics"] = event.get("rubrics", {})
+        elif kind == RUBRIC_SUBMITTED:
+            task["rubrics"] = event.get("rubrics", {})
+        elif kind == FOLLOWUP_GRADED:
+            task["followup_response"] = event.get("response", "")
+            task["followup_feedback"] = event.get("feedback", "")
+            task["routes"].extend(event.get("routes", []))
+
+    log["tasks"] = [tasks[i] for i in sorted(tasks, key=lambda i: (i is None, i))]
+    return log
+
+
+def load_session(student_id):
+    return materialize_session(read_events(student_id), student_id)
+
+
+# ----------- FLAT RECORD (one spreadsheet row per participant) -----------
+
+def compact(messages):
+    # Optional: rename roles for readability
+    role_map = {"assistant": "Tutor", "user": "Student"}
+    return [{"who": role_map.get(m["role"], m["role"]), "text": m["content"]} for m in messages]
+
+
+def flatten_session_log(log):
+    flat = {
+        "student_id": log["student_id"],
+        "age": log["demographics"].get("age", ""),
+        "gender": log["demographics"].get("gender", ""),
+        "academic_background": log["demographics"].get("academic_background", ""),
+        "academic_level": log["demographics"].get("academic_level", ""),
+    }
+    for i, task in enumerate(log["tasks"]):
+        prefix = f"task_{i+1}_"
+        flat[prefix + "problem"] = task["problem"]
+        flat[prefix + "attempt"] = task["student_attempt"]
+        flat[prefix + "initial_feedback"] = task.get("initial_feedback", "")
+        flat[prefix + "initial_rubrics"] = json.dumps(task.get("initial_rubrics", {}))
+        clean = compact(task.get("messages", []))
+        flat[prefix + "messages"] = json.dumps(clean, ensure_ascii=False)
+        flat[prefix + "rubrics"] = json.dumps(task.get("rubrics", {}))
+        flat[prefix + "followup_problem"] = task["similar_problem"]
+        flat[prefix + "followup_response"] = task["followup_response"]
+        flat[prefix + "followup_feedback"] = task["followup_feedback"]
+
+    flat["additional_comments"] = log.get("additional_comments", "")
+    return flat
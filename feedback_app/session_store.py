@@ -0,0 +1,308 @@
+# session_store.py
+#
+# Participant state kept outside the Streamlit process, so several workers can sit
+# behind a load balancer and a restart does not lose anyone mid-study. The page's
+# session_state is snapshotted (only PERSISTED_KEYS), serialized compactly and saved
+# with a version number; a save based on a stale version is rejected (optimistic
+# concurrency) and the newer stored state wins.
+#
+# Sessions are stored under a random resume token, not the student_id: the token
+# travels in the URL (?resume=...), so any worker can resume the participant at their
+# exact mode and task, while the student_id (which appears in logs and the results
+# sheet) cannot be used to open someone else's session.
+#
+#     SESSION_STORE=memory                       (default, single process)
+#     SESSION_STORE=sqlite:sessions/sessions.sqlite
+#     SESSION_STORE=redis://127.0.0.1:6379/0     (any server speaking RESP)
+
+import hashlib
+import json
+import os
+import re
+import secrets
+import socket
+import sqlite3
+import threading
+import time
+import zlib
+from urllib.parse import urlparse
+
+SESSION_STORE = os.getenv("SESSION_STORE", "memory")
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(14 * 24 * 3600)))
+
+# What a worker needs to put a participant back exactly where they were
+PERSISTED_KEYS = (
+    "student_id", "consent_given", "demographics", "demographics_submitted", "instructions_read",
+    "session_log_data", "task_index", "mode", "task_completed",
+    "problem", "correct_solution", "similar_problem", "similar_solution", "student_attempt", "attempt_submitted",
+    "initial_feedback", "api_messages", "transcript", "messages", "task_log", "pending_reply",
+    "show_initial_rubric", "initial_rubric_submitted", "finish_button_clicked", "show_rubric",
+    "show_feedback", "feedback", "followup_answer", "additional_comments",
+)
+
+# Bookkeeping kept in session_state next to the persisted keys
+RESUME_KEY = "resume_token"
+VERSION_KEY = "_store_version"
+DIGEST_KEY = "_store_digest"
+
+_TOKEN = re.compile(r"[A-Za-z0-9_-]{32}")
+
+COMPRESS_ABOVE = 1024
+
+
+class VersionConflict(Exception):
+    pass
+
+
+# ----------- SERIALIZATION -----------
+
+def dumps(data):
+    raw = json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    # Dialogues are repetitive text: zlib typically shrinks them 3-5x
+    return b"z" + zlib.compress(raw, 6) if len(raw) > COMPRESS_ABOVE else b"j" + raw
+
+
+def loads(blob):
+    blob = bytes(blob)
+    raw = zlib.decompress(blob[1:]) if blob[:1] == b"z" else blob[1:]
+    return json.loads(raw.decode("utf-8"))
+
+
+# ----------- BACKENDS -----------
+# load(sid) -> (version, blob) or None; save(sid, blob, expected_version) -> new version
+
+class MemoryBackend:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._items = {}
+
+    def load(self, sid):
+        with self._lock:
+            return self._items.get(sid)
+
+    def save(self, sid, blob, expected_version):
+        with self._lock:
+            current = self._items.get(sid, (0, None))[0]
+            if current != expected_version:
+                raise VersionConflict(f"{sid}: stored version {current}, expected {expected_version}")
+            self._items[sid] = (current + 1, blob)
+            return current + 1
+
+
+class SQLiteBackend:
+    def __init__(self, path):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        # Several worker processes may share the file; WAL lets readers proceed during a write
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "sid TEXT PRIMARY KEY, version INTEGER NOT NULL, payload BLOB NOT NULL, updated REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def load(self, sid):
+        with self._lock:
+            row = self._db.execute("SELECT version, payload FROM sessions WHERE sid = ?", (sid,)).fetchone()
+        return (row[0], bytes(row[1])) if row else None
+
+    def save(self, sid, blob, expected_version):
+        with self._lock:
+            if expected_version == 0:
+                cur = self._db.execute(
+                    "INSERT OR IGNORE INTO sessions (sid, version, payload, updated) VALUES (?, 1, ?, ?)",
+                    (sid, blob, time.time()),
+                )
+            else:
+                cur = self._db.execute(
+                    "UPDATE sessions SET version = version + 1, payload = ?, updated = ? WHERE sid = ? AND version = ?",
+                    (blob, time.time(), sid, expected_version),
+                )
+            self._db.commit()
+        if cur.rowcount != 1:
+            raise VersionConflict(f"{sid}: stored version is not {expected_version}")
+        return expected_version + 1
+
+
+class RedisBackend:
+    """
+    Minimal RESP client: one hash per session (fields v, d), compare-and-set via
+    WATCH/MULTI/EXEC. Works against Redis, Valkey, KeyDB or the stand-in in fakes.py.
+    """
+
+    def __init__(self, url, ttl_seconds=SESSION_TTL_SECONDS, prefix="feedback:session:"):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or "127.0.0.1", parsed.port or 6379)
+        self.db = int((parsed.path or "/0").lstrip("/") or 0)
+        self.password = parsed.password
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+        self._local = threading.local()
+
+    # --- protocol ---
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection(self.address, timeout=5)
+            conn = self._local.conn = (sock, sock.makefile("rb"))
+            if self.password:
+                self._call("AUTH", self.password)
+            if self.db:
+                self._call("SELECT", self.db)
+        return conn
+
+    def _read(self, f):
+        line = f.readline()
+        if not line:
+            raise ConnectionError("connection closed by server")
+        kind, rest = line[:1], line[1:-2]
+        if kind == b"+":
+            return rest.decode()
+        if kind == b"-":
+            raise RuntimeError(rest.decode())
+        if kind == b":":
+            return int(rest)
+        if kind == b"$":
+            n = int(rest)
+            return None if n < 0 else f.read(n + 2)[:-2]
+        if kind == b"*":
+            n = int(rest)
+            return None if n < 0 else [self._read(f) for _ in range(n)]
+        raise ConnectionError(f"bad reply {line[:20]!r}")
+
+    def _call(self, *args):
+        sock, f = self._connection()
+        parts = [a if isinstance(a, bytes) else str(a).encode("utf-8") for a in args]
+        payload = b"*%d\r\n" % len(parts) + b"".join(b"$%d\r\n%s\r\n" % (len(p), p) for p in parts)
+        try:
+            sock.sendall(payload)
+            return self._read(f)
+        except (OSError, ConnectionError):
+            # Drop the broken connection; the next call reconnects
+            self._drop()
+            raise
+
+    def _drop(self):
+        conn, self._local.conn = getattr(self._local, "conn", None), None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    # --- backend interface ---
+
+    def load(self, sid):
+        version, blob = self._call("HMGET", self.prefix + sid, "v", "d")
+        return (int(version), blob) if version is not None else None
+
+    def save(self, sid, blob, expected_version):
+        key = self.prefix + sid
+        try:
+            self._call("WATCH", key)
+            current = self._call("HGET", key, "v")
+            current = int(current) if current is not None else 0
+            if current != expected_version:
+                self._call("UNWATCH")
+                raise VersionConflict(f"{sid}: stored version {current}, expected {expected_version}")
+            self._call("MULTI")
+            self._call("HSET", key, "v", current + 1, "d", blob)
+            self._call("EXPIRE", key, self.ttl_seconds)
+            # EXEC returns nil when another client touched the key after WATCH
+            committed = self._call("EXEC")
+        except VersionConflict:
+            raise
+        except Exception:
+            # An error reply can leave this connection inside WATCH/MULTI (or halfway through
+            # an EXEC reply); start the next call on a fresh one rather than reuse it
+            self._drop()
+            raise
+        if committed is None:
+            raise VersionConflict(f"{sid}: modified concurrently")
+        return current + 1
+
+
+def make_backend(spec=SESSION_STORE):
+    if spec.startswith("sqlite:"):
+        return SQLiteBackend(spec[len("sqlite:"):] or os.path.join("sessions", "sessions.sqlite"))
+    if spec.startswith("redis://"):
+        return RedisBackend(spec)
+    if spec == "memory":
+        return MemoryBackend()
+    raise ValueError(f"unknown SESSION_STORE {spec!r}")
+
+
+# ----------- SNAPSHOT / RESTORE -----------
+
+def new_resume_token():
+    # 192 random bits: not guessable, and unrelated to the student_id
+    return secrets.token_urlsafe(24)
+
+
+def is_resume_token(value):
+    return isinstance(value, str) and _TOKEN.fullmatch(value) is not None
+
+
+class SessionStore:
+    def __init__(self, backend):
+        self.backend = backend
+
+    def load(self, sid):
+        """(version, state dict) or None."""
+        stored = self.backend.load(sid)
+        return (stored[0], loads(stored[1])) if stored else None
+
+    def sync(self, state):
+        """
+        Save the persisted keys of `state` (a session_state-like mapping) under its resume
+        token if they changed since the last sync. On a version conflict the stored state is copied back into
+        `state` and VersionConflict is re-raised so the caller can tell the participant.
+        """
+        sid = state.get(RESUME_KEY)
+        if not sid:
+            return False
+        snapshot = {k: state[k] for k in PERSISTED_KEYS if k in state}
+        blob = dumps(snapshot)
+        digest = hashlib.sha1(blob).hexdigest()
+        if digest == state.get(DIGEST_KEY):
+            return False
+        try:
+            state[VERSION_KEY] = self.backend.save(sid, blob, state.get(VERSION_KEY, 0))
+            state[DIGEST_KEY] = digest
+            return True
+        except VersionConflict:
+            self.restore(state, sid)
+            raise
+
+    def restore(self, state, sid):
+        """Copy the session stored under resume token `sid` into `state`; returns False if there is none."""
+        if not is_resume_token(sid):
+            return False
+        stored = self.backend.load(sid)
+        if stored is None:
+            return False
+        version, blob = stored
+        data = loads(blob)
+        for key in PERSISTED_KEYS:
+            if key in data:
+                state[key] = data[key]
+            elif key in state:
+                del state[key]
+        state[RESUME_KEY] = sid
+        state[VERSION_KEY] = version
+        state[DIGEST_KEY] = hashlib.sha1(bytes(blob)).hexdigest()
+        return True
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_session_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(make_backend())
+        return _store
@@ -0,0 +1,152 @@
+# sheets.py
+#
+# Long-lived Google Sheets writer: credentials, the authorized client and the
+# worksheet handle are created once per process, the header row is verified once,
+# and rows queued by concurrent sessions are coalesced into append_rows batches
+# with exponential backoff on quota / transient errors. Records are written by
+# column name: each value goes under its header cell, and keys the sheet has no
+# column for yet are added to the header row first.
+
+import random
+import threading
+import time
+
+import gspread
+from gspread.utils import rowcol_to_a1
+from google.oauth2.service_account import Credentials
+import streamlit as st
+
+SPREADSHEET_ID = "1LudHYryIASXAWYaqpsNhjt1HXJQ_2S52D9b_XjtJ2W0"
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets", "https://www.googleapis.com/auth/drive"]
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def open_study_worksheet():
+    creds = Credentials.from_service_account_info(dict(st.secrets["gcp_service_account"]), scopes=SCOPES)
+    client = gspread.authorize(creds)
+    return client.open_by_key(SPREADSHEET_ID).sheet1
+
+
+def is_retryable(error):
+    status = getattr(getattr(error, "response", None), "status_code", None)
+    return status in RETRY_STATUS
+
+
+class SheetWriter:
+    def __init__(self, open_worksheet=open_study_worksheet, batch_size=25, max_retries=6,
+                 base_delay=1.0, max_delay=32.0, sleep=time.sleep):
+        self._open_worksheet = open_worksheet
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._sleep = sleep
+
+        self._worksheet = None
+        self._header = None        # the sheet's header row, read once per process
+        self._pending = []
+        self._pending_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+    def worksheet(self):
+        if self._worksheet is None:
+            self._worksheet = self._with_backoff(self._open_worksheet)
+        return self._worksheet
+
+    def append(self, data):
+        """Queue one record (a flat dict); flushes automatically once a batch is full."""
+        with self._pending_lock:
+            self._pending.append(data)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self.flush()
+
+    def flush(self):
+        """Write every queued row in one append_rows call. Returns the number of rows written."""
+        with self._flush_lock:
+            with self._pending_lock:
+                batch, self._pending = self._pending, []
+            if not batch:
+                return 0   # another session's flush already wrote our rows
+            try:
+                self._write(batch)
+            except Exception:
+                with self._pending_lock:
+                    self._pending = batch + self._pending
+                raise
+            return len(batch)
+
+    def write(self, batch):
+        """Write records immediately, bypassing the queue; on failure nothing is kept for retry."""
+        with self._flush_lock:
+            self._write(batch)
+        return len(batch)
+
+    def column_values(self, col):
+        return self._with_backoff(lambda: self.worksheet().col_values(col))
+
+    def _write(self, batch):
+        header, new_header = self._columns(batch)
+        rows = ([header] if new_header else []) + [[data.get(col, "") for col in header] for data in batch]
+        self._with_backoff(lambda: self.worksheet().append_rows(rows, value_input_option="RAW"))
+        self._header = header
+
+    def _columns(self, batch):
+        """
+        (header, write_it): the header covering every key of `batch`. An empty sheet gets
+        a new header row, written with the first batch; keys missing from an existing
+        header are appended to row 1 before the rows that use them.
+        """
+        if self._header is None:
+            # Only the first write of the process reads the sheet; afterwards the header is cached
+            self._header = self._read_header()
+        keys = list(dict.fromkeys(k for data in batch for k in data))
+        if not self._header:
+            return keys, True
+        if any(k not in self._header for k in keys):
+            self._header = self._extend_header(keys)
+        return list(self._header), False
+
+    def _extend_header(self, keys):
+        # Other processes extend the header too: row 1 is re-read right before each update,
+        # so their new columns are kept, and checked after it; if another writer took the
+        # same cells in between, the keys still missing are appended again further right.
+        for _ in range(self.max_retries + 1):
+            header = self._read_header()
+            missing = [k for k in keys if k not in header]
+            if not missing:
+                return header
+            start = rowcol_to_a1(1, len(header) + 1)
+            self._with_backoff(lambda: self.worksheet().batch_update([{"range": start, "values": [missing]}]))
+            written = self._read_header()
+            if written[:len(header) + len(missing)] == header + missing:
+                return written
+        raise RuntimeError("could not extend the sheet header: row 1 kept changing under us")
+
+    def _read_header(self):
+        header = list(self._with_backoff(lambda: self.worksheet().row_values(1)))
+        while header and header[-1] == "":
+            header.pop()
+        return header
+
+    def _with_backoff(self, call):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return call()
+            except Exception as e:
+                if attempt == self.max_retries or not is_retryable(e):
+                    raise
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                self._sleep(delay * (0.5 + random.random() / 2))
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_sheet_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = SheetWriter()
+        return _writer
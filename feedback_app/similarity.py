@@ -0,0 +1,265 @@
+# similarity.py
+#
+# Local retrieval of similar problems, e.g. a follow-up problem for a task whose row
+# has no precomputed new_problem. Each problem (statement + forum title + question)
+# becomes a signed, hashed TF-IDF vector of word unigrams and bigrams; vectors are
+# L2-normalized float32 rows of one matrix, so "top-k most similar" is a single
+# matrix-vector product. No network, no GPU, no model download.
+#
+# The index is built offline and stored as three files that any worker can map
+# read-only:
+#     <prefix>.f32        rows x dim float32, raw (np.memmap)
+#     <prefix>.idf.f32    dim float32 IDF weights of the last full build
+#     <prefix>.json       dim, row count, ids and problem keys
+# New problems are appended in place (add); they are weighted with the stored IDF,
+# so run `build` again after large additions. Rows are committed by rewriting the
+# JSON, so a reader never sees a half-appended row.
+#
+#     python -m feedback_app.similarity build
+#     python -m feedback_app.similarity add
+#     python -m feedback_app.similarity query 10896 -k 5
+
+import json
+import math
+import os
+import re
+import threading
+import zlib
+from collections import Counter
+
+import numpy as np
+
+from feedback_app.dataset import STORE_DIR
+
+INDEX_PREFIX = os.path.join(STORE_DIR, "similarity")
+DIM = 4096                  # hashed feature space; 16 KB per problem
+INDEX_VERSION = 1
+
+_WORD = re.compile(r"[a-z0-9]+")
+
+
+# ----------- VECTORS -----------
+
+def problem_text(problem):
+    return " ".join(filter(None, [problem.problem, problem.title, problem.question]))
+
+
+def features(text):
+    words = _WORD.findall((text or "").lower())
+    return Counter(words + [f"{a} {b}" for a, b in zip(words, words[1:])])
+
+
+def _hashed(counts, dim):
+    # crc32 rather than hash(): it is the same in every process
+    for feature, count in counts.items():
+        h = zlib.crc32(feature.encode("utf-8"))
+        yield h % dim, (1.0 if h & 0x80000000 else -1.0), 1.0 + math.log(count)
+
+
+def vectorize(texts, idf):
+    dim = len(idf)
+    out = np.zeros((len(texts), dim), dtype=np.float32)
+    for row, text in enumerate(texts):
+        for index, sign, tf in _hashed(features(text), dim):
+            out[row, index] += sign * tf
+        out[row] *= idf
+        norm = np.linalg.norm(out[row])
+        if norm:
+            out[row] /= norm
+    return out
+
+
+def fit_idf(texts, dim=DIM):
+    df = np.zeros(dim, dtype=np.float64)
+    for text in texts:
+        df[list({index for index, _, _ in _hashed(features(text), dim)})] += 1
+    # Smoothed, as in scikit-learn: never zero, never infinite
+    return (np.log((1 + len(texts)) / (1 + df)) + 1).astype(np.float32)
+
+
+# ----------- THE INDEX -----------
+
+class SimilarityIndex:
+    def __init__(self, ids, keys, matrix, idf, prefix=None):
+        self.ids = list(ids)
+        self.keys = list(keys)
+        self.matrix = matrix
+        self.idf = idf
+        self.prefix = prefix
+        self.row_of = {pid: i for i, pid in enumerate(self.ids)}
+
+    @classmethod
+    def build(cls, problems, dim=DIM):
+        problems = list(problems)
+        texts = [problem_text(p) for p in problems]
+        idf = fit_idf(texts, dim)
+        return cls([p.id for p in problems], [p.key for p in problems], vectorize(texts, idf), idf)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, problem_id):
+        return str(problem_id) in self.row_of
+
+    # --- queries ---
+
+    def _top(self, vector, k, skip, where):
+        scores = self.matrix @ vector
+        # Enough candidates to survive the filters in the common case; fall back to a full sort
+        take = min(len(scores), k + len(skip) + 8)
+        order = np.argpartition(-scores, take - 1)[:take] if take < len(scores) else np.arange(len(scores))
+        for attempt in (order[np.argsort(-scores[order])], np.argsort(-scores)):
+            found = []
+            for row in attempt:
+                pid = self.ids[row]
+                if row in skip or (where is not None and not where(pid)):
+                    continue
+                found.append((pid, float(scores[row])))
+                if len(found) == k:
+                    return found
+            if len(attempt) == len(scores):
+                return found
+        return found
+
+    def similar(self, problem_id, k=5, where=None):
+        """
+        [(id, cosine)] of the k problems most similar to `problem_id`, best first. The
+        problem itself and rows with the same statement (same problem key) are excluded;
+        `where(id)` can filter further (e.g. only problems that have a solution).
+        """
+        row = self.row_of[str(problem_id)]
+        key = self.keys[row]
+        skip = {i for i, other in enumerate(self.keys) if other == key}
+        return self._top(np.asarray(self.matrix[row]), k, skip, where)
+
+    def similar_to_text(self, text, k=5, where=None):
+        return self._top(vectorize([text], self.idf)[0], k, set(), where)
+
+    # --- persistence ---
+
+    def save(self, prefix=INDEX_PREFIX):
+        os.makedirs(os.path.dirname(prefix) or ".", exist_ok=True)
+        for suffix, array in ((".f32", self.matrix), (".idf.f32", self.idf)):
+            tmp_path = f"{prefix}{suffix}.{os.getpid()}.tmp"
+            np.ascontiguousarray(array, dtype=np.float32).tofile(tmp_path)
+            os.replace(tmp_path, prefix + suffix)
+        self._write_meta(prefix)
+        return load_index(prefix)
+
+    def _write_meta(self, prefix):
+        meta = {"version": INDEX_VERSION, "dim": len(self.idf), "count": len(self.ids), "ids": self.ids, "keys": self.keys}
+        tmp_path = f"{prefix}.json.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, prefix + ".json")
+
+    def add(self, problems):
+        """
+        Index problems not in the index yet (weighted with the stored IDF); returns a new
+        index. A saved index is extended on disk, by appending rows and then committing
+        the new count in the JSON.
+        """
+        new = [p for p in problems if p.id not in self.row_of]
+        if not new:
+            return self
+        vectors = vectorize([problem_text(p) for p in new], self.idf)
+        ids, keys = self.ids + [p.id for p in new], self.keys + [p.key for p in new]
+        if self.prefix is None:
+            return SimilarityIndex(ids, keys, np.vstack([self.matrix, vectors]), self.idf)
+        with open(self.prefix + ".f32", "r+b") as f:
+            # Overwrite anything past the committed rows (left by an interrupted add)
+            f.seek(len(self.ids) * len(self.idf) * 4)
+            f.write(vectors.tobytes())
+            f.truncate()
+        SimilarityIndex(ids, keys, None, self.idf)._write_meta(self.prefix)
+        return load_index(self.prefix)
+
+
+def load_index(prefix=INDEX_PREFIX):
+    """The saved index, memory-mapped read-only; None if it was never built."""
+    try:
+        with open(prefix + ".json", encoding="utf-8") as f:
+            meta = json.load(f)
+    except FileNotFoundError:
+        return None
+    if meta.get("version") != INDEX_VERSION:
+        return None
+    dim, count = meta["dim"], meta["count"]
+    idf = np.fromfile(prefix + ".idf.f32", dtype=np.float32)
+    matrix = np.memmap(prefix + ".f32", dtype=np.float32, mode="r", shape=(count, dim)) if count else np.zeros((0, dim), np.float32)
+    return SimilarityIndex(meta["ids"], meta["keys"], matrix, idf, prefix)
+
+
+_index = None
+_index_bank = None
+_index_lock = threading.Lock()
+
+
+def _matches(index, bank):
+    # Every indexed row is still in the bank with the same statement
+    for pid, key in zip(index.ids, index.keys):
+        problem = bank.by_id.get(pid)
+        if problem is None or problem.key != key:
+            return False
+    return True
+
+
+def get_similarity_index(bank, prefix=INDEX_PREFIX):
+    """
+    Index covering exactly the problems of `bank`, shared by the process and rebuilt when
+    the bank is (i.e. when the CSV changes). Problems added since the offline build are
+    indexed in memory (the files are left alone); if the files are missing, or hold rows
+    the bank no longer has or has changed, the whole bank is indexed in memory.
+    """
+    global _index, _index_bank
+    with _index_lock:
+        if _index_bank is not bank:
+            index = load_index(prefix)
+            if index is None or not _matches(index, bank):
+                print(f"No up-to-date similarity index at {prefix}; indexing {len(bank)} problems in memory "
+                      f"(rebuild it with `python -m feedback_app.similarity build`)")
+                index = SimilarityIndex.build(bank.problems)
+            missing = [p for p in bank.problems if p.id not in index]
+            if missing:
+                index = SimilarityIndex(index.ids, index.keys, index.matrix, index.idf).add(missing)
+            _index, _index_bank = index, bank
+        return _index
+
+
+def main():
+    import argparse
+    import time
+
+    from feedback_app.problem_bank import get_problem_bank
+
+    parser = argparse.ArgumentParser(description="Build, extend or query the local similar-problem index.")
+    parser.add_argument("command", choices=["build", "add", "query"])
+    parser.add_argument("problem_id", nargs="?", help="problem to find neighbours of (query)")
+    parser.add_argument("-k", type=int, default=5)
+    parser.add_argument("--prefix", default=INDEX_PREFIX)
+    parser.add_argument("--dim", type=int, default=DIM)
+    args = parser.parse_args()
+
+    bank = get_problem_bank()
+    if args.command == "build":
+        index = SimilarityIndex.build(bank.problems, args.dim).save(args.prefix)
+        print(f"Indexed {len(index)} problems into {args.prefix}.f32 ({len(index.idf)} dims)")
+    elif args.command == "add":
+        index = load_index(args.prefix)
+        if index is None:
+            parser.error(f"no index at {args.prefix}; run build first")
+        before = len(index)
+        index = index.add(bank.problems)
+        print(f"Added {len(index) - before} problems; {len(index)} indexed")
+    else:
+        index = load_index(args.prefix) or SimilarityIndex.build(bank.problems, args.dim)
+        started = time.perf_counter()
+        results = index.similar(args.problem_id, args.k)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"{bank.get(args.problem_id).problem[:100]!r}  ({elapsed_ms:.2f} ms)")
+        for pid, score in results:
+            print(f"{score:6.3f}  {pid:>8}  {bank.get(pid).problem[:90]!r}")
+
+
+if __name__ == "__main__":
+    main()
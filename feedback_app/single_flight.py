@@ -0,0 +1,157 @@
+# single_flight.py
+#
+# Deduplication of model calls within one participant session. Double-clicks and
+# overlapping reruns used to fire the same request again; now every call is
+# registered under a fingerprint of what it asks, and a caller with the same
+# fingerprint joins the call already in flight (or reuses its finished result)
+# instead of sending another. The page keeps one registry per session and drops it
+# when the participant moves to the next task.
+#
+# Streamed calls run as a Flight on their own thread: chunks are buffered, so a
+# rerun that interrupted the bubble replays what already arrived and then follows
+# the live stream. Failed calls are never reused; the next join starts a new one.
+
+import contextvars
+import hashlib
+import json
+import threading
+
+from feedback_app.model_router import record_routes
+
+MAX_CALLS = 64      # per session; the oldest finished calls are dropped first
+
+
+def fingerprint(call_site, *parts):
+    raw = json.dumps([call_site, *parts], ensure_ascii=False, sort_keys=True, default=str)
+    return f"{call_site}:{hashlib.sha1(raw.encode('utf-8')).hexdigest()}"
+
+
+class Flight:
+    """
+    One model call (`produce()` returning a str or an iterator of str chunks) running on
+    its own thread. Implements done()/error() like background.TaskHandle.
+    """
+
+    def __init__(self, produce):
+        self.routes = []            # model_router records of the request(s) that served it
+        self._chunks = []
+        self._error = None
+        self._done = False
+        self._cond = threading.Condition()
+        # Runs in a copy of the caller's context (metrics task label)
+        ctx = contextvars.copy_context()
+        threading.Thread(target=ctx.run, args=(self._run, produce), name="single-flight", daemon=True).start()
+
+    def _run(self, produce):
+        try:
+            with record_routes(self.routes):
+                result = produce()
+                for piece in [result] if isinstance(result, str) else result:
+                    with self._cond:
+                        self._chunks.append(piece)
+                        self._cond.notify_all()
+        except Exception as e:
+            with self._cond:
+                self._error = e
+        finally:
+            with self._cond:
+                self._done = True
+                self._cond.notify_all()
+
+    def done(self):
+        with self._cond:
+            return self._done
+
+    def error(self):
+        with self._cond:
+            return self._error if self._done else None
+
+    def chunks(self):
+        """Every chunk from the start, then live ones; re-raises the call's error at the end."""
+        seen = 0
+        while True:
+            with self._cond:
+                while seen >= len(self._chunks) and not self._done:
+                    self._cond.wait()
+                new = self._chunks[seen:]
+                seen = len(self._chunks)
+                if not new:
+                    if self._error is not None:
+                        raise self._error
+                    return
+            yield from new
+
+    def result(self):
+        return "".join(self.chunks())
+
+
+class _Starting:
+    """Placeholder registered while a call's start() runs outside the registry lock."""
+
+    def __init__(self):
+        self.call = None
+        self._started = threading.Event()
+
+    def done(self):
+        return False
+
+    def wait(self):
+        self._started.wait()
+        return self.call
+
+    def publish(self, call):
+        self.call = call
+        self._started.set()
+
+
+class SingleFlight:
+    def __init__(self, max_calls=MAX_CALLS):
+        self.max_calls = max_calls
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def join(self, key, start):
+        """
+        The call registered under `key`, if it is in flight or finished successfully;
+        otherwise `start()` (returning a Flight or TaskHandle) registered under `key`.
+        start() runs outside the registry lock (it may block, e.g. compacting a long
+        dialogue first); callers joining the same key meanwhile wait for its call.
+        """
+        while True:
+            with self._lock:
+                call = self._calls.get(key)
+                if call is None or (not isinstance(call, _Starting) and call.done() and call.error() is not None):
+                    starting = self._calls[key] = _Starting()
+                    break
+            if not isinstance(call, _Starting):
+                return call
+            call = call.wait()
+            if call is not None:
+                return call
+            # That start() failed; try again (as the starter, if nobody else is)
+
+        try:
+            call = start()
+        except BaseException:
+            with self._lock:
+                if self._calls.get(key) is starting:
+                    del self._calls[key]
+            starting.publish(None)
+            raise
+        with self._lock:
+            # Moved to the end: the most recently started call is evicted last
+            self._calls.pop(key, None)
+            self._calls[key] = call
+            self._evict()
+        starting.publish(call)
+        return call
+
+    def _evict(self):
+        for key in [k for k, c in self._calls.items() if c.done()]:
+            if len(self._calls) <= self.max_calls:
+                break
+            del self._calls[key]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._calls)
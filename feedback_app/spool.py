@@ -0,0 +1,198 @@
+# spool.py
+#
+# Durable write-ahead spool for final session records. "Submit All & Save" only
+# writes the record to a local SQLite database (WAL mode, synchronous=FULL); a
+# background replayer drains unsent records to Google Sheets with retries. Replay is
+# idempotent per student_id: rows already present in the sheet are not appended again.
+#
+# Every worker process runs a replayer from startup (so rows spooled before a crash or
+# restart go out without waiting for the next submission), all sharing one spool file.
+# A replayer first claims the rows it will send with a single UPDATE, so two processes
+# never send the same row; a claim held longer than CLAIM_LEASE (its process died
+# mid-send) can be taken over, and the new owner re-checks the sheet before sending.
+
+import atexit
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+from feedback_app.sheets import get_sheet_writer
+
+SPOOL_PATH = os.path.join("spool", "sessions.sqlite")
+CLAIM_LEASE = 600.0     # seconds before another replayer may take over a claimed row
+
+
+class SessionSpool:
+    def __init__(self, path=SPOOL_PATH):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS records ("
+            "student_id TEXT PRIMARY KEY, payload TEXT NOT NULL, created REAL NOT NULL, "
+            "attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, sent REAL)"
+        )
+        columns = {row[1] for row in self._db.execute("PRAGMA table_info(records)")}
+        # Spools created before claims existed
+        for column, ddl in (("claimed_by", "TEXT"), ("claimed_at", "REAL"), ("claims", "INTEGER NOT NULL DEFAULT 0")):
+            if column not in columns:
+                self._db.execute(f"ALTER TABLE records ADD COLUMN {column} {ddl}")
+        self._db.commit()
+
+    def put(self, data):
+        """Durably store one flattened record; a resubmission for the same student replaces the unsent one."""
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO records (student_id, payload, created) VALUES (?, ?, ?) "
+                "ON CONFLICT(student_id) DO UPDATE SET payload = excluded.payload WHERE sent IS NULL",
+                (data["student_id"], json.dumps(data, ensure_ascii=False), time.time()),
+            )
+            self._db.commit()
+
+    def unsent(self, limit=100):
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT student_id, payload FROM records WHERE sent IS NULL ORDER BY created LIMIT ?", (limit,)
+            ).fetchall()
+        return [(student_id, json.loads(payload)) for student_id, payload in rows]
+
+    def claim(self, owner, limit=100, lease=CLAIM_LEASE):
+        """
+        Atomically claim up to `limit` unsent rows no other replayer holds (or whose claim
+        is older than `lease`) for `owner`. Returns [(student_id, data, taken_over)], where
+        taken_over means an earlier claim on the row never finished.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "UPDATE records SET claimed_by = ?, claimed_at = ?, claims = claims + 1 WHERE student_id IN ("
+                "SELECT student_id FROM records WHERE sent IS NULL AND (claimed_by IS NULL OR claimed_at < ?) "
+                "ORDER BY created LIMIT ?)",
+                (owner, now, now - lease, limit),
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT student_id, payload, claims > attempts + 1 FROM records "
+                "WHERE sent IS NULL AND claimed_by = ? ORDER BY created",
+                (owner,),
+            ).fetchall()
+        # Every finished claim either set `sent` or counted an attempt, so extra claims were abandoned
+        return [(student_id, json.loads(payload), bool(taken_over)) for student_id, payload, taken_over in rows]
+
+    def mark_sent(self, student_ids):
+        with self._lock:
+            self._db.executemany("UPDATE records SET sent = ? WHERE student_id = ?", [(time.time(), s) for s in student_ids])
+            self._db.commit()
+
+    def mark_failed(self, student_ids, error):
+        with self._lock:
+            self._db.executemany(
+                "UPDATE records SET attempts = attempts + 1, last_error = ?, claimed_by = NULL WHERE student_id = ?",
+                [(str(error)[:500], s) for s in student_ids],
+            )
+            self._db.commit()
+
+    def pending_count(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM records WHERE sent IS NULL").fetchone()[0]
+
+
+class SpoolReplayer:
+    """Background thread draining the spool into the sheet; wake() triggers an immediate pass."""
+
+    def __init__(self, spool, writer_factory=get_sheet_writer, interval=30.0, max_backoff=600.0):
+        self.spool = spool
+        self._writer_factory = writer_factory
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._sent_ids = None
+        self._thread = threading.Thread(target=self._run, name="spool-replayer", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout=10.0):
+        self._stop.set()
+        self._wake.set()
+        self._thread.join(timeout)
+
+    def drain_once(self):
+        """Send every unsent record this replayer could claim; returns how many were confirmed in the sheet."""
+        batch = self.spool.claim(self.owner)
+        if not batch:
+            return 0
+        ids = [student_id for student_id, _, _ in batch]
+        try:
+            writer = self._writer_factory()
+            if self._sent_ids is None or any(taken_over for _, _, taken_over in batch):
+                # Records appended before a crash (here or in another process) must not be duplicated
+                self._sent_ids = set(writer.column_values(1))
+            new_records = [data for student_id, data, _ in batch if student_id not in self._sent_ids]
+            if new_records:
+                writer.write(new_records)
+        except Exception as e:
+            self.spool.mark_failed(ids, e)
+            raise
+        self._sent_ids.update(ids)
+        self.spool.mark_sent(ids)
+        return len(ids)
+
+    def _run(self):
+        delay = self.interval
+        while not self._stop.is_set():
+            try:
+                self.drain_once()
+                delay = self.interval
+            except Exception as e:
+                print(f"Spool replay failed, retrying in {delay:.0f}s: {e}")
+                delay = min(self.max_backoff, delay * 2)
+            self._wake.wait(delay)
+            self._wake.clear()
+        try:
+            self.drain_once()   # best-effort final pass on shutdown
+        except Exception:
+            pass
+
+
+_spool = None
+_replayer = None
+_lock = threading.Lock()
+
+
+def get_spool():
+    global _spool
+    with _lock:
+        if _spool is None:
+            _spool = SessionSpool()
+        return _spool
+
+
+def get_replayer():
+    """The process's replayer, started on first use and given a final drain at exit."""
+    global _replayer
+    spool = get_spool()
+    with _lock:
+        if _replayer is None:
+            _replayer = SpoolReplayer(spool).start()
+            atexit.register(_replayer.stop)
+        return _replayer
+
+
+def spool_session(data):
+    """Persist the final record locally and schedule its upload; returns without touching the network."""
+    get_spool().put(data)
+    get_replayer().wake()
@@ -1,22 +1,48 @@
 import streamlit as st
 import openai
-import pandas as pd
 from datetime import datetime
-import json
-import math
-import re
+from dataclasses import replace
+import functools
 from feedback_app.interactiveAgent import (
-    start_session,
+    provide_initial_feedback,
+    build_tutoring_messages,
     continue_session,
+    compact_history,
     evaluate_followup,
+    warm_llm_client,
     save_session_log,
-    save_followup_log,
-    save_session_to_google_sheet
+    save_followup_log
 )
+from feedback_app.problem_bank import STUDY_TASKS, get_problem_bank
+from feedback_app.similarity import get_similarity_index
+from feedback_app.spool import get_replayer, spool_session
+from feedback_app.log_store import new_id
+from feedback_app.background import run_in_background, QueueFull
+from feedback_app.metrics import set_task_label
+from feedback_app.model_router import record_routes
+from feedback_app.resilience import ModelUnavailable
+from feedback_app.single_flight import Flight, SingleFlight, fingerprint
+from feedback_app.session_store import RESUME_KEY, VersionConflict, get_session_store, new_resume_token
+from feedback_app.calculator import calculate, is_editable
+from feedback_app.chat_pane import render_bubble, render_styles, render_transcript, stream_into_bubble
+from feedback_app.session_log import (
+    log_event,
+    load_session,
+    flatten_session_log,
+    SESSION_STARTED,
+    ATTEMPT_SUBMITTED,
+    FEEDBACK_GENERATED,
+    CHAT_TURN,
+    INITIAL_RUBRIC_SUBMITTED,
+    RUBRIC_SUBMITTED,
+    FOLLOWUP_GRADED,
+    COMMENTS_SUBMITTED
+)
+from feedback_app.context_budget import truncate_student_input
 from feedback_app.prompts import (
     TUTOR_SYSTEM_PROMPT,
-    INITIAL_FEEDBACK_TEMPLATE,
-    EVALUATION_PROMPT_TEMPLATE
+    INITIAL_FEEDBACK_INSTRUCTIONS,
+    EVALUATION_INSTRUCTIONS
 )
 
 from feedback_app.instructions import (
@@ -28,12 +54,30 @@ from feedback_app.instructions import (
 
 #st.set_page_config(page_title="Tutoring", layout="wide")
 st.set_page_config(page_title="Tutoring Agent", layout="wide")
+warm_llm_client()
+get_replayer()  # replays rows spooled before a crash or restart without waiting for a submission
+
+# --------- Resume a participant from the shared session store ----------
+# ?resume=<token> lets any worker process (or a restarted one) pick the session up; the
+# token is random and kept out of the logs, so a student_id alone opens nothing
+session_store = get_session_store()
+if "student_id" not in st.session_state and st.query_params.get("resume"):
+    session_store.restore(st.session_state, st.query_params["resume"])
+
+def persist_session():
+    try:
+        session_store.sync(st.session_state)
+    except VersionConflict:
+        # Another tab or worker saved newer state; it has been loaded, so redraw from it
+        st.rerun()
+    except Exception as e:
+        print(f"Session store sync failed for {st.session_state.get('student_id')}: {e}")
 
 
 
 # --------- Initialisation of session-wide log data ----------
 if "student_id" not in st.session_state:
-    st.session_state.student_id = f"user_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    st.session_state.student_id = new_id("user")   # timestamp + random suffix: unique even within one second
 
 if "demographics" not in st.session_state:
     st.session_state.demographics = {
@@ -50,6 +94,7 @@ if "session_log_data" not in st.session_state:
         "tasks": []
     }
     st.session_state.task_completed = False
+    log_event(st.session_state.student_id, SESSION_STARTED, demographics=st.session_state.demographics)
 
 if "show_initial_rubric" not in st.session_state:
     st.session_state.show_initial_rubric = False
@@ -72,9 +117,19 @@ if "api_messages" not in st.session_state:
 if "transcript" not in st.session_state:
     st.session_state.transcript = [] 
 
+if RESUME_KEY not in st.session_state:
+    st.session_state[RESUME_KEY] = new_resume_token()
+
+if st.query_params.get("resume") != st.session_state[RESUME_KEY]:
+    st.query_params["resume"] = st.session_state[RESUME_KEY]
+
+# Saves whatever callbacks and the previous run changed before it called st.rerun()
+persist_session()
+
 
 # ---------- SIDEBAR PROGRESS INDICATOR ----------
-def render_sidebar_stepper(current_step, steps):
+@functools.lru_cache(maxsize=16)
+def sidebar_stepper_html(current_step, steps):
     sidebar_html = '<div style="padding: 20px 10px;">'
     for i, label in enumerate(steps):
         if i < current_step:
@@ -94,17 +149,23 @@ def render_sidebar_stepper(current_step, steps):
             f'</div></div>'
         )
     sidebar_html += "</div>"
-    st.sidebar.markdown(sidebar_html, unsafe_allow_html=True)
+    return sidebar_html
 
-# Call the stepper
-render_sidebar_stepper(
-    st.session_state.task_index,
-    ["Easy", "Medium", "Hard"]
-)
+@st.fragment
+def render_sidebar_stepper(current_step, steps):
+    # Fragments cannot target st.sidebar themselves; this one is called inside `with st.sidebar:`
+    st.markdown(sidebar_stepper_html(current_step, tuple(steps)), unsafe_allow_html=True)
+
+    # Visual progress bar
+    progress = (current_step + 1) / len(steps)
+    st.progress(min(progress, 1.0), text=f"{current_step + 1} of {len(steps)} tasks completed")
 
-# Visual progress bar
-progress = (st.session_state.task_index + 1) / 3
-st.sidebar.progress(progress, text=f"{st.session_state.task_index + 1} of 3 tasks completed")
+# Call the stepper
+with st.sidebar:
+    render_sidebar_stepper(
+        st.session_state.task_index,
+        [difficulty for _, difficulty in STUDY_TASKS]
+    )
 
 if not st.session_state.get("consent_given"):
     st.warning("Consent required. Redirecting...")
@@ -112,15 +173,15 @@ if not st.session_state.get("consent_given"):
 
 # Path to your dataset
 CSV_PATH = r'data/student_math_work_posts_augmented_successful_only.csv'
-df = pd.read_csv(CSV_PATH)
+bank = get_problem_bank(CSV_PATH)  # indexed once per server process, rebuilt only when the CSV changes
 
 # -------- Streamlit Config --------
 
-# Set up task progression (Easy → Medium → Hard)
+# Set up task progression (Easy → Medium → Hard); problems are referenced by their
+# stable problem-bank id (forum thread id), so reordering or extending the CSV is safe
 TASKS = [
-    {"label": "Problem 1: Easy", "index": 5},
-    {"label": "Problem 2: Medium", "index": 35},
-    {"label": "Problem 3: Hard", "index": 3},
+    {"label": f"Problem {number}: {difficulty}", "difficulty": difficulty, "problem_id": problem_id}
+    for number, (problem_id, difficulty) in enumerate(STUDY_TASKS, start=1)
 ]
 
 # Start at task 0 if not already started
@@ -138,47 +199,39 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-# --- Toggle in sidebar ---
-st.sidebar.subheader("🧮 Calculator")
-
+# -------- Sidebar Calculator --------
 # --- init session state ---
 if "calc_expr" not in st.session_state:
     st.session_state.calc_expr = ""
 
-# --- helper to update expression BEFORE the input is rendered ---
+# --- callbacks update the expression BEFORE the input is rendered ---
 def _append(txt):
-    if st.session_state.calc_expr == "Error":
+    if not is_editable(st.session_state.calc_expr):
         st.session_state.calc_expr = ""
     st.session_state.calc_expr += txt
 
 def _evaluate():
-    try:
-        expr_eval = re.sub(r"\s+", "", st.session_state.calc_expr)
-
-        # 5nCr3 or nCr(5,3)
-        expr_eval = re.sub(r"(\d+)nCr(\d+)", r"math.comb(\1,\2)", expr_eval)
-        expr_eval = expr_eval.replace("nCr(", "math.comb(")
-
-        # 5nPr2 or nPr(5,2)
-        expr_eval = re.sub(r"(\d+)nPr(\d+)", r"math.perm(\1,\2)", expr_eval)
-        expr_eval = expr_eval.replace("nPr(", "math.perm(")
-
-        # factorial like 5!
-        while re.search(r"(\d+)!", expr_eval):
-            expr_eval = re.sub(r"(\d+)!", r"math.factorial(\1)", expr_eval)
-
-        result = eval(expr_eval, {"math": math, "__builtins__": None}, {})
-        st.session_state.calc_expr = str(result)
-    except Exception:
-        st.session_state.calc_expr = "Error"
+    # Parsed and evaluated with size/time budgets (see calculator.py); shows "Too large" or "Error" on failure
+    st.session_state.calc_expr = calculate(st.session_state.calc_expr)
 
 def _clear():
     st.session_state.calc_expr = ""
 
-# --- buttons (we update state before rendering the input) ---
 ops_map = {"÷": "/", "×": "*", "−": "-", "＋": "+"}
 
-rows = [
+def _press(b):
+    if b == "=":
+        _evaluate()
+    elif b == "Clear":
+        _clear()
+    elif b == "n!":
+        _append("!")
+    elif b in ops_map:
+        _append(ops_map[b])    # append real operator
+    else:
+        _append(b)
+
+CALC_ROWS = [
     ["0","1","2","÷"],
     ["3","4","5","×"],
     ["6","7","8","−"],
@@ -186,48 +239,55 @@ rows = [
     ["nCr","nPr","n!","Clear"],
 ]
 
-for r_idx, row in enumerate(rows):
-    cols = st.sidebar.columns(4, gap="small")
-    for c_idx, b in enumerate(row):
-        # safe, alphanumeric key
-        if cols[c_idx].button(b, key=f"btn_{r_idx}_{c_idx}"):
-            if b == "=":
-                _evaluate()
-            elif b == "Clear":
-                _clear()
-            elif b == "n!":
-                _append("!")
-            elif b in ops_map:
-                _append(ops_map[b])    # append real operator
-            else:
-                _append(b)
+@st.fragment
+def sidebar_calculator():
+    # A keypress reruns only this fragment, never the chat or the rest of the page
+    st.subheader("🧮 Calculator")
+    for r_idx, row in enumerate(CALC_ROWS):
+        cols = st.columns(4, gap="small")
+        for c_idx, b in enumerate(row):
+            # safe, alphanumeric key
+            cols[c_idx].button(b, key=f"btn_{r_idx}_{c_idx}", on_click=_press, args=(b,))
 
-# --- NOW RENDER THE INPUT (binds to the updated state) ---
-st.sidebar.text_input("Expression", key="calc_expr", placeholder="e.g. 5nCr3 + 2*4 or 5!")
+    # --- the input binds to the state the callbacks just updated ---
+    st.text_input("Expression", key="calc_expr", placeholder="e.g. 5nCr3 + 2*4 or 5!")
 
-st.sidebar.caption("Supports: `nCr`, `nPr`, factorial `!`, and basic arithmetic.")
+    st.caption("Supports: `nCr`, `nPr`, factorial `!`, and basic arithmetic.")
+
+with st.sidebar:
+    sidebar_calculator()
 
 
 st.title("💡 AI Tutoring System")
 
 # -------- Task Progression --------
+# Model-call metrics from this run (and the grading it schedules) are tagged with the task
+set_task_label(TASKS[st.session_state.task_index]["difficulty"] if st.session_state.task_index < len(TASKS) else None)
+
 if st.session_state.task_index < len(TASKS):
     current_task = TASKS[st.session_state.task_index]
-    selected_index = current_task["index"]
-    row = df.iloc[selected_index - 2]
+    task_problem = bank.get(current_task["problem_id"])
+    if not task_problem.similar_problem:
+        # No generated follow-up for this row: use the closest bank problem that has a solution
+        has_solution = lambda pid: pid in bank.by_id and bool(bank.by_id[pid].solution)
+        for neighbour_id, _ in get_similarity_index(bank).similar(task_problem.id, k=1, where=has_solution):
+            neighbour = bank.by_id[neighbour_id]
+            task_problem = replace(task_problem, similar_problem=neighbour.problem, similar_solution=neighbour.solution)
 
     # Only load if not already loaded
     if "problem" not in st.session_state or st.session_state.mode == "done":
-        st.session_state.problem = row["problem_statement"]
-        st.session_state.correct_solution = row.get("problem_solution", "")
-        st.session_state.similar_problem = row.get("new_problem", "")
-        st.session_state.similar_solution = row.get("new_solution", "")
+        st.session_state.problem = task_problem.problem
+        st.session_state.correct_solution = task_problem.solution
+        st.session_state.similar_problem = task_problem.similar_problem
+        st.session_state.similar_solution = task_problem.similar_solution
         st.session_state.task_log = {}
         st.session_state.mode = "awaiting_first_attempt"
 
         st.session_state.api_messages = []               # what you send to the API
+        st.session_state.compaction = None               # (messages covered, task) of a running summary
         st.session_state.transcript = []                 # what you render/save (no system)
         st.session_state.initial_feedback = ""        
+        st.session_state.pending_reply = False
 
         st.session_state.messages = []
         st.session_state.student_reply = ""
@@ -241,86 +301,51 @@ if st.session_state.task_index < len(TASKS):
 # st.markdown(f"**Problem**: {st.session_state.problem}")
 # st.markdown(f"**Student Attempt**: {st.session_state.student_attempt}")
 
+# -------- Model calls of this session --------
+def session_flights():
+    # In-flight and finished model calls of the current task, keyed by request fingerprint
+    if "single_flight" not in st.session_state:
+        st.session_state.single_flight = SingleFlight()
+    return st.session_state.single_flight
+
 # -------- Chat Display --------
 st.subheader("Chat with Tutor")
 
 st.markdown(f'<div class="instruction-box">{DIALOGUE_INSTRUCTIONS}</div>', unsafe_allow_html=True)
 
-chat_styles = """
-<style>
-.chat-container {
-    display: flex;
-    flex-direction: column;
-    gap: 10px;
-    margin-top: 10px;
-    padding-left: 10px;
-    padding-right: 10px;
-}
-
-.bubble {
-    padding: 12px 16px;
-    border-radius: 12px;
-    border: 2px solid;
-    background-color: #000000;
-    font-family: sans-serif;
-    font-size: 16px;
-    display: inline-block;
-    max-width: 70%;
-    word-wrap: break-word;
-    margin-top: 6px;
-    margin-bottom: 6px;
-}
-
-.student {
-    border-color: #ff4d4d;
-    color: #ff4d4d;
-    align-self: flex-end;
-    text-align: left;
-    font-size: 20px;
-}
-
-.tutor {
-    border-color: #3399ff;
-    color: #3399ff;
-    align-self: flex-start;
-    text-align: left;
-    font-size: 20px;
-}
-
-.instruction-box {
-    font-size: 30px;
-    font-weight: 600;
-    line-height: 1.6;
-    margin-top: 20px;
-    margin-bottom: 20px;
-    color: #4CAF50; /* A pleasant green */
-    background-color: rgba(76, 175, 80, 0.1); /* Subtle green tint */
-    padding: 12px;
-    border-left: 5px solid #4CAF50;
-    border-radius: 6px;
-}
-
-.problem {
-    border-color: #9b59b6;
-    color: #9b59b6;
-    align-self: center;
-    text-align: left;
-    font-size: 20px;
-}
-
-</style>
-"""
-
-st.markdown(chat_styles, unsafe_allow_html=True)
+render_styles()
 st.markdown('<div class="chat-container">', unsafe_allow_html=True)
 
+# -------- History Compaction --------
+# Once the dialogue outgrows the token budget, older turns are folded into a running
+# summary (see context_budget.py). The summary is built in the background after a reply
+# has been shown; until it is ready, requests keep using the current history.
+def start_compaction():
+    if st.session_state.get("compaction") is None:
+        messages = st.session_state.api_messages
+        try:
+            task = run_in_background("summary", compact_history, list(messages), block_timeout=0)
+        except QueueFull:
+            return  # the pool is saturated; try again after the next reply
+        st.session_state.compaction = (len(messages), task)
+
+def adopt_compacted_history():
+    pending = st.session_state.get("compaction")
+    if pending is None or not pending[1].done():
+        return
+    covered, task = pending
+    st.session_state.compaction = None
+    if task.error() is None:
+        # Turns added since the summary started are kept after it
+        st.session_state.api_messages = task.result() + st.session_state.api_messages[covered:]
+
 if st.session_state.get("mode") in ["initial_feedback", "main"] and "initial_feedback" in st.session_state:
     # problem bubble
-    st.markdown(f'<div class="bubble problem">🧩 <b>Problem:</b><br>{st.session_state.problem.replace("\n","<br>")}</div>', unsafe_allow_html=True)
+    render_bubble("problem", "🧩 <b>Problem:</b>", st.session_state.problem)
     # student attempt
-    st.markdown(f'<div class="bubble student">🧑‍🎓 <b>Initial attempt:</b><br>{st.session_state.student_attempt.replace("\n","<br>")}</div>', unsafe_allow_html=True)
+    render_bubble("student", "🧑‍🎓 <b>Initial attempt:</b>", st.session_state.student_attempt)
     # tutor initial feedback
-    st.markdown(f'<div class="bubble tutor">🤖 <b>Feedback:</b><br>{st.session_state.initial_feedback.replace("\n","<br>")}</div>', unsafe_allow_html=True)
+    render_bubble("tutor", "🤖 <b>Feedback:</b>", st.session_state.initial_feedback)
 
 if st.session_state.show_initial_rubric and not st.session_state.initial_rubric_submitted:
     st.markdown("### 🧭 Quick Check on the Initial Feedback")
@@ -346,6 +371,8 @@ if st.session_state.show_initial_rubric and not st.session_state.initial_rubric_
             "Coverage": st.session_state.init_coverage,
             "Conciseness": st.session_state.init_conciseness
         }
+        log_event(st.session_state.student_id, INITIAL_RUBRIC_SUBMITTED, st.session_state.task_index,
+                  rubrics=st.session_state.task_log["initial_rubrics"])
         st.session_state.initial_rubric_submitted = True
         st.session_state.show_initial_rubric = False
         st.session_state.mode = "main"          # switch to main
@@ -360,17 +387,49 @@ if st.session_state.get("mode") == "awaiting_first_attempt":
     if st.button("🚀 Submit Initial Attempt") and first_attempt.strip():
         st.session_state.student_attempt = first_attempt.strip()
         st.session_state["attempt_submitted"] = True 
+        log_event(
+            st.session_state.student_id, ATTEMPT_SUBMITTED, st.session_state.task_index,
+            problem=st.session_state.problem,
+            student_attempt=st.session_state.student_attempt,
+            correct_solution=st.session_state.correct_solution,
+            similar_problem=st.session_state.similar_problem,
+            similar_solution=st.session_state.similar_solution
+        )
 
-        # Now start the session using the user's typed answer
-        initial_feedback, seed_messages = start_session(
+        # Now start the session using the user's typed answer, streaming the feedback as it arrives
+        # (feedback_routes records which model tier served it, see model_router.py)
+        # A double-click (or a rerun mid-stream) joins the request already in flight instead of sending another
+        flight = session_flights().join(
+            fingerprint("initial_feedback", st.session_state.task_index, st.session_state.problem,
+                        st.session_state.student_attempt),
+            lambda: Flight(functools.partial(
+                provide_initial_feedback,
+                st.session_state.problem,
+                st.session_state.student_attempt,
+                st.session_state.correct_solution,
+                INITIAL_FEEDBACK_INSTRUCTIONS,
+                stream=True
+            ))
+        )
+        feedback_routes = flight.routes
+        try:
+            initial_feedback, feedback_latency = stream_into_bubble(flight.chunks(), "tutor", "🤖 <b>Feedback:</b>")
+        except ModelUnavailable as e:
+            # The attempt stays in the text area; submitting again asks for the feedback again
+            st.error(str(e))
+            st.stop()
+        log_event(st.session_state.student_id, FEEDBACK_GENERATED, st.session_state.task_index,
+                  initial_feedback=initial_feedback, latency=feedback_latency, routes=feedback_routes)
+        seed_messages = build_tutoring_messages(
             st.session_state.problem,
             st.session_state.student_attempt,
             st.session_state.correct_solution,
             TUTOR_SYSTEM_PROMPT,
-            INITIAL_FEEDBACK_TEMPLATE
+            initial_feedback
         )
 
         st.session_state.api_messages = seed_messages[:]   # copy
+        st.session_state.compaction = None
         st.session_state.transcript = []
         st.session_state.initial_feedback = initial_feedback
         st.session_state.messages = seed_messages
@@ -386,66 +445,93 @@ if st.session_state.get("mode") == "awaiting_first_attempt":
             "followup_response": "",
             "followup_feedback": "",
             "rubrics": {},
+            "latencies": {"initial_feedback": feedback_latency, "turns": []},
+            "routes": feedback_routes,
             "timestamp": str(datetime.now())
         }
 
         st.session_state.mode = "initial_feedback"
-        st.session_state.task_log["messages"] = [m.copy() for m in st.session_state.transcript]
         st.session_state.show_initial_rubric = True
         st.session_state.initial_rubric_submitted = False
         st.rerun()
 
-if st.session_state.get("mode") == "main":
-    for msg in st.session_state.transcript:
-        content = msg["content"].replace("\n", "<br>")
-        if msg["role"] == "user":
-            bubble = f'<div class="bubble student">🧑‍🎓 <b>Student:</b><br>{content}</div>'
-        elif msg["role"] == "assistant":
-            bubble = f'<div class="bubble tutor">🤖 <b>Tutor:</b><br>{content}</div>'
-        st.markdown(bubble, unsafe_allow_html=True)
-
 # -------- Input Interaction --------
 def send_and_clear():
     text = st.session_state.student_reply.strip()
-    if not text:
+    if not text or st.session_state.get("pending_reply"):
         return
 
-    # 1) Append user turn to BOTH
-    st.session_state.api_messages.append({"role": "user", "content": text})
+    # 1) Append user turn to BOTH (only the model sees the length-capped version)
+    st.session_state.api_messages.append({"role": "user", "content": truncate_student_input(text)})
     st.session_state.transcript.append({"role": "user", "content": text})
+    st.session_state.task_log["messages"].append({"role": "user", "content": text})
+    log_event(st.session_state.student_id, CHAT_TURN, st.session_state.task_index, role="user", content=text)
 
-    # 2) Get assistant reply using API messages
-    reply = continue_session(st.session_state.api_messages)
-
-    # 3) Append assistant turn to BOTH
-    st.session_state.api_messages.append({"role": "assistant", "content": reply})
-    st.session_state.transcript.append({"role": "assistant", "content": reply})
-
-    # 4) Save a deep copy to the task_log (so later mutations don’t affect saved data)
-    st.session_state.task_log["messages"] = [m.copy() for m in st.session_state.transcript]
+    # 2) The reply is streamed into the chat during the rerun this callback triggers
+    st.session_state.pending_reply = True
 
-    # 5) Clear the input + rerun
+    # 3) Clear the input
     st.session_state.student_reply = ""
-    st.rerun()
 
 
+@st.fragment
+def chat_dialogue():
+    # Sending a reply reruns only this fragment; past bubbles come from the bubble_html cache
+    set_task_label(TASKS[st.session_state.task_index]["difficulty"])
+    render_transcript(st.session_state.transcript)
+
+    # Stream the tutor's answer to a reply queued by send_and_clear below the existing bubbles
+    if st.session_state.get("pending_reply"):
+        def start_reply():
+            adopt_compacted_history()
+            return Flight(functools.partial(continue_session, list(st.session_state.api_messages), stream=True))
+
+        # A rerun that interrupted this reply re-attaches to it (keyed on the transcript, which is never compacted)
+        with record_routes([]) as turn_routes:
+            flight = session_flights().join(
+                fingerprint("tutoring_turn", st.session_state.task_index, len(st.session_state.transcript),
+                            st.session_state.transcript[-1]["content"]),
+                start_reply
+            )
+        turn_routes = turn_routes + flight.routes
+        try:
+            reply, turn_latency = stream_into_bubble(flight.chunks(), "tutor", "🤖 <b>Tutor:</b>")
+        except ModelUnavailable as e:
+            # pending_reply stays set, so the next run of this pane asks for the reply again
+            st.error(str(e))
+            st.button("🔁 Try again")
+            return
+
+        # Append assistant turn to BOTH, plus the task_log and the event stream (O(1) per turn)
+        st.session_state.api_messages.append({"role": "assistant", "content": reply})
+        st.session_state.transcript.append({"role": "assistant", "content": reply})
+        st.session_state.task_log["messages"].append({"role": "assistant", "content": reply})
+        st.session_state.task_log.setdefault("latencies", {"turns": []})["turns"].append(turn_latency)
+        st.session_state.task_log.setdefault("routes", []).extend(turn_routes)
+        log_event(st.session_state.student_id, CHAT_TURN, st.session_state.task_index,
+                  role="assistant", content=reply, latency=turn_latency, routes=turn_routes)
+        st.session_state.pending_reply = False
+        start_compaction()
+        persist_session()
+
+    st.text_input(
+        "✍️ Enter your reply or question to the tutor:",
+        key="student_reply"
+    )
+    st.button("📨 Send Reply", on_click=send_and_clear)
+
+
+# -------- Show the dialogue and input during main mode --------
+if st.session_state.get("mode") == "initial_feedback" and not st.session_state.initial_rubric_submitted:
+    st.info("Please complete the quick evaluation above before replying.")
 
-# -------- Show input during initial and main mode --------
-if st.session_state.get("mode") in ["initial_feedback", "main"]:
-    if st.session_state.get("mode") == "initial_feedback" and not st.session_state.initial_rubric_submitted:
-        st.info("Please complete the quick evaluation above before replying.")
-    else:
-        st.text_input(
-            "✍️ Enter your reply or question to the tutor:",
-            key="student_reply"
-        )
-        st.button("📨 Send Reply", on_click=send_and_clear)
+if st.session_state.get("mode") == "main":
+    chat_dialogue()
 
 
 # -------- Finish Phase --------
 if st.session_state.get("mode") == "main" and st.session_state.initial_rubric_submitted:
     if st.button("✅ Finish Tutoring / Go to Evaluation"):
-        st.session_state.task_log["messages"] = [m.copy() for m in st.session_state.transcript]
         st.session_state.show_rubric = True
         st.session_state.finish_button_clicked = True
         st.session_state.mode = "evaluation"
@@ -473,11 +559,28 @@ if st.session_state.get("mode") == "evaluation" and st.session_state.get("show_r
             }
 
             st.session_state.task_log["rubrics"] = rubric_scores
+            log_event(st.session_state.student_id, RUBRIC_SUBMITTED, st.session_state.task_index, rubrics=rubric_scores)
             st.success("Evaluation Submitted!")
             st.session_state.show_rubric = False
             st.session_state.mode = "followup"
             st.rerun()
 
+# -------- Background Tasks --------
+@st.fragment(run_every=1.0)
+def poll_background_task(state_key):
+    # Reruns on its own every second; hands control back to the full page once the task is done
+    handle = st.session_state.get(state_key)
+    if handle is None or handle.done():
+        st.rerun()
+    st.info(f"⏳ {handle.label.capitalize()}")
+
+def save_log(fn, *args, **kwargs):
+    # Log writes must not be lost: if the pool stays saturated, write on the script thread instead
+    try:
+        run_in_background("log", fn, *args, block_timeout=0.5, **kwargs)
+    except QueueFull:
+        fn(*args, **kwargs)
+
 # -------- Follow-Up --------
 if st.session_state.get("mode") == "followup":
     st.subheader("🧪 Try a Similar Problem")
@@ -486,25 +589,70 @@ if st.session_state.get("mode") == "followup":
 
     one_shot = st.text_area("✍️ Your one-shot solution:")
 
-    if st.button("📝 Submit Answer") and one_shot.strip() != "":
-        feedback = evaluate_followup(
-            st.session_state.similar_problem,
-            one_shot,
-            st.session_state.similar_solution,
-            EVALUATION_PROMPT_TEMPLATE
-        )
-        st.session_state.feedback = feedback
-        st.session_state.task_log["followup_response"] = one_shot
-        st.session_state.task_log["followup_feedback"] = feedback
-        st.session_state.task_log["timestamp"] = str(datetime.now())
-        st.session_state.show_feedback = True  # trigger display of feedback
+    if st.button("📝 Submit Answer") and one_shot.strip() != "" and not st.session_state.get("grading_task"):
+        # Grade on the shared background pool; the page polls the handle instead of blocking
+        def start_grading():
+            # The background task inherits this context, so its route record lands in grading_routes
+            with record_routes([]) as grading_routes:
+                handle = run_in_background(
+                    "grading",
+                    evaluate_followup,
+                    st.session_state.similar_problem,
+                    one_shot,
+                    st.session_state.similar_solution,
+                    EVALUATION_INSTRUCTIONS
+                )
+            st.session_state.grading_routes = grading_routes
+            return handle
+
+        try:
+            # The same answer is graded once per task; resubmitting it reuses the grade
+            st.session_state.grading_task = session_flights().join(
+                fingerprint("followup_grading", st.session_state.task_index, st.session_state.similar_problem,
+                            one_shot.strip()),
+                start_grading
+            )
+            st.session_state.followup_answer = one_shot
+        except QueueFull:
+            st.warning("The server is busy right now, please submit again in a few seconds.")
+
+    grading_task = st.session_state.get("grading_task")
+    if grading_task is not None and grading_task.done():
+        if isinstance(grading_task.error(), ModelUnavailable):
+            st.session_state.grading_task = None
+            st.error(str(grading_task.error()))
+        elif grading_task.error() is not None:
+            st.session_state.grading_task = None
+            st.error("Grading failed, please submit your answer again.")
+        else:
+            feedback = grading_task.result()
+            one_shot = st.session_state.followup_answer
+            # Saved first: if this raises, the grade is still pending and the next run retries
+            save_log(save_followup_log,
+                     st.session_state.similar_problem, one_shot, st.session_state.similar_solution, feedback,
+                     session_id=st.session_state.student_id)
+            st.session_state.grading_task = None
+            st.session_state.feedback = feedback
+            st.session_state.task_log["followup_response"] = one_shot
+            st.session_state.task_log["followup_feedback"] = feedback
+            st.session_state.task_log["timestamp"] = str(datetime.now())
+            grading_routes = st.session_state.pop("grading_routes", [])
+            st.session_state.task_log.setdefault("routes", []).extend(grading_routes)
+            log_event(st.session_state.student_id, FOLLOWUP_GRADED, st.session_state.task_index,
+                      response=one_shot, feedback=feedback, routes=grading_routes)
+            st.session_state.show_feedback = True  # trigger display of feedback
+    elif grading_task is not None:
+        poll_background_task("grading_task")
 
     # Display feedback (if already submitted)
     if st.session_state.get("show_feedback"):
         st.markdown("### 🎯 Tutor Feedback:")
         st.success(st.session_state.feedback)
         if not st.session_state.task_completed:
-            st.session_state.task_log["messages"] = [m.copy() for m in st.session_state.transcript]
+            save_log(save_session_log,
+                     st.session_state.problem, st.session_state.student_attempt,
+                     st.session_state.correct_solution, list(st.session_state.transcript),
+                     session_id=st.session_state.student_id)
             st.session_state.session_log_data["tasks"].append(st.session_state.task_log)
             st.session_state.task_completed = True
 
@@ -524,7 +672,8 @@ if st.session_state.get("mode") == "followup":
                     "show_feedback",
                     "show_rubric",
                     "student_attempt",
-                    "show_initial_rubric","initial_rubric_submitted","initial_feedback"
+                    "show_initial_rubric","initial_rubric_submitted","initial_feedback",
+                    "grading_task","grading_routes","followup_answer","single_flight"
                 ]:
                     if key in st.session_state:
                         del st.session_state[key]
@@ -536,39 +685,14 @@ if st.session_state.get("mode") == "followup":
             st.markdown("### 💬 Additional Comments (optional)")
             st.session_state.additional_comments = st.text_area("Please share here anything you might like to add regarding this study. Did you find it usefull? Did the whole process go smoothly for you?", key="extra_comments")
 
-            def compact(messages):
-                # Optional: rename roles for readability
-                role_map = {"assistant":"Tutor","user":"Student"}
-                return [{"who": role_map.get(m["role"], m["role"]), "text": m["content"]} for m in messages]
-            
-            def flatten_session_log(log):
-                        flat = {
-                            "student_id": log["student_id"],
-                            "age": log["demographics"].get("age", ""),
-                            "gender": log["demographics"].get("gender", ""),
-                            "academic_background": log["demographics"].get("academic_background", ""),
-                            "academic_level": log["demographics"].get("academic_level", ""),
-                        }
-                        for i, task in enumerate(log["tasks"]):
-                            prefix = f"task_{i+1}_"
-                            flat[prefix + "problem"] = task["problem"]
-                            flat[prefix + "attempt"] = task["student_attempt"]
-                            flat[prefix + "initial_feedback"] = task.get("initial_feedback", "")    
-                            flat[prefix + "initial_rubrics"] = json.dumps(task.get("initial_rubrics", {}))
-                            clean = compact(task.get("messages", []))
-                            flat[prefix + "messages"] = json.dumps(clean, ensure_ascii=False)
-                            flat[prefix + "rubrics"] = json.dumps(task.get("rubrics", {}))
-                            flat[prefix + "followup_problem"] = task["similar_problem"]
-                            flat[prefix + "followup_response"] = task["followup_response"]
-                            flat[prefix + "followup_feedback"] = task["followup_feedback"]
-
-                        flat["additional_comments"] = log.get("additional_comments", "")
-                        return flat
-
             if st.button("✅ Submit All & Save"):
                 st.session_state.session_log_data["additional_comments"] = st.session_state.get("additional_comments", "")
-                final_data = flatten_session_log(st.session_state.session_log_data)
-                save_session_to_google_sheet(final_data)
+                log_event(st.session_state.student_id, COMMENTS_SUBMITTED,
+                          additional_comments=st.session_state.session_log_data["additional_comments"])
+                # The saved record is rebuilt from the event stream, not from this tab's memory
+                final_data = flatten_session_log(load_session(st.session_state.student_id))
+                spool_session(final_data)   # durable locally; uploaded to Sheets in the background
                 st.success("All your data has been saved!")
 
-
+# Save what this run changed
+persist_session()
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+from feedback_app.calculator import (
+    ERROR,
+    TOO_LARGE,
+    CalcError,
+    TooLarge,
+    calculate,
+    evaluate,
+    is_editable,
+)
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("5nCr3 + 2*4", "18"),
+    ("2*5nPr2", "40"),
+    ("2 + 3 * 4", "14"),
+    ("(2 + 3) * 4", "20"),
+    ("-2**2", "-4"),
+    ("2**3**2", "512"),
+    ("nCr(6, 2) + nPr(5, 2)", "35"),
+    ("7 / 2", "3.5"),
+    ("3nCr5", "0"),
+])
+def test_precedence_and_operators(text, expected):
+    assert calculate(text) == expected
+
+
+def test_repeated_factorial_applies_left_to_right():
+    # 4!! is (4!)! = 24!, not a double factorial
+    assert calculate("4!!") == "620448401733239439360000"
+    assert calculate("3!!") == "720"
+
+
+@pytest.mark.parametrize("text", ["99999!", "9**9**9", "10**400/3", "2**10000000", "100000nCr50000", "9" * 201])
+def test_oversized_results_are_refused_quickly(text):
+    started = time.perf_counter()
+    assert calculate(text) == TOO_LARGE
+    assert time.perf_counter() - started < 0.5
+    with pytest.raises(TooLarge):
+        evaluate(text)
+
+
+def test_large_choose_is_shown_compactly():
+    display = calculate("1000nCr500")
+    assert display == "2.70288e+299 (300 digits)"
+    assert not is_editable(display)
+
+
+def test_results_below_the_compact_limit_are_exact():
+    assert calculate("25!") == "15511210043330985984000000"
+    assert is_editable(calculate("25!"))
+
+
+@pytest.mark.parametrize("text", ["", "2+", "(1", "1)", "abc", "5nCr", "2**", "nCr(5)", "1..2", "4.5!", "(-3)!", "5nCr-1"])
+def test_malformed_input_is_an_error(text):
+    assert calculate(text) == ERROR
+    assert not is_editable(ERROR)
+
+
+@pytest.mark.parametrize("text", ["1/0", "5/(3-3)", "0**-1"])
+def test_division_by_zero_is_an_error(text):
+    assert calculate(text) == ERROR
+    with pytest.raises(CalcError):
+        evaluate(text)
@@ -0,0 +1,53 @@
+from feedback_app.hint_bank import number_words, vet_hint
+
+PROBLEM = "A committee of 3 is chosen from 10 people, of whom 4 are women. In how many ways can at least one woman be chosen?"
+SOLUTION = """All committees: C(10, 3) = 120.
+Committees without women: C(6, 3) = 20.
+So the answer is 120 - 20 = \\boxed{100}."""
+
+
+def test_a_safe_hint_passes():
+    hint = "Try counting the complement: how many committees of 3 contain no women at all?"
+    assert vet_hint(hint, PROBLEM, SOLUTION)
+
+
+def test_numbers_from_the_problem_are_allowed():
+    assert vet_hint("There are 10 people and 4 of them are women; how many are men?", PROBLEM, SOLUTION)
+
+
+def test_final_answer_is_rejected():
+    assert not vet_hint("You should get 100 in the end.", PROBLEM, SOLUTION)
+
+
+def test_final_answer_spelled_out_is_rejected():
+    assert not vet_hint("The count comes out to one hundred.", PROBLEM, SOLUTION)
+    assert not vet_hint("Only twenty committees have no women.", PROBLEM, SOLUTION)
+
+
+def test_intermediate_values_are_rejected():
+    assert not vet_hint("First note there are 120 committees in total.", PROBLEM, SOLUTION)
+    assert not vet_hint("How many committees have no women? (It is 20.)", PROBLEM, SOLUTION)
+
+
+def test_final_expression_is_rejected():
+    solution = "Each element is in or out, so the answer is $2^n$.\nHence |P(S)| = 2^n."
+    assert not vet_hint("Can you see why the count is 2^n?", "How many subsets does a set of n elements have?", solution)
+    assert vet_hint("Try small cases first, like n = 1 or n = 3.", "How many subsets does a set of n elements have?", solution)
+
+
+def test_final_line_is_rejected():
+    solution = "Pair each subset with its complement.\nTherefore exactly half of the subsets have even size."
+    hint = "Think about it: therefore exactly half of the subsets have even size."
+    assert not vet_hint(hint, "How many subsets of {1..n} have even size?", solution)
+
+
+def test_overlong_or_empty_hints_are_rejected():
+    assert not vet_hint("", PROBLEM, SOLUTION)
+    assert not vet_hint("Think. " * 200, PROBLEM, SOLUTION)
+
+
+def test_number_words():
+    assert number_words(7) == "seven"
+    assert number_words(42) == "forty two"
+    assert number_words(105) == "one hundred five"
+    assert number_words(2024) == "two thousand twenty four"
@@ -0,0 +1,36 @@
+import multiprocessing
+
+from feedback_app.log_store import LogStore
+
+
+def _write(directory, worker):
+    store = LogStore(directory, "t", max_bytes=2000)
+    for i in range(200):
+        store.append(f"k{i % 10}", {"worker": worker, "i": i})
+        if i % 40 == 0:
+            store.get(f"k{(i + worker) % 10}")
+    store.close()
+
+
+def test_records_are_found_by_key_across_rotation(tmp_path):
+    store = LogStore(str(tmp_path), "t", max_bytes=500)
+    for i in range(50):
+        store.append(f"k{i % 3}", {"i": i})
+    assert [r["i"] for r in store.get("k1")] == list(range(1, 50, 3))
+    assert any(path.name.endswith(".jsonl.gz") for path in tmp_path.iterdir())
+    assert len(list(store.iter_records())) == 50
+
+
+def test_several_writer_processes_share_a_directory(tmp_path):
+    workers = [multiprocessing.Process(target=_write, args=(str(tmp_path), n)) for n in range(4)]
+    for p in workers:
+        p.start()
+    for p in workers:
+        p.join()
+    assert [p.exitcode for p in workers] == [0] * 4
+
+    store = LogStore(str(tmp_path), "t")
+    records = list(store.iter_records())
+    assert len(records) == len({(r["worker"], r["i"]) for r in records}) == 800
+    assert sum(len(store.get(k)) for k in store.keys()) == 800
+    assert [r["i"] for r in store.get("k3") if r["worker"] == 2] == list(range(3, 200, 10))
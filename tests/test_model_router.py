@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+from feedback_app import interactiveAgent, llm_client, model_router, resilience, response_cache
+from feedback_app.fakes import FakeChatServer
+from feedback_app.llm_client import LLMConfig
+from feedback_app.model_router import Route
+from feedback_app.resilience import DeadlineExceeded
+from feedback_app.response_cache import ResponseCache
+
+MESSAGES = [{"role": "user", "content": "What is 5 choose 3?"}]
+
+
+def test_every_primary_tier_gets_its_deadline():
+    assert Route("fast", 8.0).plan() == [("fast", model_router.TIERS["fast"], 8.0)]
+    assert Route("quality", 6.0, fallback="fast").plan() == [
+        ("quality", model_router.TIERS["quality"], 6.0),
+        ("fast", model_router.TIERS["fast"], None),
+    ]
+
+
+@pytest.fixture
+def server(monkeypatch, tmp_path):
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_windows", {})
+    monkeypatch.setitem(model_router.TIERS, "quality", "quality-model")
+    monkeypatch.setitem(model_router.TIERS, "fast", "fast-model")
+    monkeypatch.setattr(response_cache, "_cache", ResponseCache(str(tmp_path / "responses.sqlite")))
+    with FakeChatServer(reply_chars=60, model_latency={"quality-model": 2.0}) as fake:
+        llm_client.configure(LLMConfig(api_key="test", base_url=fake.base_url))
+        yield fake
+    llm_client.configure()
+
+
+def test_single_tier_route_fails_at_its_deadline(server, monkeypatch):
+    monkeypatch.setitem(model_router.ROUTES, "t", Route("quality", 0.3))
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        interactiveAgent._completion("t", model="quality-model", messages=MESSAGES)
+    assert time.monotonic() - started < 1.5
+
+
+def test_fallback_reply_is_not_cached_under_the_primary_model(server, monkeypatch):
+    monkeypatch.setitem(model_router.ROUTES, "t", Route("quality", 0.3, fallback="fast"))
+    request = dict(model="quality-model", temperature=0.2, messages=MESSAGES)
+    routes = []
+    with model_router.record_routes(routes):
+        interactiveAgent._cached_completion("t", **request)
+        interactiveAgent._cached_completion("t", **request)
+    assert [r["model"] for r in routes] == ["fast-model", "fast-model"]
+    assert response_cache.get_response_cache().get(response_cache.make_cache_key(**request)) is None
+
+    # Once the primary tier answers in time, its reply is cached as before
+    server.model_latency = {}
+    interactiveAgent._cached_completion("t", **request)
+    assert response_cache.get_response_cache().get(response_cache.make_cache_key(**request)) is not None
@@ -0,0 +1,29 @@
+import pytest
+
+from feedback_app.problem_bank import STUDY_TASKS, get_problem_bank, parse_query
+
+
+@pytest.fixture(scope="module")
+def bank():
+    return get_problem_bank()
+
+
+def test_study_tasks_carry_their_curated_difficulty(bank):
+    for problem_id, difficulty in STUDY_TASKS:
+        assert bank.get(problem_id).difficulty == difficulty
+    assert {p.id for p in bank.query(difficulty="Hard")} == {"12342"}
+
+
+def test_search_finds_the_study_task(bank):
+    assert [p.id for p in bank.search("week 10 counting, hard")] == ["12342"]
+
+
+def test_length_tier_is_separate_from_difficulty(bank):
+    assert parse_query("long counting") == {"length_tier": "long", "topic": "counting"}
+    tiers = {p.length_tier for p in bank.problems if p.solution}
+    assert tiers == {"short", "medium", "long"}
+
+
+def test_composite_query_intersects_every_criterion(bank):
+    results = bank.query(week=[10, 11], topic="counting")
+    assert results and all(p.week in (10, 11) and "counting" in p.topics for p in results)
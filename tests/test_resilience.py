@@ -0,0 +1,170 @@
+import time
+
+import pytest
+
+from feedback_app import interactiveAgent, llm_client, model_router, resilience
+from feedback_app.fakes import FakeChatServer
+from feedback_app.llm_client import LLMConfig
+from feedback_app.model_router import Route
+from feedback_app.resilience import CircuitBreaker, CircuitOpen, DeadlineExceeded, ModelUnavailable, Policy
+
+MESSAGES = [{"role": "user", "content": "What is 5 choose 3?"}]
+
+
+@pytest.fixture
+def server(monkeypatch):
+    # Fresh breakers and latency windows, so tests do not see each other's failures
+    monkeypatch.setattr(resilience, "_breakers", {})
+    monkeypatch.setattr(resilience, "_windows", {})
+    with FakeChatServer(reply_chars=60) as fake:
+        llm_client.configure(LLMConfig(api_key="test", base_url=fake.base_url))
+        yield fake
+    llm_client.configure()
+
+
+def policy(monkeypatch, call_site, **fields):
+    fields.setdefault("backoff_base_s", 0.01)
+    monkeypatch.setitem(resilience.POLICIES, call_site, Policy(**fields))
+
+
+def sender(**request):
+    def send(timeout):
+        return llm_client.chat_completion(max_retries=0, timeout=timeout, model="gpt-4o", messages=MESSAGES, **request)
+    return send
+
+
+def test_503_is_retried(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0)
+    server.inject({"status": 503}, {"status": 503})
+    result = resilience.call("t", "gpt-4o", sender())
+    assert result.choices[0].message.content.startswith("Fake tutor reply")
+    assert server.requests == 3
+    assert resilience.get_breaker("gpt-4o").state == "closed"
+
+
+def test_retry_after_is_honoured(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0)
+    server.inject({"status": 429, "retry_after": 0.5})
+    started = time.monotonic()
+    resilience.call("t", "gpt-4o", sender())
+    assert time.monotonic() - started >= 0.5
+    assert server.requests == 2
+
+
+def test_dropped_connection_is_retried(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0)
+    server.inject({"drop": True})
+    resilience.call("t", "gpt-4o", sender())
+    assert server.requests == 2
+
+
+def test_retries_stop_at_max_attempts(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0, max_attempts=2)
+    server.inject({"status": 503}, {"status": 503}, {"status": 503})
+    with pytest.raises(ModelUnavailable) as raised:
+        resilience.call("t", "gpt-4o", sender())
+    assert server.requests == 2
+    assert str(raised.value) == resilience.FRIENDLY_MESSAGE
+
+
+def test_deadline_covers_retries(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=0.5)
+    server.inject({"delay": 2.0})
+    started = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        resilience.call("t", "gpt-4o", sender())
+    assert time.monotonic() - started < 1.5
+
+
+def test_client_errors_are_not_retried(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0)
+    server.inject({"status": 400})
+    with pytest.raises(ModelUnavailable):
+        resilience.call("t", "gpt-4o", sender())
+    assert server.requests == 1
+    assert resilience.get_breaker("gpt-4o").failures == 0
+
+
+def test_bugs_in_send_are_not_hidden(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0)
+
+    def broken(timeout):
+        raise KeyError("choices")
+
+    with pytest.raises(KeyError):
+        resilience.call("t", "gpt-4o", broken)
+    assert resilience.get_breaker("gpt-4o").state == "closed"
+
+
+def test_slow_attempt_is_hedged(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0, hedge=True, hedge_min_delay_s=0.2)
+    window = resilience.get_window("t", "gpt-4o")
+    for _ in range(resilience.MIN_SAMPLES):
+        window.add(0.01)
+    server.inject({"delay": 3.0})
+    started = time.monotonic()
+    result = resilience.call("t", "gpt-4o", sender())
+    assert result.choices[0].message.content
+    assert time.monotonic() - started < 1.5
+    assert server.requests == 2
+
+
+def test_breaker_opens_and_recovers_through_a_trial(server, monkeypatch):
+    policy(monkeypatch, "t", deadline_s=5.0, max_attempts=2)
+    breaker = resilience._breakers["gpt-4o"] = CircuitBreaker(threshold=2, cooldown=0.3)
+    server.inject(*[{"status": 503}] * 2)
+    with pytest.raises(ModelUnavailable):
+        resilience.call("t", "gpt-4o", sender())
+    assert breaker.state == "open"
+
+    # Open: fails fast without sending anything
+    with pytest.raises(CircuitOpen):
+        resilience.call("t", "gpt-4o", sender())
+    assert server.requests == 2
+
+    # After the cooldown one trial goes through; a failing trial opens it again
+    time.sleep(0.35)
+    server.inject({"status": 503})
+    with pytest.raises(CircuitOpen):
+        resilience.call("t", "gpt-4o", sender())
+    assert server.requests == 3
+    assert breaker.state == "open"
+
+    time.sleep(0.35)
+    resilience.call("t", "gpt-4o", sender())
+    assert breaker.state == "closed"
+
+
+@pytest.fixture
+def slow_quality_tier(server, monkeypatch):
+    monkeypatch.setitem(model_router.TIERS, "quality", "quality-model")
+    monkeypatch.setitem(model_router.TIERS, "fast", "fast-model")
+    monkeypatch.setitem(model_router.ROUTES, "t", Route("quality", 0.3, fallback="fast"))
+    policy(monkeypatch, "t", deadline_s=5.0, max_attempts=1)
+    server.model_latency = {"quality-model": 2.0}
+    return server
+
+
+def test_missed_deadline_falls_back_to_the_next_tier(slow_quality_tier):
+    routes = []
+    started = time.monotonic()
+    with model_router.record_routes(routes):
+        text = interactiveAgent._completion("t", model="quality-model", messages=MESSAGES)
+    assert text.startswith("Fake tutor reply")
+    assert time.monotonic() - started < 1.5
+    assert routes == [{"call_site": "t", "tier": "fast", "model": "fast-model", "fell_back": True,
+                       "missed": ["quality-model"]}]
+
+
+def test_streamed_call_falls_back_on_a_slow_first_token(slow_quality_tier):
+    routes = []
+    with model_router.record_routes(routes):
+        text = "".join(interactiveAgent._completion("t", stream=True, model="quality-model", messages=MESSAGES))
+    assert text.startswith("Fake tutor reply")
+    assert routes[0]["model"] == "fast-model"
+
+
+def test_last_tier_failure_reaches_the_caller(slow_quality_tier):
+    slow_quality_tier.inject({"status": 503, "model": "fast-model"})
+    with pytest.raises(ModelUnavailable):
+        interactiveAgent._completion("t", model="quality-model", messages=MESSAGES)
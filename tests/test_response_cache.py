@@ -0,0 +1,47 @@
+import time
+
+from feedback_app.response_cache import ResponseCache, make_cache_key, normalize_student_text
+
+
+def test_memory_and_disk_tiers(tmp_path):
+    path = str(tmp_path / "responses.sqlite")
+    cache = ResponseCache(path)
+    cache.set("k", "feedback")
+    assert cache.get("k") == "feedback"
+    assert cache.stats["memory_hits"] == 1
+    # A new process finds it on disk
+    other = ResponseCache(path)
+    assert other.get("k") == "feedback"
+    assert other.stats["disk_hits"] == 1
+
+
+def test_memory_entries_expire(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), ttl_seconds=0.2)
+    cache.set("k", "feedback")
+    assert cache.get("k") == "feedback"
+    time.sleep(0.25)
+    assert cache.get("k") is None
+    assert cache.stats["misses"] == 1
+
+
+def test_size_bound_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"), max_disk_bytes=250)
+    for key in "abc":
+        cache.set(key, key * 100)
+    assert cache._disk_bytes <= 250
+    reopened = ResponseCache(str(tmp_path / "responses.sqlite"))
+    assert reopened.get("a") is None
+    assert reopened.get("c") == "c" * 100
+
+
+def test_replacing_an_entry_keeps_the_running_total(tmp_path):
+    cache = ResponseCache(str(tmp_path / "responses.sqlite"))
+    cache.set("k", "x" * 100)
+    cache.set("k", "x" * 40)
+    assert cache._disk_bytes == 40
+
+
+def test_keys_ignore_whitespace_only_differences():
+    first = make_cache_key(model="m", messages=[normalize_student_text("5 choose 3  =  10\r\n\n\n\nok ")])
+    second = make_cache_key(model="m", messages=[normalize_student_text("5 choose 3 = 10\n\nok")])
+    assert first == second
@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from feedback_app.fakes import FakeRedisServer
+from feedback_app.session_store import (
+    RESUME_KEY,
+    VERSION_KEY,
+    MemoryBackend,
+    RedisBackend,
+    SessionStore,
+    SQLiteBackend,
+    VersionConflict,
+    dumps,
+    loads,
+    new_resume_token,
+)
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        yield MemoryBackend()
+    elif request.param == "sqlite":
+        yield SQLiteBackend(str(tmp_path / "sessions.sqlite"))
+    else:
+        with FakeRedisServer() as server:
+            yield RedisBackend(server.url)
+
+
+def participant(**state):
+    return dict({"student_id": "user_1", RESUME_KEY: new_resume_token(), "task_index": 1, "mode": "chat"}, **state)
+
+
+def test_serialization_round_trips_and_compresses_long_state():
+    short = {"mode": "chat"}
+    long = {"transcript": [{"role": "user", "content": "I think it is 5 choose 3. " * 10}] * 20}
+    assert loads(dumps(short)) == short
+    assert loads(dumps(long)) == long
+    assert dumps(long)[:1] == b"z"
+    assert len(dumps(long)) < len(json.dumps(long)) / 3
+
+
+def test_restore_puts_a_participant_back_where_they_were(backend):
+    store = SessionStore(backend)
+    state = participant(transcript=[{"role": "assistant", "content": "Hi"}], _widget="not persisted")
+    assert store.sync(state)
+    resumed = {}
+    assert store.restore(resumed, state[RESUME_KEY])
+    assert resumed["student_id"] == "user_1"
+    assert resumed["transcript"] == state["transcript"]
+    assert "_widget" not in resumed
+    assert resumed[VERSION_KEY] == 1
+
+
+def test_unchanged_state_is_not_saved_again(backend):
+    store = SessionStore(backend)
+    state = participant()
+    assert store.sync(state)
+    assert not store.sync(state)
+    state["task_index"] = 2
+    assert store.sync(state)
+    assert state[VERSION_KEY] == 2
+
+
+def test_student_id_does_not_open_a_session(backend):
+    store = SessionStore(backend)
+    state = participant()
+    store.sync(state)
+    assert not store.restore({}, "user_1")
+    assert not store.restore({}, new_resume_token())
+
+
+def test_stale_save_is_rejected_and_newer_state_wins(backend):
+    store = SessionStore(backend)
+    first_tab = participant()
+    store.sync(first_tab)
+    second_tab = {}
+    store.restore(second_tab, first_tab[RESUME_KEY])
+
+    second_tab["task_index"] = 2
+    store.sync(second_tab)
+    first_tab["mode"] = "followup"
+    with pytest.raises(VersionConflict):
+        store.sync(first_tab)
+    # The conflicting tab now holds the stored state and saves from there
+    assert first_tab["task_index"] == 2 and first_tab["mode"] == "chat"
+    first_tab["mode"] = "followup"
+    assert store.sync(first_tab)
+
+
+def test_redis_watch_detects_a_concurrent_write():
+    with FakeRedisServer() as server:
+        backend = RedisBackend(server.url)
+        other = RedisBackend(server.url)
+        backend.save("t", b"j{}", 0)
+        original_call = backend._call
+
+        def racing_call(*args):
+            if args[0] == "MULTI":
+                # Another worker saves between our version check and EXEC
+                other.save("t", b"j{}", 1)
+            return original_call(*args)
+
+        backend._call = racing_call
+        with pytest.raises(VersionConflict):
+            backend.save("t", b"j{}", 1)
+        assert backend.load("t")[0] == 2
+
+
+@pytest.mark.parametrize("failing", [b"HGET", b"EXPIRE", b"EXEC"])
+def test_redis_error_reply_does_not_leave_the_connection_in_a_transaction(failing):
+    with FakeRedisServer() as server:
+        backend = RedisBackend(server.url)
+        backend.save("t", b"j{}", 0)
+        server.fail_commands.add(failing)
+        with pytest.raises(RuntimeError):
+            backend.save("t", b"j{}", 1)
+        server.fail_commands.clear()
+        # Nothing was written, and the same backend saves normally afterwards
+        assert backend.load("t") == (1, b"j{}")
+        assert backend.save("t", b'j{"mode":"chat"}', 1) == 2
+        assert backend.load("t") == (2, b'j{"mode":"chat"}')
@@ -0,0 +1,142 @@
+import threading
+
+import pytest
+
+from feedback_app.fakes import FakeAPIError, FakeWorksheet
+from feedback_app.sheets import SheetWriter
+
+
+def writer_for(worksheet, **options):
+    sleeps = []
+    writer = SheetWriter(lambda: worksheet, sleep=sleeps.append, **options)
+    return writer, sleeps
+
+
+def write(writer, batch):
+    for data in batch:
+        writer.append(data)
+    return writer.flush()
+
+
+def test_first_write_adds_the_header_in_the_same_call():
+    ws = FakeWorksheet()
+    writer, _ = writer_for(ws)
+    write(writer, [{"student_id": "a", "score": 1}, {"student_id": "b", "score": 2}])
+    assert ws.rows == [["student_id", "score"], ["a", 1], ["b", 2]]
+    assert ws.calls == ["row_values", "append_rows"]
+
+
+def test_values_follow_the_header_not_the_key_order():
+    ws = FakeWorksheet(rows=[["student_id", "x"]])
+    writer, _ = writer_for(ws)
+    write(writer, [{"x": 5, "student_id": "e"}, {"student_id": "f"}])
+    assert ws.rows[1:] == [["e", 5], ["f", ""]]
+
+
+def test_new_keys_extend_the_header():
+    ws = FakeWorksheet(rows=[["student_id", "task_1_score"], ["a", 3]])
+    writer, _ = writer_for(ws)
+    write(writer, [{"student_id": "b", "task_2_score": 4, "task_1_score": 1}])
+    assert ws.rows[0] == ["student_id", "task_1_score", "task_2_score"]
+    assert ws.rows[2] == ["b", 1, 4]
+
+
+def test_header_extension_keeps_columns_added_by_other_processes():
+    ws = FakeWorksheet(rows=[["student_id"]])
+    first, _ = writer_for(ws)
+    second, _ = writer_for(ws)
+    write(first, [{"student_id": "a"}])
+    write(second, [{"student_id": "b", "y": 2}])
+    # first still caches ["student_id"]; it must not write "x" over second's "y"
+    write(first, [{"student_id": "c", "x": 1}])
+    assert ws.rows[0] == ["student_id", "y", "x"]
+    assert ws.rows[-1] == ["c", "", 1]
+
+
+def test_header_update_lost_to_another_process_is_retried():
+    ws = FakeWorksheet(rows=[["student_id"]])
+    writer, _ = writer_for(ws)
+    write(writer, [{"student_id": "a"}])
+    update = ws.batch_update
+
+    def overwritten(data, **kwargs):
+        # Another process read the same row 1 and wrote the same cell just after us
+        update(data, **kwargs)
+        ws.batch_update = update
+        update([{"range": "B1", "values": [["y"]]}])
+
+    ws.batch_update = overwritten
+    write(writer, [{"student_id": "b", "x": 1}])
+    assert ws.rows[0] == ["student_id", "y", "x"]
+    assert ws.rows[-1] == ["b", "", 1]
+
+
+def test_header_is_read_once_per_process():
+    ws = FakeWorksheet(rows=[["student_id"]])
+    writer, _ = writer_for(ws)
+    write(writer, [{"student_id": "a"}])
+    write(writer, [{"student_id": "b"}])
+    assert ws.calls.count("row_values") == 1
+
+
+def test_append_batches_until_flush():
+    ws = FakeWorksheet(rows=[["student_id"]])
+    writer, _ = writer_for(ws, batch_size=3)
+    writer.append({"student_id": "a"})
+    writer.append({"student_id": "b"})
+    assert ws.calls == []
+    writer.append({"student_id": "c"})
+    assert ws.calls == ["row_values", "append_rows"]
+    writer.append({"student_id": "d"})
+    assert writer.flush() == 1
+    assert [r[0] for r in ws.rows[1:]] == ["a", "b", "c", "d"]
+
+
+def test_concurrent_appends_are_all_written_once():
+    ws = FakeWorksheet(rows=[["student_id"]])
+    writer, _ = writer_for(ws, batch_size=5)
+    threads = [threading.Thread(target=writer.append, args=({"student_id": str(i)},)) for i in range(50)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    writer.flush()
+    assert sorted(int(r[0]) for r in ws.rows[1:]) == list(range(50))
+
+
+def test_quota_errors_back_off_exponentially():
+    ws = FakeWorksheet(rows=[["student_id"]], fail_next=3, fail_status=429)
+    writer, sleeps = writer_for(ws, base_delay=1.0, max_delay=32.0)
+    write(writer, [{"student_id": "a"}])
+    assert ws.rows[1] == ["a"]
+    assert len(sleeps) == 3
+    # Jittered into [delay / 2, delay] around 1, 2 and 4 seconds
+    for attempt, slept in enumerate(sleeps):
+        assert 2 ** attempt / 2 <= slept <= 2 ** attempt
+
+
+def test_backoff_gives_up_after_max_retries():
+    ws = FakeWorksheet(rows=[["student_id"]], fail_next=10, fail_status=503)
+    writer, sleeps = writer_for(ws, max_retries=2)
+    with pytest.raises(FakeAPIError):
+        write(writer, [{"student_id": "a"}])
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_not_retried():
+    ws = FakeWorksheet(rows=[["student_id"]], fail_next=1, fail_status=403)
+    writer, sleeps = writer_for(ws)
+    with pytest.raises(FakeAPIError):
+        write(writer, [{"student_id": "a"}])
+    assert sleeps == []
+
+
+def test_failed_flush_keeps_the_rows_queued():
+    ws = FakeWorksheet(rows=[["student_id"]])
+    writer, _ = writer_for(ws, max_retries=0)
+    writer.append({"student_id": "a"})
+    ws.fail_next = 1
+    with pytest.raises(FakeAPIError):
+        writer.flush()
+    assert writer.flush() == 1
+    assert ws.rows[1:] == [["a"]]
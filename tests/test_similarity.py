@@ -0,0 +1,72 @@
+import dataclasses
+import time
+
+import numpy as np
+import pytest
+
+from feedback_app import similarity
+from feedback_app.problem_bank import ProblemBank, get_problem_bank
+from feedback_app.similarity import SimilarityIndex, get_similarity_index, load_index
+
+
+@pytest.fixture(scope="module")
+def bank():
+    return get_problem_bank()
+
+
+@pytest.fixture(autouse=True)
+def fresh_process_index(monkeypatch):
+    monkeypatch.setattr(similarity, "_index", None)
+    monkeypatch.setattr(similarity, "_index_bank", None)
+
+
+def test_neighbours_exclude_the_problem_and_are_ranked(bank):
+    index = SimilarityIndex.build(bank.problems)
+    results = index.similar("10896", k=5)
+    assert len(results) == 5
+    assert "10896" not in [pid for pid, _ in results]
+    scores = [score for _, score in results]
+    assert scores == sorted(scores, reverse=True)
+    # The other poker-hand exercise is the closest match
+    assert results[0][0] == "77947"
+
+
+def test_filter_is_applied(bank):
+    index = SimilarityIndex.build(bank.problems)
+    with_solution = lambda pid: bool(bank.get(pid).solution)
+    assert all(with_solution(pid) for pid, _ in index.similar("10896", k=10, where=with_solution))
+
+
+def test_saved_index_is_memory_mapped_and_extended_in_place(bank, tmp_path):
+    prefix = str(tmp_path / "similarity")
+    index = SimilarityIndex.build(bank.problems[:30]).save(prefix)
+    assert isinstance(index.matrix, np.memmap)
+    extended = index.add(bank.problems)
+    assert len(extended) == len(bank)
+    reloaded = load_index(prefix)
+    assert reloaded.ids == [p.id for p in bank.problems]
+    np.testing.assert_array_equal(reloaded.matrix[:30], index.matrix)
+
+
+def test_query_is_fast(bank):
+    index = SimilarityIndex.build(bank.problems)
+    started = time.perf_counter()
+    for _ in range(100):
+        index.similar("71233", k=5)
+    assert (time.perf_counter() - started) / 100 < 0.005
+
+
+def test_stale_saved_index_is_not_used(bank, tmp_path):
+    prefix = str(tmp_path / "similarity")
+    removed = dataclasses.replace(bank.problems[0], id="999999999")
+    SimilarityIndex.build([removed] + bank.problems[1:]).save(prefix)
+    index = get_similarity_index(bank, prefix)
+    assert "999999999" not in index
+    assert set(index.ids) == {p.id for p in bank.problems}
+
+
+def test_index_follows_a_rebuilt_bank(bank, tmp_path):
+    prefix = str(tmp_path / "similarity")
+    assert len(get_similarity_index(bank, prefix)) == len(bank)
+    smaller = ProblemBank(bank.problems[:10])
+    assert len(get_similarity_index(smaller, prefix)) == 10
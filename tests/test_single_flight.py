@@ -0,0 +1,82 @@
+import threading
+import time
+
+import pytest
+
+from feedback_app.single_flight import Flight, SingleFlight, fingerprint
+
+
+def test_fingerprint_depends_on_call_site_and_parts():
+    assert fingerprint("tutoring_turn", 0, "hi") == fingerprint("tutoring_turn", 0, "hi")
+    assert fingerprint("tutoring_turn", 0, "hi") != fingerprint("followup_grading", 0, "hi")
+    assert fingerprint("tutoring_turn", 0, "hi") != fingerprint("tutoring_turn", 1, "hi")
+
+
+def test_joiners_replay_and_follow_the_same_stream():
+    release = threading.Event()
+
+    def produce():
+        yield "a"
+        release.wait()
+        yield "b"
+
+    flights = SingleFlight()
+    starts = []
+    first = flights.join("k", lambda: starts.append(1) or Flight(produce))
+    second = flights.join("k", lambda: starts.append(1) or Flight(produce))
+    assert first is second and len(starts) == 1
+    release.set()
+    assert first.result() == second.result() == "ab"
+    # Finished successfully: reused
+    assert flights.join("k", lambda: pytest.fail("should reuse")) is first
+
+
+def test_failed_call_is_replaced():
+    def fail():
+        raise RuntimeError("down")
+
+    flights = SingleFlight()
+    failed = flights.join("k", lambda: Flight(fail))
+    with pytest.raises(RuntimeError):
+        failed.result()
+    retry = flights.join("k", lambda: Flight(lambda: "ok"))
+    assert retry is not failed and retry.result() == "ok"
+
+
+def test_slow_start_does_not_block_other_keys():
+    flights = SingleFlight()
+    started = threading.Event()
+
+    def slow_start():
+        started.set()
+        time.sleep(0.5)
+        return Flight(lambda: "slow")
+
+    worker = threading.Thread(target=flights.join, args=("slow", slow_start))
+    worker.start()
+    started.wait()
+    began = time.monotonic()
+    assert flights.join("fast", lambda: Flight(lambda: "fast")).result() == "fast"
+    assert time.monotonic() - began < 0.2
+    # A joiner of the same key waits for the starter's call instead of starting another
+    assert flights.join("slow", lambda: pytest.fail("should join")).result() == "slow"
+    worker.join()
+
+
+def test_start_error_reaches_the_caller_and_frees_the_key():
+    flights = SingleFlight()
+
+    def broken():
+        raise LookupError("queue full")
+
+    with pytest.raises(LookupError):
+        flights.join("k", broken)
+    assert flights.join("k", lambda: Flight(lambda: "ok")).result() == "ok"
+
+
+def test_registry_is_bounded():
+    flights = SingleFlight(max_calls=3)
+    for i in range(10):
+        flights.join(i, lambda: Flight(lambda: "x")).result()
+    flights.join("last", lambda: Flight(lambda: "x"))
+    assert len(flights) <= 4
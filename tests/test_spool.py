@@ -0,0 +1,64 @@
+import threading
+
+import pytest
+
+from feedback_app.fakes import FakeAPIError, FakeWorksheet
+from feedback_app.sheets import SheetWriter
+from feedback_app.spool import SessionSpool, SpoolReplayer
+
+
+def make(tmp_path, ws=None):
+    ws = ws if ws is not None else FakeWorksheet()
+    writer = SheetWriter(lambda: ws, sleep=lambda s: None)
+    return ws, writer, SessionSpool(str(tmp_path / "sessions.sqlite"))
+
+
+def test_replay_sends_each_record_once(tmp_path):
+    ws, writer, spool = make(tmp_path)
+    spool.put({"student_id": "a", "x": 1})
+    spool.put({"student_id": "a", "x": 2})     # a resubmission replaces the unsent record
+    replayer = SpoolReplayer(spool, lambda: writer)
+    assert replayer.drain_once() == 1
+    assert replayer.drain_once() == 0
+    assert ws.rows == [["student_id", "x"], ["a", 2]]
+    assert spool.pending_count() == 0
+
+
+def test_replayers_in_several_processes_do_not_duplicate_rows(tmp_path):
+    ws, writer, spool = make(tmp_path)
+    for i in range(100):
+        spool.put({"student_id": f"s{i}"})
+    # Separate connections to one file, as separate worker processes would have
+    replayers = [SpoolReplayer(SessionSpool(str(tmp_path / "sessions.sqlite")), lambda: writer) for _ in range(3)]
+    threads = [threading.Thread(target=lambda r=r: [r.drain_once() for _ in range(5)]) for r in replayers]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    ids = [row[0] for row in ws.rows[1:]]
+    assert sorted(ids) == sorted(f"s{i}" for i in range(100))
+    assert spool.pending_count() == 0
+
+
+def test_abandoned_claim_is_taken_over_without_resending(tmp_path):
+    ws, writer, spool = make(tmp_path, FakeWorksheet(rows=[["student_id"]]))
+    spool.put({"student_id": "a"})
+    # A process claimed the row, appended it to the sheet, then died before marking it sent
+    assert spool.claim("dead-process")
+    ws.rows.append(["a"])
+    replayer = SpoolReplayer(spool, lambda: writer)
+    replayer._sent_ids = set()
+    assert spool.claim(replayer.owner) == []
+    assert spool.claim(replayer.owner, lease=0) == [("a", {"student_id": "a"}, True)]
+    assert replayer.drain_once() == 1
+    assert ws.rows == [["student_id"], ["a"]]
+
+
+def test_failed_send_releases_the_claim(tmp_path):
+    ws, writer, spool = make(tmp_path, FakeWorksheet(rows=[["student_id"]], fail_next=1, fail_status=403))
+    spool.put({"student_id": "a"})
+    replayer = SpoolReplayer(spool, lambda: writer)
+    with pytest.raises(FakeAPIError):
+        replayer.drain_once()
+    assert replayer.drain_once() == 1
+    assert ws.rows == [["student_id"], ["a"]]